@@ -27,6 +27,9 @@ a = Analysis(
         'reportlab.pdfbase',
         'reportlab.pdfbase.ttfonts',
         'reportlab.pdfbase.pdfmetrics',
+        'PIL',
+        'PIL.Image',
+        'PIL.ImageOps',
     ],
     hookspath=[],
     hooksconfig={},
@@ -48,7 +51,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,         # one-file build unpacks on every launch; UPX adds decompression on top
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -0,0 +1,517 @@
+"""
+Benchmarks for Invoice Manager.
+
+    python benchmark.py pdf --invoices 200 --workers 1,2,4,8
+    python benchmark.py render --lines 1,8,40
+    python benchmark.py import --invoices 100000
+    python benchmark.py startup --runs 5 [--exe dist/InvoiceManager.exe]
+    python benchmark.py generate --invoices 100000 --db data/invoices.db
+    python benchmark.py api --sizes 10000,100000 --repeat 20
+    python benchmark.py server --clients 8 --seconds 10
+    python benchmark.py backup --invoices 100000 --codecs gzip,zstd
+
+Results are printed as a table; pass --json FILE to keep them for comparison.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import main
+
+PURPOSES = ["BOL", "Best4Juniors", "Other"]
+PRODUCTS = ["Houten puzzel", "Kleurboek", "Knuffel konijn", "Speelkleed", "Bouwblokken set",
+            "Prentenboek", "Loopfiets", "Badspeelgoed", "Muziekdoos", "Rammelaar"]
+CITIES = ["Amsterdam", "Rotterdam", "Utrecht", "Weert", "Bergen op Zoom", "Eindhoven",
+          "Groningen", "Zwolle", "Breda", "Leiden"]
+SETTINGS = {"company_name": "Benchmark BV", "address": "Hoolstraat 21", "postal": "6006 SL",
+            "city": "Weert", "email": "support@example.nl", "kvk": "91427541",
+            "btw_number": "NL865654360B01", "btw_pct": "21"}
+
+
+def make_invoice(rng, n, start=datetime(2019, 1, 1), days=6 * 365):
+    """Deterministic, realistic-looking invoice dict in the save_invoice() shape."""
+    when = start + timedelta(days=rng.randrange(days), minutes=rng.randrange(24 * 60))
+    items = [{"productnaam": rng.choice(PRODUCTS), "aantal": rng.randint(1, 5),
+              "prijs": round(rng.uniform(2, 120), 2)} for _ in range(rng.choice([1, 1, 2, 3, 5, 8]))]
+    return {
+        "id": f"bench-{n:08d}", "factuurnummer": f"BENCH-{n:08d}",
+        "date": when.strftime("%Y-%m-%d %H:%M"),
+        "due_date": (when + timedelta(days=14)).strftime("%Y-%m-%d"),
+        "purpose": rng.choice(PURPOSES), "bestelnummer": f"C{rng.randrange(10**8):08d}",
+        "customer_company": rng.choice(["", "", "Stichting Klaver6", "Kinderopvang Zon", "Speelgoed BV"]),
+        "customer_name": f"Klant {rng.randrange(5000)}", "customer_address": "Dorpsstraat 1",
+        "customer_postal": "1234 AB", "customer_city": rng.choice(CITIES),
+        "customer_country": "Netherlands", "customer_email": f"klant{n}@example.nl",
+        "items": items, "btw_pct": rng.choice([21, 21, 21, 9]), "notes": "",
+        "created_at": when.isoformat(),
+    }
+
+
+def with_totals(inv):
+    """Add the totals save_invoice() would store, for rendering without a DB."""
+    totaal = round(sum(i["prijs"] * i["aantal"] for i in inv["items"]), 2)
+    sub = round(totaal / (1 + inv["btw_pct"] / 100), 2)
+    return dict(inv, totaal=totaal, subtotaal=sub, btw_amount=round(totaal - sub, 2))
+
+
+def bench_pdf(args):
+    rng = random.Random(args.seed)
+    invoices = [with_totals(make_invoice(rng, n)) for n in range(args.invoices)]
+    rows, base = [], None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        t0 = time.perf_counter()
+        failed = sum(1 for _, pdf, _ in main.iter_pdf_renders(invoices, SETTINGS, None, workers) if pdf is None)
+        elapsed = time.perf_counter() - t0
+        rate = len(invoices) / elapsed
+        base = base or rate
+        rows.append({"workers": workers, "seconds": round(elapsed, 3),
+                     "invoices_per_s": round(rate, 1), "speedup": round(rate / base, 2),
+                     "failed": failed})
+        print(f"workers={workers:<3} {elapsed:8.2f}s  {rate:8.1f} inv/s  x{rate / base:.2f}")
+    return {"invoices": args.invoices, "cpu_count": os.cpu_count(), "runs": rows}
+
+
+def bench_render(args):
+    """Single-process render time per invoice by line count (PDF and HTML), and the same invoices as one statement."""
+    import io
+    rng = random.Random(args.seed)
+    renderer = main.pdf_renderer(SETTINGS)
+    rows = []
+    for lines in [int(n) for n in args.lines.split(",")]:
+        invoices = []
+        for n in range(args.invoices):
+            inv = make_invoice(rng, n)
+            inv["items"] = [{"productnaam": rng.choice(PRODUCTS), "aantal": rng.randint(1, 5),
+                             "prijs": round(rng.uniform(2, 120), 2)} for _ in range(lines)]
+            invoices.append(with_totals(inv))
+        renderer.render(invoices[0], io.BytesIO())    # warm-up
+        t0 = time.perf_counter()
+        for inv in invoices:
+            renderer.render(inv, io.BytesIO())
+        single = (time.perf_counter() - t0) / len(invoices)
+        t0 = time.perf_counter()
+        renderer.render_statement(invoices, io.BytesIO(), "Benchmark")
+        statement = (time.perf_counter() - t0) / len(invoices)
+        t0 = time.perf_counter()
+        for inv in invoices:
+            main.build_invoice_html(inv, SETTINGS)
+        html = (time.perf_counter() - t0) / len(invoices)
+        rows.append({"lines": lines, "ms_per_invoice": round(single * 1000, 2),
+                     "statement_ms_per_invoice": round(statement * 1000, 2),
+                     "html_ms_per_invoice": round(html * 1000, 3)})
+        print(f"lines={lines:<4} {single * 1000:8.2f} ms/invoice   statement {statement * 1000:8.2f} ms/invoice"
+              f"   html {html * 1000:6.3f} ms/invoice")
+    return {"invoices": args.invoices, "runs": rows}
+
+
+def bench_import(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "invoices.jsonl"
+        with open(src, "w", encoding="utf-8") as f:
+            for n in range(args.invoices):
+                f.write(json.dumps(make_invoice(rng, n)) + "\n")
+        main.DB_PATH = Path(tmp) / "bench.db"
+        main.init_db()
+        try:
+            t0 = time.perf_counter()
+            res = main.import_invoices(src, batch=args.batch)
+            elapsed = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            again = main.import_invoices(src, batch=args.batch)
+            rerun = time.perf_counter() - t0
+        finally:
+            main.close_db()
+    rate = args.invoices / elapsed
+    print(f"imported={res['imported']} {elapsed:8.2f}s  {rate:8.0f} inv/s  "
+          f"re-run (all skipped)={again['skipped']} {rerun:6.2f}s")
+    return {"invoices": args.invoices, "batch": args.batch, "seconds": round(elapsed, 3),
+            "invoices_per_s": round(rate), "rerun_seconds": round(rerun, 3)}
+
+
+def bench_startup(args):
+    """Launch the app until the UI reports itself usable (see main.STARTUP_PROBE)."""
+    cmd = [args.exe] if args.exe else [sys.executable, str(Path(main.__file__).resolve())]
+    runs = []
+    for n in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            probe = Path(tmp) / "startup.json"
+            env = dict(os.environ, INVOICE_STARTUP_PROBE=str(probe))
+            t0 = time.time()
+            subprocess.run(cmd, env=env, timeout=args.timeout)
+            exited = time.time() - t0
+            marks = json.loads(probe.read_text(encoding="utf-8")) if probe.exists() else {}
+        run = {k: round(v - t0, 3) for k, v in sorted(marks.items(), key=lambda kv: kv[1])}
+        run["exit"] = round(exited, 3)
+        runs.append(run)
+        print(f"run {n + 1}: " + "  ".join(f"{k}={v:.3f}s" for k, v in run.items()))
+    ready = [r["interactive"] for r in runs if "interactive" in r]
+    if ready:
+        print(f"time to interactive: median {statistics.median(ready):.3f}s  "
+              f"min {min(ready):.3f}s  max {max(ready):.3f}s")
+    return {"command": cmd, "frozen": bool(args.exe), "runs": runs,
+            "interactive_median_s": round(statistics.median(ready), 3) if ready else None}
+
+
+def generate_db(path, invoices, seed=42, progress=None):
+    """Replace the database at `path` with `invoices` deterministic invoices and point main at it."""
+    path = Path(path)
+    main.close_db()
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    main.DB_PATH = path
+    main.init_db()
+    rng = random.Random(seed)
+    res = main.import_records(((n, make_invoice(rng, n)) for n in range(invoices)), progress=progress)
+    with main.db_transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", SETTINGS.items())
+    main._assets.invalidate()
+    return res
+
+
+def bench_generate(args):
+    t0 = time.perf_counter()
+    res = generate_db(args.db, args.invoices, args.seed,
+                      lambda n: print(f"\r{n} invoices", end="", file=sys.stderr, flush=True))
+    elapsed = time.perf_counter() - t0
+    main.close_db()
+    print(f"\n{res['imported']} invoices in {elapsed:.1f}s -> {args.db}")
+    return {"invoices": args.invoices, "db": str(args.db), "seconds": round(elapsed, 3)}
+
+
+def percentiles(samples):
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return {"n": len(s), "p50_ms": round(pick(0.5) * 1000, 3), "p90_ms": round(pick(0.9) * 1000, 3),
+            "p99_ms": round(pick(0.99) * 1000, 3), "max_ms": round(s[-1] * 1000, 3),
+            "mean_ms": round(sum(s) / len(s) * 1000, 3)}
+
+
+def api_cases(api, n, seed, tmp):
+    """(name, heavy, callable) for every benchmarked API method and renderer.
+
+    Heavy cases touch every invoice and run at most three times.
+    """
+    rng = random.Random(seed)
+    with main.get_db() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM invoices WHERE rowid % ? = 0 LIMIT 200",
+                                          (max(1, n // 200),))]
+        invoices = main.load_invoices(conn, ids[:50])
+    cursor = None
+    for _ in range(10):
+        cursor = api.list_invoices(None, cursor)["next_cursor"] or cursor
+    year = {"date_from": "2022-01-01", "date_to": "2022-12-31"}
+    settings = api.get_settings()
+    api.get_analytics()   # build the snapshot; cases below measure warm queries and refreshes
+    ids_cycle = iter(ids * 1000)
+    inv_cycle = iter(invoices * 1000)
+
+    def save_invoice():
+        data = make_invoice(rng, 10**8 + rng.randrange(10**8))
+        for key in ("id", "factuurnummer", "created_at"):
+            data.pop(key)
+        return api.save_invoice(dict(data, auto_number=True))["id"]
+
+    def analytics_after_save():
+        # save + delete + query: the incremental refresh path (compare with save_invoice)
+        api.delete_invoice(save_invoice())
+        return api.get_analytics("btw_pct")
+
+    def render_pdf():
+        import io
+        main.generate_pdf_reportlab(next(inv_cycle), settings, None, io.BytesIO())
+
+    cases = [
+        ("get_invoices", True, lambda: api.get_invoices()),
+        ("get_invoices_year", True, lambda: api.get_invoices(year)),
+        ("list_invoices", False, lambda: api.list_invoices()),
+        ("list_invoices_page10", False, lambda: api.list_invoices(None, cursor)),
+        ("search_invoices", False, lambda: api.search_invoices("klaver")),
+        ("get_invoice", False, lambda: api.get_invoice(next(ids_cycle))),
+        ("get_report", False, lambda: api.get_report()),
+        ("get_report_year", False, lambda: api.get_report(year)),
+        ("get_report_series", False, lambda: api.get_report_series(None, "month")),
+        ("get_product_sales", True, lambda: api.get_product_sales()),
+        ("analytics_top_customers", False, lambda: api.get_analytics("customer", None, "revenue", 10)),
+        ("analytics_city_year", False, lambda: api.get_analytics("city", year)),
+        ("analytics_month", False, lambda: api.get_analytics("month")),
+        ("analytics_refresh", False, analytics_after_save),
+        ("export_csv", True, lambda: main.export_invoices(None, "csv", True, Path(tmp) / "export.csv")),
+        ("save_invoice", False, save_invoice),
+        ("build_invoice_html", False, lambda: main.build_invoice_html(next(inv_cycle), settings, None)),
+    ]
+    try:
+        import reportlab  # noqa: F401
+        cases.append(("generate_pdf_reportlab", False, render_pdf))
+    except ImportError:
+        print("reportlab not installed: skipping generate_pdf_reportlab", file=sys.stderr)
+    return cases
+
+
+def bench_api(args):
+    api = main.API()
+    sizes = []
+    for n in [int(x) for x in args.sizes.split(",")]:
+        path = Path(args.data_dir) / f"bench_{n}_{args.seed}.db"
+        if args.regenerate or not path.exists():
+            t0 = time.perf_counter()
+            generate_db(path, n, args.seed)
+            print(f"generated {n} invoices in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        else:
+            main.close_db()
+            main.DB_PATH = path
+            main.init_db()
+        main._assets.invalidate()
+        ops = {}
+        db_bytes = sum(p.stat().st_size for p in path.parent.glob(path.name + "*"))   # incl. -wal
+        print(f"\n{n} invoices ({db_bytes / 2**20:.0f} MB)")
+        print(f"{'operation':<24}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KB':>10}")
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, heavy, fn in api_cases(api, n, args.seed, tmp):
+                if args.ops and name not in args.ops.split(","):
+                    continue
+                new_ids, samples = [], []
+                for _ in range(min(args.repeat, 3) if heavy else args.repeat):
+                    t0 = time.perf_counter()
+                    out = fn()
+                    samples.append(time.perf_counter() - t0)
+                    if name == "save_invoice":
+                        new_ids.append(out)
+                # peak Python heap in a separate, untimed run (tracemalloc slows code down)
+                tracemalloc.start()
+                out = fn()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                if name == "save_invoice":
+                    new_ids.append(out)
+                for inv_id in new_ids:   # keep the dataset identical between runs
+                    api.delete_invoice(inv_id)
+                ops[name] = dict(percentiles(samples), peak_kb=round(peak / 1024))
+                r = ops[name]
+                print(f"{name:<24}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+                      f"{r['max_ms']:>10.2f}{r['peak_kb']:>10}")
+        sizes.append({"invoices": n, "db_bytes": db_bytes, "ops": ops})
+    main.close_db()
+    return {"repeat": args.repeat, "sizes": sizes}
+
+
+def bench_server(args):
+    """Concurrent clients against `serve` in-process: a save_invoice/list_invoices mix over HTTP."""
+    import http.client
+    import threading
+    path = Path(args.data_dir) / f"bench_{args.invoices}_{args.seed}.db"
+    if args.regenerate or not path.exists():
+        generate_db(path, args.invoices, args.seed)
+    main.close_db()
+    main.DB_PATH = path
+    main.init_db()
+    server = main.make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    deadline = time.perf_counter() + args.seconds
+    samples = {"save_invoice": [], "list_invoices": []}
+    numbers, saved, errors = [], [], []
+
+    def client(k):
+        rng = random.Random(args.seed * 1000 + k)
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=30)
+        while time.perf_counter() < deadline:
+            if rng.random() < args.write_ratio:
+                data = make_invoice(rng, 10**8 + rng.randrange(10**8))
+                for key in ("id", "factuurnummer", "created_at"):
+                    data.pop(key)
+                name, params = "save_invoice", [dict(data, auto_number=True)]
+            else:
+                name, params = "list_invoices", []
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", f"/api/{name}", json.dumps(params), {"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                body = json.loads(resp.read())
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(f"{name}: {e}")
+                conn.close()
+                continue
+            samples[name].append(time.perf_counter() - t0)   # list.append is thread-safe
+            if resp.status != 200 or (name == "save_invoice" and not body["result"].get("success")):
+                errors.append(f"{name}: {body}")
+            elif name == "save_invoice":
+                numbers.append(body["result"]["factuurnummer"])
+                saved.append(body["result"]["id"])
+        conn.close()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(args.clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+    server.server_close()
+    api = main.API()
+    for inv_id in saved:   # keep the dataset identical between runs
+        api.delete_invoice(inv_id)
+    main.close_db()
+    duplicates = len(numbers) - len(set(numbers))
+    total = sum(len(s) for s in samples.values())
+    print(f"{args.clients} clients, {args.seconds}s, {args.invoices} invoices: "
+          f"{total / elapsed:.1f} req/s, {len(errors)} errors, {duplicates} duplicate numbers")
+    print(f"{'operation':<24}{'n':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    ops = {name: percentiles(s) for name, s in samples.items() if s}
+    for name, r in ops.items():
+        print(f"{name:<24}{r['n']:>8}{r['p50_ms']:>10.2f}{r['p90_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['max_ms']:>10.2f}")
+    for e in errors[:5]:
+        print("  " + e, file=sys.stderr)
+    return {"clients": args.clients, "seconds": args.seconds, "invoices": args.invoices,
+            "requests_per_s": round(total / elapsed, 1), "errors": len(errors),
+            "duplicate_numbers": duplicates, "ops": ops}
+
+
+def bench_backup(args):
+    """Snapshot time and size per compression, save latency while one runs, and a restore round trip."""
+    import shutil
+    import threading
+    source = Path(args.data_dir) / f"bench_{args.invoices}_{args.seed}.db"
+    if args.regenerate or not source.exists():
+        generate_db(source, args.invoices, args.seed)
+    main.close_db()
+    with tempfile.TemporaryDirectory() as tmp:
+        main.DB_PATH = Path(tmp) / "invoices.db"
+        shutil.copyfile(source, main.DB_PATH)
+        main.init_db()
+        api = main.API()
+        with main.db_transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('backup_dir', ?)",
+                         (str(Path(tmp) / "backups"),))
+        main._assets.invalidate()
+        template = api.get_invoice(api.list_invoices()["rows"][0]["id"])
+
+        def save():
+            data = {k: v for k, v in template.items() if k not in ("id", "factuurnummer", "created_at")}
+            t0 = time.perf_counter()
+            res = api.save_invoice(dict(data, auto_number=True))
+            return time.perf_counter() - t0, res["id"]
+
+        idle, saved = [], []
+        for _ in range(50):
+            elapsed, inv_id = save()
+            idle.append(elapsed)
+            saved.append(inv_id)
+        codecs = {}
+        for codec in args.codecs.split(","):
+            busy, stop = [], threading.Event()
+
+            def writer():
+                while not stop.is_set():
+                    elapsed, inv_id = save()
+                    busy.append(elapsed)
+                    saved.append(inv_id)
+                    time.sleep(args.write_interval)
+            thread = threading.Thread(target=writer)
+            thread.start()
+            try:
+                res = main.backup_db(codec, prune=False)
+            finally:
+                stop.set()
+                thread.join()
+            codecs[codec] = {"seconds": res["seconds"], "db_bytes": res["db_bytes"], "bytes": res["bytes"],
+                             "ratio": round(res["db_bytes"] / res["bytes"], 2), "restarts": res["restarts"],
+                             "save_during": percentiles(busy) if busy else None, "file": res["file"]}
+
+        def fingerprint():
+            with main.get_db() as conn:
+                return [tuple(conn.execute(f"SELECT COUNT(*), total(length(quote({cols}))) FROM {table}").fetchone())
+                        for table, cols in (("invoices", "id || factuurnummer || totaal"),
+                                            ("invoice_items", "invoice_id || position || prijs"),
+                                            ("invoice_daily_totals", "day || purpose || revenue_c"))]
+        before = fingerprint()
+        snapshot = main.backup_db(prune=False)
+        for inv_id in saved:
+            api.delete_invoice(inv_id)
+        t0 = time.perf_counter()
+        main.restore_backup(snapshot["path"])
+        restore_s = time.perf_counter() - t0
+        round_trip = fingerprint() == before
+        main.close_db()
+    print(f"{args.invoices} invoices, a save every {args.write_interval * 1000:.0f} ms during each backup; "
+          f"save when idle p50 {percentiles(idle)['p50_ms']:.2f} ms")
+    print(f"{'codec':<8}{'s':>8}{'MB db':>10}{'MB file':>10}{'ratio':>8}{'restarts':>10}{'save p50':>10}{'save max':>10}")
+    for codec, r in codecs.items():
+        during = r["save_during"] or {"p50_ms": 0, "max_ms": 0}
+        print(f"{codec:<8}{r['seconds']:>8.2f}{r['db_bytes'] / 1e6:>10.1f}{r['bytes'] / 1e6:>10.1f}{r['ratio']:>8}"
+              f"{r['restarts']:>10}{during['p50_ms']:>10.2f}{during['max_ms']:>10.2f}")
+    print(f"restore {restore_s:.2f}s, round trip {'ok' if round_trip else 'MISMATCH'}")
+    return {"invoices": args.invoices, "save_idle": percentiles(idle), "codecs": codecs,
+            "restore_seconds": round(restore_s, 3), "round_trip_ok": round_trip}
+
+
+def main_cli(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--json", help="write results to this JSON file")
+    ap.add_argument("--seed", type=int, default=42)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pdf", help="bulk PDF throughput by worker count")
+    p.add_argument("--invoices", type=int, default=200)
+    p.add_argument("--workers", default=",".join(str(w) for w in sorted({1, 2, 4, os.cpu_count() or 1})))
+    p.set_defaults(fn=bench_pdf)
+    p = sub.add_parser("render", help="PDF and HTML render time per invoice, single and as a customer statement")
+    p.add_argument("--invoices", type=int, default=50)
+    p.add_argument("--lines", default="1,8,40", help="comma-separated line item counts")
+    p.set_defaults(fn=bench_render)
+    p = sub.add_parser("import", help="bulk import into a fresh database")
+    p.add_argument("--invoices", type=int, default=100000)
+    p.add_argument("--batch", type=int, default=main.IMPORT_BATCH)
+    p.set_defaults(fn=bench_import)
+    p = sub.add_parser("startup", help="time to interactive window (source, or --exe for the frozen build)")
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--exe", help="path to the PyInstaller build instead of python main.py")
+    p.add_argument("--timeout", type=float, default=60)
+    p.set_defaults(fn=bench_startup)
+    p = sub.add_parser("generate", help="fill a database with a deterministic synthetic dataset")
+    p.add_argument("--invoices", type=int, default=100000)
+    p.add_argument("--db", default=str(main.DATA_DIR / "benchmark.db"))
+    p.set_defaults(fn=bench_generate)
+    p = sub.add_parser("api", help="API method and renderer latency per dataset size")
+    p.add_argument("--sizes", default="10000,100000")
+    p.add_argument("--repeat", type=int, default=20)
+    p.add_argument("--ops", help="comma-separated subset of operations")
+    p.add_argument("--data-dir", default=str(main.DATA_DIR / "bench"),
+                   help="generated databases are kept here and reused")
+    p.add_argument("--regenerate", action="store_true")
+    p.set_defaults(fn=bench_api)
+    p = sub.add_parser("server", help="HTTP server throughput under concurrent save and list clients")
+    p.add_argument("--clients", type=int, default=8)
+    p.add_argument("--seconds", type=float, default=10)
+    p.add_argument("--write-ratio", type=float, default=0.2, help="share of requests that save an invoice")
+    p.add_argument("--invoices", type=int, default=10000, help="dataset size")
+    p.add_argument("--data-dir", default=str(main.DATA_DIR / "bench"))
+    p.add_argument("--regenerate", action="store_true")
+    p.set_defaults(fn=bench_server)
+    p = sub.add_parser("backup", help="online backup time and size per compression, with saves running")
+    p.add_argument("--invoices", type=int, default=100000, help="dataset size")
+    p.add_argument("--codecs", default=",".join(main.backup_codecs()))
+    p.add_argument("--write-interval", type=float, default=0.01, help="seconds between saves during a backup")
+    p.add_argument("--data-dir", default=str(main.DATA_DIR / "bench"))
+    p.add_argument("--regenerate", action="store_true")
+    p.set_defaults(fn=bench_backup)
+    args = ap.parse_args(argv)
+    result = {"benchmark": args.cmd, "at": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], **args.fn(args)}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,10 +1,15 @@
-import webview
+import hashlib
 import json
 import os
+import re
+import shutil
 import sys
 import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime, timedelta
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
 if getattr(sys, 'frozen', False):
@@ -19,13 +24,414 @@ DB_PATH = DATA_DIR / "invoices.db"
 UPLOADS_DIR = DATA_DIR / "uploads"
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+# benchmark.py startup sets this to a file; phase timestamps are written there
+# once the UI reports itself usable, and the window closes.
+STARTUP_PROBE = os.environ.get("INVOICE_STARTUP_PROBE")
+_startup_marks = {}
+
+def startup_mark(name):
+    if STARTUP_PROBE:
+        _startup_marks[name] = time.time()
+
+# ── diagnostics ──────────────────────────────────────────────────
+# Off by default (INVOICE_DIAGNOSTICS=1 or set_diagnostics() turns it on).
+# While off, every hook below is a single attribute check.
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+SLOW_SQL_MS = 50
+SLOW_SQL_KEEP = 200
+
+def _noop_lap(name):
+    pass
+
+
+class Diagnostics:
+    """Per-method call stats, SQL timings and render phases for the diagnostics page."""
+
+    def __init__(self):
+        self.enabled = os.environ.get("INVOICE_DIAGNOSTICS") == "1"
+        self.slow_sql_ms = SLOW_SQL_MS
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        from collections import deque
+        with self._lock:
+            self.since = datetime.now().isoformat(timespec="seconds")
+            self.calls = {}
+            self.sql = {}
+            self.slow_sql = deque(maxlen=SLOW_SQL_KEEP)
+            self.phases = {}
+
+    @staticmethod
+    def _bucket(ms):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                return i
+        return len(LATENCY_BUCKETS_MS)
+
+    def call(self, name, fn, args, kwargs):
+        """Run one API call, recording latency, SQL time and payload sizes."""
+        local = self._local
+        if getattr(local, "sql_ms", None) is not None:   # nested API call: counted by the outer one
+            return fn(*args, **kwargs)
+        local.sql_ms = 0.0
+        t0 = time.perf_counter()
+        error = False
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except Exception:
+            error, result = True, None
+            raise
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            sql_ms, local.sql_ms = local.sql_ms, None
+            t1 = time.perf_counter()
+            try:
+                size_out = len(json.dumps(result, default=str))
+                size_in = len(json.dumps([args, kwargs], default=str))
+            except (TypeError, ValueError):
+                size_out = size_in = 0
+            encode_ms = (time.perf_counter() - t1) * 1000
+            with self._lock:
+                st = self.calls.get(name)
+                if st is None:
+                    st = self.calls[name] = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                             "sql_ms": 0.0, "encode_ms": 0.0, "bytes_in": 0, "bytes_out": 0,
+                                             "max_bytes_out": 0, "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+                st["count"] += 1
+                st["errors"] += error
+                st["total_ms"] += ms
+                st["max_ms"] = max(st["max_ms"], ms)
+                st["sql_ms"] += sql_ms
+                st["encode_ms"] += encode_ms
+                st["bytes_in"] += size_in
+                st["bytes_out"] += size_out
+                st["max_bytes_out"] = max(st["max_bytes_out"], size_out)
+                st["histogram"][self._bucket(ms)] += 1
+
+    def record_sql(self, conn, sql, params, seconds, many=False):
+        ms = seconds * 1000
+        local = self._local
+        if getattr(local, "sql_ms", None) is not None:
+            local.sql_ms += ms
+        key = " ".join(sql.split())[:500]
+        with self._lock:
+            st = self.sql.get(key)
+            if st is None and len(self.sql) < 1000:
+                st = self.sql[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            if st is not None:
+                st["count"] += 1
+                st["total_ms"] += ms
+                st["max_ms"] = max(st["max_ms"], ms)
+        if ms < self.slow_sql_ms:
+            return
+        plan = []
+        if not many and key.split(" ", 1)[0].upper() in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE"):
+            try:
+                plan = [r[3] for r in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)]
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            self.slow_sql.append({"at": datetime.now().isoformat(timespec="milliseconds"),
+                                  "ms": round(ms, 2), "sql": key, "params": repr(params)[:200],
+                                  "executemany": many, "plan": plan,
+                                  "thread": threading.current_thread().name})
+
+    def stopwatch(self, prefix):
+        """lap(name) records the time since the previous lap as phase `prefix.name`."""
+        if not self.enabled:
+            return _noop_lap
+        last = [time.perf_counter()]
+        def lap(name):
+            now = time.perf_counter()
+            ms = (now - last[0]) * 1000
+            last[0] = now
+            with self._lock:
+                st = self.phases.setdefault(f"{prefix}.{name}", {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                st["count"] += 1
+                st["total_ms"] += ms
+                st["max_ms"] = max(st["max_ms"], ms)
+        return lap
+
+    def snapshot(self):
+        def summary(st):
+            out = {k: round(v, 3) if isinstance(v, float) else v for k, v in st.items()}
+            out["mean_ms"] = round(st["total_ms"] / st["count"], 3) if st["count"] else 0
+            return out
+
+        def hist_pct(hist, q):
+            target, seen = q * sum(hist), 0
+            for i, n in enumerate(hist):
+                seen += n
+                if n and seen >= target:
+                    return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+            return None
+
+        with self._lock:
+            calls = {}
+            for name, st in sorted(self.calls.items(), key=lambda kv: -kv[1]["total_ms"]):
+                calls[name] = dict(summary(st), p50_le_ms=hist_pct(st["histogram"], 0.5),
+                                   p90_le_ms=hist_pct(st["histogram"], 0.9),
+                                   p99_le_ms=hist_pct(st["histogram"], 0.99))
+            sql = [dict(summary(st), sql=key) for key, st in
+                   sorted(self.sql.items(), key=lambda kv: -kv[1]["total_ms"])[:50]]
+            phases = {k: summary(v) for k, v in sorted(self.phases.items())}
+            slow = list(self.slow_sql)[::-1]
+        return {"enabled": self.enabled, "since": self.since, "slow_sql_ms": self.slow_sql_ms,
+                "latency_buckets_ms": list(LATENCY_BUCKETS_MS), "calls": calls,
+                "sql_top": sql, "slow_sql": slow, "phases": phases}
+
+
+_diag = Diagnostics()
+
+
+class _TimedCursor(sqlite3.Cursor):
+    """Cursor whose time from execute() until the last row is fetched is reported."""
+    _sql = None
+
+    def _run(self, method, sql, params):
+        self._sql, self._params, self._many, self._seconds = sql, params, method is sqlite3.Cursor.executemany, 0.0
+        t0 = time.perf_counter()
+        try:
+            method(self, sql, params)
+        finally:
+            self._seconds += time.perf_counter() - t0
+        if self._many or self.description is None:
+            self._report()
+        return self
+
+    def _timed(self, method, *args):
+        t0 = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self._seconds += time.perf_counter() - t0
+
+    def _report(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            _diag.record_sql(self.connection, sql, self._params, self._seconds, self._many)
+
+    def fetchone(self):
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._report()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._report()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        self._report()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._report()
+            raise
+
+    def __del__(self):
+        try:
+            self._report()   # abandoned early, e.g. execute(...).fetchone()
+        except Exception:
+            pass
+
+
+class DiagConnection(sqlite3.Connection):
+    """Pooled connection class; statements are only timed while diagnostics are on."""
+
+    def execute(self, sql, params=()):
+        if not _diag.enabled:
+            return sqlite3.Connection.execute(self, sql, params)
+        return self.cursor(_TimedCursor)._run(sqlite3.Cursor.execute, sql, params)
+
+    def executemany(self, sql, seq):
+        if not _diag.enabled:
+            return sqlite3.Connection.executemany(self, sql, seq)
+        return self.cursor(_TimedCursor)._run(sqlite3.Cursor.executemany, sql, seq)
+
+
+def instrument_api(cls):
+    """Route every public method of the js_api class through _diag.call when enabled."""
+    import functools
+    def wrap(name, fn):
+        @functools.wraps(fn)
+        def method(*args, **kwargs):
+            if not _diag.enabled:
+                return fn(*args, **kwargs)
+            return _diag.call(name, fn, args, kwargs)
+        return method
+    for name, fn in list(vars(cls).items()):
+        if callable(fn) and not name.startswith("_"):
+            setattr(cls, name, wrap(name, fn))
+    return cls
+
+
+# SQLite tuning applied once to every pooled connection
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE_KB   = 16384
+DB_POOL_SIZE       = 4
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections shared by the js_api worker threads.
+
+    pywebview calls every API method on its own thread, so connections are
+    checked out per call instead of per thread. Nested get_db()/db_transaction()
+    calls on the same thread reuse the connection (and transaction) that is
+    already checked out, so one API call shares a single connection across all
+    of its helpers.
+    """
+
+    def __init__(self, max_idle=DB_POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = []
+        self._path = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, factory=DiagConnection,
+                               isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def acquire(self):
+        path = str(DB_PATH)
+        with self._lock:
+            if path != self._path:
+                # DB_PATH was repointed: never hand out connections to the old file
+                self._close_idle()
+                self._path = path
+            conn = self._idle.pop() if self._idle else None
+        return conn or self._connect(path)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle and self._path == str(DB_PATH):
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _close_idle(self):
+        for conn in self._idle:
+            conn.close()
+        self._idle = []
+
+    def close_all(self):
+        """Close every idle connection (checked-out ones close on release)."""
+        with self._lock:
+            self._close_idle()
+            self._path = None
+
+    @contextmanager
+    def connection(self):
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self.acquire()
+        local.conn = conn
+        try:
+            yield conn
+        finally:
+            local.conn = None
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, write=True):
+        with self.connection() as conn:
+            if conn.in_transaction:
+                # already inside the caller's transaction: join it
+                yield conn
+                return
+            # Writers in this process queue on a lock instead of SQLite's
+            # sleep-and-retry busy handler; other processes still meet BEGIN IMMEDIATE.
+            if write and not self._write_lock.acquire(timeout=DB_BUSY_TIMEOUT_MS / 1000):
+                raise sqlite3.OperationalError("database is locked")
+            try:
+                conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+            finally:
+                if write:
+                    self._write_lock.release()
+
+
+_pool = ConnectionPool()
+
+
+# init_db() runs on a background thread while the window opens; every
+# connection checkout waits for it (except on that thread itself).
+_db_init = {"thread": None, "error": None}
+
+def start_db_init():
+    def run():
+        try:
+            init_db()
+        except Exception as e:
+            _db_init["error"] = e
+        startup_mark("db_ready")
+    thread = threading.Thread(target=run, name="db-init", daemon=True)
+    _db_init["thread"] = thread
+    thread.start()
+
+def wait_for_db():
+    thread = _db_init["thread"]
+    if thread is not None and thread is not threading.current_thread():
+        thread.join()
+        if _db_init["error"] is not None:
+            raise RuntimeError(f"Database initialisation failed: {_db_init['error']}")
+
 def get_db():
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Check out a pooled connection: `with get_db() as conn: ...`"""
+    wait_for_db()
+    return _pool.connection()
 
-def init_db():
-    conn = get_db()
+def db_transaction(write=True):
+    """Run the block in one transaction; nested calls join the outer one.
+
+    write=True takes the write lock up front (BEGIN IMMEDIATE) so concurrent
+    writers queue on busy_timeout instead of failing half-way through.
+    """
+    wait_for_db()
+    return _pool.transaction(write)
+
+def close_db():
+    _pool.close_all()
+
+# Schema migrations, applied in order. The position in the list is the schema
+# version recorded in PRAGMA user_version, so only ever append to it.
+MIGRATIONS = []
+
+def migration(fn):
+    MIGRATIONS.append(fn)
+    return fn
+
+@migration
+def _m001_base_schema(conn):
     conn.execute('''CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)''')
     conn.execute('''CREATE TABLE IF NOT EXISTS invoices (
         id TEXT PRIMARY KEY, factuurnummer TEXT UNIQUE,
@@ -35,533 +441,3172 @@ def init_db():
         customer_phone TEXT, customer_email TEXT, customer_kvk TEXT, customer_name TEXT,
         items TEXT, subtotaal REAL, btw_pct REAL, btw_amount REAL, totaal REAL,
         notes TEXT, created_at TEXT)''')
-    conn.commit()
-    conn.close()
+
+@migration
+def _m002_list_report_indexes(conn):
+    # get_invoices/get_report: purpose + date range, sorted by created_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_purpose_date ON invoices(purpose, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(created_at)")
+
+@migration
+def _m003_invoice_items(conn):
+    # Line items move out of the JSON `items` column into their own table,
+    # clustered by invoice so opening one invoice reads one contiguous range.
+    conn.execute('''CREATE TABLE IF NOT EXISTS invoice_items (
+        invoice_id TEXT NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL, productnaam TEXT, aantal REAL, prijs REAL,
+        PRIMARY KEY (invoice_id, position)) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoice_items_product ON invoice_items(productnaam)")
+    rows = conn.execute("SELECT id, items FROM invoices WHERE items IS NOT NULL AND items != ''")
+    for inv_id, items_json in rows.fetchall():
+        try:
+            items = json.loads(items_json)
+        except ValueError:
+            continue
+        conn.executemany("INSERT OR REPLACE INTO invoice_items VALUES (?,?,?,?,?)",
+                         _item_rows(inv_id, items))
+    conn.execute("UPDATE invoices SET items=NULL")
+
+@migration
+def _m004_list_keyset_indexes(conn):
+    # list_invoices pages on (created_at, id); these serve the ORDER BY and the
+    # keyset predicate directly, with or without a purpose filter.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_created_id ON invoices(created_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invoices_purpose_created_id ON invoices(purpose, created_at, id)")
+    conn.execute("DROP INDEX IF EXISTS idx_invoices_created_at")
+
+# Full-text index over the searchable invoice fields. Rows share their rowid
+# with `invoices`, so rebuild_search_index() must run after a VACUUM.
+FTS_COLUMNS = ("factuurnummer", "customer_company", "customer_name", "customer_email",
+               "customer_city", "bestelnummer", "notes")
+_FTS_ITEMS = "(SELECT group_concat(productnaam, ' ') FROM invoice_items WHERE invoice_id={}.id)"
+
+def rebuild_search_index(conn):
+    conn.execute("DELETE FROM invoices_fts")
+    conn.execute(f"INSERT INTO invoices_fts (rowid, {', '.join(FTS_COLUMNS)}, items) "
+                 f"SELECT rowid, {', '.join(FTS_COLUMNS)}, {_FTS_ITEMS.format('invoices')} FROM invoices")
+    optimize_search_index(conn)
+
+def optimize_search_index(conn):
+    # merge the index into one segment, dropping the entries of deleted rows
+    conn.execute("INSERT INTO invoices_fts (invoices_fts) VALUES ('optimize')")
+
+def search_index_stale(conn):
+    """True when invoices_fts rowids no longer line up with invoices (e.g. after a VACUUM)."""
+    return bool(conn.execute("""SELECT (SELECT COUNT(*) FROM invoices) != (SELECT COUNT(*) FROM invoices_fts)
+        OR EXISTS (SELECT 1 FROM invoices i LEFT JOIN invoices_fts f ON f.rowid = i.rowid
+                   WHERE f.factuurnummer IS NOT i.factuurnummer)""").fetchone()[0])
+
+@migration
+def _m005_search_index(conn):
+    cols = ", ".join(FTS_COLUMNS)
+    new_vals = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+    conn.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(
+        {cols}, items, tokenize='unicode61 remove_diacritics 2', prefix='2 3')""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoices_fts_ai AFTER INSERT ON invoices BEGIN
+        INSERT INTO invoices_fts (rowid, {cols}, items)
+        VALUES (new.rowid, {new_vals}, {_FTS_ITEMS.format('new')});
+        END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoices_fts_au AFTER UPDATE OF {cols} ON invoices BEGIN
+        DELETE FROM invoices_fts WHERE rowid = old.rowid;
+        INSERT INTO invoices_fts (rowid, {cols}, items)
+        VALUES (new.rowid, {new_vals}, {_FTS_ITEMS.format('new')});
+        END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS invoices_fts_ad AFTER DELETE ON invoices BEGIN
+        DELETE FROM invoices_fts WHERE rowid = old.rowid;
+        END""")
+    for event, ref in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoice_items_fts_{event.lower()}
+            AFTER {event} ON invoice_items BEGIN
+            UPDATE invoices_fts SET items = (SELECT group_concat(productnaam, ' ')
+                FROM invoice_items WHERE invoice_id = {ref}.invoice_id)
+            WHERE rowid = (SELECT rowid FROM invoices WHERE id = {ref}.invoice_id);
+            END""")
+    rebuild_search_index(conn)
+
+# Per-day, per-purpose totals kept current by triggers, so reports read a few
+# hundred pre-aggregated rows instead of every invoice. Amounts are integer
+# cents, which keeps the sums exact.
+def _cents(expr):
+    return f"CAST(ROUND(COALESCE({expr}, 0) * 100) AS INTEGER)"
+
+def _rollup_key(ref):
+    return f"substr(COALESCE({ref}.date, ''), 1, 10), COALESCE({ref}.purpose, '')"
+
+def _rollup_upsert(ref, sign):
+    return f"""INSERT INTO invoice_daily_totals VALUES ({_rollup_key(ref)}, {sign}1,
+        {sign}{_cents(ref + '.totaal')}, {sign}{_cents(ref + '.btw_amount')}, {sign}{_cents(ref + '.subtotaal')})
+        ON CONFLICT (day, purpose) DO UPDATE SET count = count + excluded.count,
+        revenue_c = revenue_c + excluded.revenue_c, btw_c = btw_c + excluded.btw_c,
+        subtotaal_c = subtotaal_c + excluded.subtotaal_c;"""
+
+_ROLLUP_PRUNE = "DELETE FROM invoice_daily_totals WHERE count = 0;"
+
+def _rollup_from(schema="main"):
+    return f"""SELECT substr(COALESCE(date, ''), 1, 10) AS day,
+    COALESCE(purpose, '') AS purpose, COUNT(*) AS count,
+    SUM({_cents('totaal')}) AS revenue_c, SUM({_cents('btw_amount')}) AS btw_c,
+    SUM({_cents('subtotaal')}) AS subtotaal_c FROM {schema}.invoices"""
+
+_ROLLUP_FROM_INVOICES = _rollup_from()
+
+def rebuild_rollups(conn):
+    conn.execute("DELETE FROM invoice_daily_totals")
+    conn.execute(f"INSERT INTO invoice_daily_totals {_ROLLUP_FROM_INVOICES} GROUP BY 1, 2")
+
+def check_rollups(conn):
+    """(day, purpose) keys where invoice_daily_totals disagrees with invoices."""
+    q = f"""SELECT day, purpose, count, revenue_c, btw_c, subtotaal_c FROM ({_ROLLUP_FROM_INVOICES} GROUP BY 1, 2)
+            EXCEPT SELECT * FROM invoice_daily_totals"""
+    bad = {(r[0], r[1]) for r in conn.execute(q)}
+    bad |= {(r[0], r[1]) for r in conn.execute(
+        f"SELECT * FROM invoice_daily_totals EXCEPT SELECT * FROM ({_ROLLUP_FROM_INVOICES} GROUP BY 1, 2)")}
+    return sorted(bad)
+
+@migration
+def _m006_daily_rollups(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS invoice_daily_totals (
+        day TEXT NOT NULL, purpose TEXT NOT NULL, count INTEGER NOT NULL,
+        revenue_c INTEGER NOT NULL, btw_c INTEGER NOT NULL, subtotaal_c INTEGER NOT NULL,
+        PRIMARY KEY (day, purpose)) WITHOUT ROWID''')
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoices_rollup_ai AFTER INSERT ON invoices BEGIN
+        {_rollup_upsert('new', '+')}
+        END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoices_rollup_ad AFTER DELETE ON invoices BEGIN
+        {_rollup_upsert('old', '-')}
+        {_ROLLUP_PRUNE}
+        END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoices_rollup_au
+        AFTER UPDATE OF date, purpose, totaal, btw_amount, subtotaal ON invoices BEGIN
+        {_rollup_upsert('old', '-')}
+        {_rollup_upsert('new', '+')}
+        {_ROLLUP_PRUNE}
+        END""")
+    rebuild_rollups(conn)
+
+@migration
+def _m007_invoice_sequences(conn):
+    # Per-prefix counters for generate_factuurnummer/reserve_invoice_numbers,
+    # started past any number already in the new format.
+    conn.execute('''CREATE TABLE IF NOT EXISTS invoice_sequences (
+        prefix TEXT PRIMARY KEY, next INTEGER NOT NULL) WITHOUT ROWID''')
+    for prefix in set(INVOICE_PREFIXES.values()):
+        last = conn.execute(
+            "SELECT MAX(CAST(substr(factuurnummer, ?) AS INTEGER)) FROM invoices WHERE factuurnummer GLOB ?",
+            (len(prefix) + 4, f"{prefix}-NL" + "[0-9]" * 6)).fetchone()[0]
+        conn.execute("INSERT OR IGNORE INTO invoice_sequences (prefix, next) VALUES (?,?)", (prefix, (last or 0) + 1))
+
+# Rowids of changed invoices, for incremental refreshes of the analytics
+# snapshot. A NULL rowid means "reload everything" (bulk import, VACUUM); the
+# log keeps the last ANALYTICS_LOG_KEEP entries and a reader that fell behind
+# that reloads too.
+ANALYTICS_LOG_KEEP = 10000
+
+def note_invoice_changes(conn, after_rowid=None):
+    """Log invoices with rowid > after_rowid as changed, or everything when None."""
+    if after_rowid is not None:
+        added = conn.execute("SELECT COALESCE(MAX(rowid), 0) - ? FROM invoices", (after_rowid,)).fetchone()[0]
+        if added <= ANALYTICS_LOG_KEEP:
+            conn.execute("INSERT INTO invoice_changes (invoice_rowid) SELECT rowid FROM invoices WHERE rowid > ?",
+                         (after_rowid,))
+            return
+    conn.execute("INSERT INTO invoice_changes (invoice_rowid) VALUES (NULL)")
+
+@migration
+def _m008_invoice_changes(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS invoice_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, invoice_rowid INTEGER)''')
+    prune = f"DELETE FROM invoice_changes WHERE seq <= (SELECT MAX(seq) FROM invoice_changes) - {ANALYTICS_LOG_KEEP};"
+    for event, ref in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS invoices_changes_a{event[0].lower()}
+            AFTER {event} ON invoices BEGIN
+            INSERT INTO invoice_changes (invoice_rowid) VALUES ({ref}.rowid);
+            {prune}
+            END""")
+
+@migration
+def _m009_logo_copies(conn):
+    # Logos uploaded before store_logo() existed get their print and preview
+    # copies now; one that cannot be read keeps being used as it is.
+    path = conn.execute("SELECT value FROM settings WHERE key = 'logo_path'").fetchone()
+    if not path or not path[0] or not os.path.exists(path[0]) or \
+            conn.execute("SELECT 1 FROM settings WHERE key = 'logo_preview_path'").fetchone():
+        return
+    try:
+        logo_settings = store_logo(path[0])
+    except (ImportError, OSError, ValueError):
+        return
+    conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", list(logo_settings.items()))
+
+@migration
+def _m010_archived_years(conn):
+    # Closed years moved out to their own file by archive_year()
+    conn.execute('''CREATE TABLE IF NOT EXISTS archived_years (
+        year INTEGER PRIMARY KEY, file TEXT NOT NULL, count INTEGER NOT NULL,
+        revenue_c INTEGER NOT NULL, archived_at TEXT NOT NULL)''')
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn):
+    """Upgrade the database in place to the latest schema version.
+
+    Every migration runs in its own transaction together with the bump of
+    user_version, so an interrupted upgrade resumes where it stopped.
+    """
+    current = schema_version(conn)
+    for version, step in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < version:   # another process may have won the race
+                step(conn)
+                conn.execute(f"PRAGMA user_version={version}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return schema_version(conn)
+
+def init_db():
+    with get_db() as conn:
+        migrate(conn)
+        conn.execute("PRAGMA optimize")
+
+def query_plan(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN details for `sql`, e.g. to check an index is used."""
+    return [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+# Hot queries that must stay on an index; check_query_plans() flags regressions
+INDEXED_QUERIES = [
+    ("SELECT * FROM invoices WHERE purpose=? AND date>=? AND date<=? ORDER BY created_at DESC",
+     ("BOL", "2024-01-01", "2024-12-31")),
+    ("SELECT * FROM invoices WHERE 1=1 ORDER BY created_at DESC", ()),
+    ("SELECT id FROM invoices WHERE purpose=? AND (created_at, id) < (?, ?) "
+     "ORDER BY created_at DESC, id DESC LIMIT 100", ("BOL", "2024-06-01", "x")),
+]
+
+def check_query_plans(conn):
+    """Return {sql: plan} for every INDEXED_QUERIES entry that full-scans invoices."""
+    bad = {}
+    for sql, params in INDEXED_QUERIES:
+        plan = query_plan(conn, sql, params)
+        if any(d.startswith("SCAN invoices") and "USING" not in d for d in plan):
+            bad[sql] = plan
+    return bad
+
+INVOICE_PREFIXES = {"BOL": "BOL", "Best4Juniors": "B4J", "Other": "OTH", "": "INV"}
+
+def invoice_prefix(purpose):
+    return INVOICE_PREFIXES.get(purpose, "INV")
+
+def format_factuurnummer(prefix, seq):
+    # Six digits keeps these apart from the older NL<hex4><count4> numbers
+    return f"{prefix}-NL{seq:06d}"
 
 def generate_factuurnummer(purpose):
-    prefix_map = {"BOL": "BOL", "Best4Juniors": "B4J", "Other": "OTH", "": "INV"}
-    prefix = prefix_map.get(purpose, "INV")
-    conn = get_db()
-    count = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
-    conn.close()
-    rand = uuid.uuid4().hex[:4].upper()
-    return f"{prefix}-NL{rand}{count+1:04d}"
+    """Preview of the next number for `purpose`; it is only taken by save_invoice()."""
+    prefix = invoice_prefix(purpose)
+    with get_db() as conn:
+        row = conn.execute("SELECT next FROM invoice_sequences WHERE prefix=?", (prefix,)).fetchone()
+    return format_factuurnummer(prefix, row[0] if row else 1)
+
+def reserve_invoice_numbers(conn, purpose, count=1):
+    """Take `count` consecutive numbers for `purpose` inside the caller's write transaction.
+
+    The sequence row is bumped in the same transaction as the insert, so a
+    rollback hands the numbers back and concurrent writers never share one.
+    """
+    prefix = invoice_prefix(purpose)
+    conn.execute("INSERT INTO invoice_sequences (prefix, next) VALUES (?, 1) ON CONFLICT(prefix) DO NOTHING",
+                 (prefix,))
+    conn.execute("UPDATE invoice_sequences SET next = next + ? WHERE prefix=?", (count, prefix))
+    end = conn.execute("SELECT next FROM invoice_sequences WHERE prefix=?", (prefix,)).fetchone()[0]
+    return [format_factuurnummer(prefix, n) for n in range(end - count, end)]
+
+_SEQUENCE_NUMBER = re.compile(r"([A-Z0-9]+)-NL(\d{6})")
+
+def advance_invoice_sequences(conn, numbers):
+    """Move sequences past explicitly given numbers in their format (imports)."""
+    last = {}
+    for number in numbers:
+        m = _SEQUENCE_NUMBER.fullmatch(number or "")
+        if m:
+            last[m[1]] = max(last.get(m[1], 0), int(m[2]))
+    conn.executemany("""INSERT INTO invoice_sequences (prefix, next) VALUES (?, ?)
+        ON CONFLICT(prefix) DO UPDATE SET next = MAX(next, excluded.next)""",
+        [(prefix, n + 1) for prefix, n in last.items()])
+
+# Header columns of `invoices`; line items live in invoice_items
+INVOICE_COLUMNS = ("id", "factuurnummer", "date", "due_date", "purpose", "bestelnummer",
+                   "customer_company", "customer_dept", "customer_address",
+                   "customer_postal", "customer_city", "customer_country",
+                   "customer_phone", "customer_email", "customer_kvk", "customer_name",
+                   "subtotaal", "btw_pct", "btw_amount", "totaal", "notes", "created_at")
+INVOICE_SELECT = ", ".join(INVOICE_COLUMNS)
+
+def invoice_totals(items, btw_pct):
+    # Price is INCL. BTW → total = sum(prijs * aantal), extract subtotaal
+    totaal = round(sum(float(i.get("prijs",0)) * float(i.get("aantal",0)) for i in items), 2)
+    subtotaal = round(totaal / (1 + btw_pct / 100), 2)
+    return subtotaal, round(totaal - subtotaal, 2), totaal
+
+def invoice_values(data, btw_pct, totals):
+    """Values for INVOICE_COLUMNS[2:-1] (everything but id, number and created_at)."""
+    subtotaal, btw_amount, totaal = totals
+    return (data.get("date",""), data.get("due_date",""),
+            data.get("purpose",""), data.get("bestelnummer",""),
+            data.get("customer_company",""), data.get("customer_dept",""),
+            data.get("customer_address",""), data.get("customer_postal",""),
+            data.get("customer_city",""), data.get("customer_country","Netherlands"),
+            data.get("customer_phone",""), data.get("customer_email",""),
+            data.get("customer_kvk",""), data.get("customer_name",""),
+            subtotaal, btw_pct, btw_amount, totaal, data.get("notes",""))
+
+def _item_rows(inv_id, items):
+    return [(inv_id, pos, i.get("productnaam", ""),
+             float(i.get("aantal", 0) or 0), float(i.get("prijs", 0) or 0))
+            for pos, i in enumerate(items)]
+
+def invoice_file_stem(inv):
+    safe_name = inv["factuurnummer"].replace("/","_").replace("\\","_").replace(":","_")
+    return f"Factuur_{safe_name}"
+
+def load_invoices(conn, ids, schema="main"):
+    """Full invoices (header + items) for `ids`, in the given order."""
+    ids = list(ids)
+    if not ids:
+        return []
+    marks = ",".join("?" * len(ids))
+    invs = {r["id"]: dict(r, items=[]) for r in conn.execute(
+        f"SELECT {INVOICE_SELECT} FROM {schema}.invoices WHERE id IN ({marks})", ids)}
+    for r in conn.execute(f"SELECT invoice_id, productnaam, prijs, aantal FROM {schema}.invoice_items "
+                          f"WHERE invoice_id IN ({marks}) ORDER BY invoice_id, position", ids):
+        invs[r["invoice_id"]]["items"].append({"productnaam": r["productnaam"],
+                                               "prijs": r["prijs"], "aantal": r["aantal"]})
+    return [invs[i] for i in ids if i in invs]
+
+def find_invoices(ids):
+    """load_invoices() for `ids` wherever they are: the main database first,
+    then the archives for the ids not found there."""
+    ids = list(ids)
+    with db_transaction(write=False) as conn:
+        found = {inv["id"]: inv for inv in load_invoices(conn, ids)}
+    missing = [i for i in ids if i not in found]
+    if missing:
+        with get_db() as conn:
+            for schema in archive_schemas(conn):
+                found.update((inv["id"], inv) for inv in load_invoices(conn, missing, schema))
+                missing = [i for i in missing if i not in found]
+                if not missing:
+                    break
+    return [found[i] for i in ids if i in found]
+
+def load_items(conn, inv_id, schema="main"):
+    rows = conn.execute(f"SELECT productnaam, prijs, aantal FROM {schema}.invoice_items "
+                        "WHERE invoice_id=? ORDER BY position", (inv_id,)).fetchall()
+    return [dict(r) for r in rows]
+
+def invoice_filter_sql(filters, alias=""):
+    """WHERE fragment (starting with ' AND') + params for the list/report filters."""
+    col = f"{alias}." if alias else ""
+    q, params = "", []
+    if filters:
+        if filters.get("purpose") and filters["purpose"] != "all":
+            q += f" AND {col}purpose=?"; params.append(filters["purpose"])
+        if filters.get("date_from"):
+            q += f" AND {col}date>=?"; params.append(filters["date_from"])
+        if filters.get("date_to"):
+            q += f" AND {col}date<=?"; params.append(filters["date_to"])
+    return q, params
+
+def daily_totals(conn, filters=None, schema="main"):
+    """(day, purpose, count, revenue_c, btw_c, subtotaal_c) rows for the filters.
+
+    Whole days inside the range come from invoice_daily_totals. The two boundary
+    days are aggregated from `invoices` with the exact same `date >= date_from
+    AND date <= date_to` string comparison get_invoices() uses, so the result
+    matches a scan of the filtered invoices row for row. `schema` selects an
+    attached archive instead of the main database.
+    """
+    filters = filters or {}
+    purpose = filters.get("purpose") if filters.get("purpose") not in (None, "", "all") else None
+    df, dt = filters.get("date_from") or None, filters.get("date_to") or None
+    source = _rollup_from(schema)
+    if any(v is not None and len(v) != 10 for v in (df, dt)):
+        # not plain YYYY-MM-DD bounds: day buckets don't line up, use the base table
+        where, params = invoice_filter_sql(filters)
+        return conn.execute(f"{source} WHERE 1=1{where} GROUP BY 1, 2", params).fetchall()
+    q, params = f"SELECT * FROM {schema}.invoice_daily_totals WHERE 1=1", []
+    if purpose:
+        q += " AND purpose=?"; params.append(purpose)
+    if df:
+        q += " AND day>?"; params.append(df)
+    if dt:
+        q += " AND day<?"; params.append(dt)
+    rows = conn.execute(q, params).fetchall()
+    for day in sorted({df, dt} - {None}):
+        lo = max(day, df) if df else day
+        hi = min(day + "\uffff", dt) if dt else day + "\uffff"
+        bq, bparams = f"{source} WHERE date>=? AND date<=?", [lo, hi]
+        if purpose:
+            bq += " AND purpose=?"; bparams.append(purpose)
+        rows += conn.execute(bq + " GROUP BY 1, 2", bparams).fetchall()
+    return rows
+
+def report_totals(conn, filters=None):
+    """daily_totals() of the main database plus the archived years the filters reach."""
+    rows = daily_totals(conn, filters)
+    for schema in archive_schemas(conn, filters):
+        rows += daily_totals(conn, filters, schema)
+    return rows
+
+REPORT_BUCKETS = ("day", "week", "month", "quarter", "year")
+
+def report_period(day, bucket):
+    """Sortable period key for a YYYY-MM-DD day: 2024-03-07 -> 2024-W10 / 2024-03 / 2024-Q1"""
+    try:
+        d = date.fromisoformat(day)
+    except ValueError:
+        return ""          # invoices without a usable date
+    if bucket == "day":
+        return day
+    if bucket == "week":
+        y, w, _ = d.isocalendar()
+        return f"{y}-W{w:02d}"
+    if bucket == "month":
+        return day[:7]
+    if bucket == "quarter":
+        return f"{d.year}-Q{(d.month - 1) // 3 + 1}"
+    return str(d.year)
+
+# ── year archives ────────────────────────────────────────────────
+# Closed fiscal years can be moved out of the main database into one file per
+# year next to it (invoices_2021.db), so the main file, its indexes and the
+# analytics snapshot only carry recent history. archived_years lists them; a
+# query whose date filter reaches into an archived year ATTACHes that file to
+# its connection and reads the same tables there. Archives are read-only:
+# invoices dated in an archived year can no longer be saved or imported.
+ARCHIVE_KEEP_YEARS = 2       # the current and the previous year are never archived
+ARCHIVE_ATTACH_LIMIT = 8     # SQLite allows 10 attached databases per connection
+
+_REAL_COLUMNS = {"subtotaal", "btw_pct", "btw_amount", "totaal"}
+ARCHIVE_SCHEMA = (
+    "CREATE TABLE {schema}.invoices (" + ", ".join(
+        f"{c} {'REAL' if c in _REAL_COLUMNS else 'TEXT'}"
+        + {"id": " PRIMARY KEY", "factuurnummer": " UNIQUE"}.get(c, "") for c in INVOICE_COLUMNS) + ")",
+    """CREATE TABLE {schema}.invoice_items (
+        invoice_id TEXT NOT NULL, position INTEGER NOT NULL, productnaam TEXT, aantal REAL, prijs REAL,
+        PRIMARY KEY (invoice_id, position)) WITHOUT ROWID""",
+    """CREATE TABLE {schema}.invoice_daily_totals (
+        day TEXT NOT NULL, purpose TEXT NOT NULL, count INTEGER NOT NULL,
+        revenue_c INTEGER NOT NULL, btw_c INTEGER NOT NULL, subtotaal_c INTEGER NOT NULL,
+        PRIMARY KEY (day, purpose)) WITHOUT ROWID""",
+    "CREATE INDEX {schema}.idx_invoices_created_id ON invoices(created_at, id)",
+    "CREATE INDEX {schema}.idx_invoices_purpose_created_id ON invoices(purpose, created_at, id)",
+    "CREATE INDEX {schema}.idx_invoices_date ON invoices(date)",
+)
+
+def year_bounds(year):
+    """Every date of `year` (with or without a time) sorts between these two strings."""
+    return f"{year}-", f"{year}-\uffff"
+
+def archive_path(year):
+    return DB_PATH.with_name(f"{DB_PATH.stem}_{year}.db")
+
+def archived_years(conn):
+    return [r[0] for r in conn.execute("SELECT year FROM archived_years ORDER BY year DESC")]
+
+def archived_year_of(conn, day):
+    """The archived year `day` falls in, or None."""
+    year = str(day or "")[:4]
+    if not year.isdigit():
+        return None
+    row = conn.execute("SELECT year FROM archived_years WHERE year=?", (int(year),)).fetchone()
+    return row[0] if row else None
+
+def attach_archive(conn, year):
+    """Schema name of the archive of `year` on `conn`, attaching it first if needed.
+
+    ATTACH is not allowed inside a transaction, so neither is this. Past
+    ARCHIVE_ATTACH_LIMIT the archives attached earlier are detached again.
+    """
+    schema = f"archive_{year}"
+    attached = [r[1] for r in conn.execute("PRAGMA database_list") if r[1].startswith("archive_")]
+    if schema in attached:
+        return schema
+    row = conn.execute("SELECT file FROM archived_years WHERE year=?", (year,)).fetchone()
+    path = DB_PATH.with_name(row[0]) if row else None
+    if path is None or not path.exists():
+        raise FileNotFoundError(f"Archive of {year} is missing: {path or archive_path(year)}")
+    for other in attached[:max(0, len(attached) - ARCHIVE_ATTACH_LIMIT + 1)]:
+        conn.execute(f"DETACH DATABASE {other}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+    return schema
+
+def archived_years_in(conn, filters=None):
+    """The archived years the date range of `filters` reaches into, newest first."""
+    filters = filters or {}
+    df, dt = filters.get("date_from") or "", filters.get("date_to") or ""
+    return [year for year in archived_years(conn)
+            if (not df or year_bounds(year)[1] >= df) and (not dt or year_bounds(year)[0] <= dt)]
+
+def archive_schemas(conn, filters=None):
+    """Schema names of the archived years the date range of `filters` reaches
+    into, newest first, attached one by one as the generator advances; finish
+    reading one before asking for the next."""
+    for year in archived_years_in(conn, filters):
+        yield attach_archive(conn, year)
+
+def archive_warning(conn, filters=None):
+    """{"warning", "archived_years"} for reads that only cover the main
+    database (full-text search, analytics) when `filters` reach into an
+    archived year, else {}."""
+    years = archived_years_in(conn, filters)
+    if not years:
+        return {}
+    return {"warning": f"Archived years not included: {', '.join(map(str, years))}", "archived_years": years}
+
+def archive_count(conn, schema, filters=None):
+    """Number of invoices matching `filters` in an attached archive; read from
+    archived_years when the filters take in the whole year."""
+    year = int(schema.rsplit("_", 1)[1])
+    filters = filters or {}
+    lo, hi = year_bounds(year)
+    if filters.get("purpose") in (None, "", "all") and (filters.get("date_from") or "") <= lo \
+            and (filters.get("date_to") or "\uffff") >= hi:
+        return conn.execute("SELECT count FROM archived_years WHERE year=?", (year,)).fetchone()[0]
+    where, params = invoice_filter_sql(filters)
+    return conn.execute(f"SELECT COUNT(*) FROM {schema}.invoices WHERE 1=1{where}", params).fetchone()[0]
+
+def compact_db():
+    """VACUUM the main database, and redo what depends on its rowids if they moved."""
+    with db_transaction() as conn:
+        optimize_search_index(conn)
+    with get_db() as conn:
+        conn.execute("VACUUM")
+    with db_transaction() as conn:
+        if search_index_stale(conn):     # VACUUM may renumber invoice rowids
+            rebuild_search_index(conn)
+            note_invoice_changes(conn)
+    with get_db() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+def archive_year(year, compact=True, progress=None):
+    """Move every invoice dated in `year` into archive_path(year).
+
+    The archive is written and closed under a temporary name first; the
+    invoices only leave the main database, in one transaction, once the
+    archive holds the same number of invoices, items and cents. With
+    `compact`, the main database is VACUUMed afterwards to give the space back.
+    """
+    year = int(year)
+    if year > date.today().year - ARCHIVE_KEEP_YEARS:
+        raise ValueError(f"{year} is not closed yet: the last {ARCHIVE_KEEP_YEARS} years stay in the main database")
+    lo, hi = year_bounds(year)
+    path = archive_path(year)
+    tmp = path.with_name(path.name + ".tmp")
+    totals = f"""SELECT COUNT(*), COALESCE(SUM({_cents('totaal')}), 0),
+        (SELECT COUNT(*) FROM {{schema}}.invoice_items it JOIN {{schema}}.invoices i ON i.id = it.invoice_id
+         WHERE i.date>=? AND i.date<=?) FROM {{schema}}.invoices WHERE date>=? AND date<=?"""
+    size_before = DB_PATH.stat().st_size
+    with get_db() as conn:
+        if conn.execute("SELECT 1 FROM archived_years WHERE year=?", (year,)).fetchone():
+            raise ValueError(f"{year} is already archived")
+        tmp.unlink(missing_ok=True)
+        conn.execute("ATTACH DATABASE ? AS archive_new", (str(tmp),))
+        try:
+            for ddl in ARCHIVE_SCHEMA:
+                conn.execute(ddl.format(schema="archive_new"))
+            with db_transaction() as conn:
+                conn.execute(f"INSERT INTO archive_new.invoices ({INVOICE_SELECT}) "
+                             f"SELECT {INVOICE_SELECT} FROM invoices WHERE date>=? AND date<=?", (lo, hi))
+                conn.execute("""INSERT INTO archive_new.invoice_items
+                    SELECT it.invoice_id, it.position, it.productnaam, it.aantal, it.prijs
+                    FROM invoices i JOIN invoice_items it ON it.invoice_id = i.id
+                    WHERE i.date>=? AND i.date<=?""", (lo, hi))
+                conn.execute("INSERT INTO archive_new.invoice_daily_totals "
+                             "SELECT * FROM invoice_daily_totals WHERE day>=? AND day<=?", (lo, hi))
+        finally:
+            conn.execute("DETACH DATABASE archive_new")
+        if progress: progress(1, 3)
+        os.replace(tmp, path)
+        conn.execute("ATTACH DATABASE ? AS archive_check", (str(path),))
+        try:
+            with db_transaction() as conn:
+                here = tuple(conn.execute(totals.format(schema="main"), (lo, hi, lo, hi)).fetchone())
+                there = tuple(conn.execute(totals.format(schema="archive_check"), (lo, hi, lo, hi)).fetchone())
+                if here != there:
+                    raise RuntimeError(f"Invoices of {year} changed while archiving; nothing was moved")
+                if not here[0]:
+                    raise ValueError(f"No invoices dated in {year}")
+                conn.execute("DELETE FROM invoices WHERE date>=? AND date<=?", (lo, hi))   # items cascade
+                conn.execute("INSERT INTO archived_years VALUES (?,?,?,?,?)",
+                             (year, path.name, here[0], here[1], datetime.now().isoformat(timespec="seconds")))
+        except BaseException:
+            conn.execute("DETACH DATABASE archive_check")
+            path.unlink(missing_ok=True)
+            raise
+        conn.execute("DETACH DATABASE archive_check")
+    if progress: progress(2, 3)
+    if compact:
+        compact_db()
+    if progress: progress(3, 3)
+    return {"success": True, "year": year, "file": str(path), "invoices": here[0],
+            "revenue": here[1] / 100, "db_bytes_before": size_before, "db_bytes_after": DB_PATH.stat().st_size}
+
+def list_archives():
+    with get_db() as conn:
+        rows = [dict(r) for r in conn.execute("SELECT * FROM archived_years ORDER BY year DESC")]
+    for r in rows:
+        path = DB_PATH.with_name(r["file"])
+        r["revenue"] = r.pop("revenue_c") / 100
+        r["bytes"] = path.stat().st_size if path.exists() else None
+    return rows
+
+# ── backups ──────────────────────────────────────────────────────
+# Snapshots of the live database are taken with SQLite's online backup API,
+# BACKUP_STEP_PAGES pages per step: in WAL mode the copy only holds a read
+# transaction, so saves carry on while it runs, and between steps progress is
+# reported and a cancel takes effect. Each copy must pass PRAGMA
+# integrity_check, is then compressed into the backup folder (DATA_DIR/backups
+# unless the backup_dir setting says otherwise) and read back before it
+# counts. prune_backups() applies the retention policy. Archived years never
+# change, so each archive file is stored once, in backups/archives.
+BACKUP_INTERVAL_HOURS = 24    # backup_interval_hours setting; 0 turns the schedule off
+BACKUP_KEEP = 7               # backup_keep: the newest snapshots are always kept ...
+BACKUP_KEEP_MONTHS = 12       # backup_keep_months: ... plus the newest of each recent month
+BACKUP_STEP_PAGES = 1024
+BACKUP_MAX_RESTARTS = 5
+BACKUP_CHUNK = 1024 * 1024
+BACKUP_GZIP_LEVEL = 6
+BACKUP_ZSTD_LEVEL = 10
+BACKUP_FIRST_CHECK = 60       # seconds after start before the schedule is first checked
+BACKUP_CHECK_INTERVAL = 600
+BACKUP_CODECS = {"gzip": ".db.gz", "zstd": ".db.zst"}
+BACKUP_STAMP = "%Y%m%d_%H%M%S_%f"   # written to the millisecond
+
+class _BackupRestarted(Exception):
+    pass
+
+def backup_settings(settings=None):
+    """The backup_* settings, with the defaults filled in."""
+    settings = _assets.settings() if settings is None else settings
+
+    def number(key, default):
+        try:
+            return float(settings.get(key) or default)
+        except ValueError:
+            return default
+    return {"dir": str(Path(settings.get("backup_dir") or DATA_DIR / "backups")),
+            "interval_hours": number("backup_interval_hours", BACKUP_INTERVAL_HOURS),
+            "keep": max(1, int(number("backup_keep", BACKUP_KEEP))),
+            "keep_months": max(0, int(number("backup_keep_months", BACKUP_KEEP_MONTHS))),
+            "compression": settings.get("backup_compression") or "gzip"}
+
+def backup_codecs():
+    """The compressions available here; zstd needs the zstandard package."""
+    import importlib.util
+    return [c for c in BACKUP_CODECS if c != "zstd" or importlib.util.find_spec("zstandard")]
+
+def _backup_codec(path):
+    return next((codec for codec, suffix in BACKUP_CODECS.items() if path.name.endswith(suffix)), None)
+
+def _backup_open(path, mode, codec):
+    """Binary file object (de)compressing `path` with `codec`."""
+    if codec == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd backups need the zstandard package: pip install zstandard") from None
+        if "w" in mode:
+            return zstandard.open(path, mode, cctx=zstandard.ZstdCompressor(level=BACKUP_ZSTD_LEVEL,
+                                                                            write_checksum=True))
+        return zstandard.open(path, mode)
+    if codec == "gzip":
+        import gzip
+        return gzip.open(path, mode, compresslevel=BACKUP_GZIP_LEVEL)
+    raise ValueError(f"Unknown backup compression: {codec}")
+
+def _pump(src, dst=None, progress=None):
+    """Copy src to dst (or only read it) in BACKUP_CHUNK pieces; returns the sha256 of the bytes."""
+    digest = hashlib.sha256()
+    done = 0
+    while chunk := src.read(BACKUP_CHUNK):
+        digest.update(chunk)
+        if dst is not None:
+            dst.write(chunk)
+        done += len(chunk)
+        if progress: progress(done)
+    return digest.hexdigest()
+
+def _stage(progress, lo, hi):
+    """progress(done, total) for one stage of a job reported as 0-100 overall."""
+    if progress is None:
+        return None
+    return lambda done, total: progress(lo + (hi - lo) * done // max(total, 1), 100)
+
+def _copy_live_db(target, progress=None):
+    """Copy the live database into the new file `target` with the backup API.
+
+    A write by another connection between two steps restarts the copy; after
+    BACKUP_MAX_RESTARTS the rest is copied in one step, which in WAL mode
+    still holds no more than a read transaction.
+    """
+    state = {"remaining": None, "restarts": 0, "done": 0}
+
+    def step(status, remaining, total):
+        if state["remaining"] is not None and remaining >= state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state["remaining"] = remaining
+        state["done"] = max(state["done"], total - remaining)
+        if progress: progress(state["done"], total)
+
+    with get_db() as conn:
+        dst = sqlite3.connect(target)
+        try:
+            try:
+                conn.backup(dst, pages=BACKUP_STEP_PAGES, progress=step)
+            except _BackupRestarted:
+                conn.backup(dst)
+            dst.execute("PRAGMA journal_mode=DELETE")    # one self-contained file
+        finally:
+            dst.close()
+    return state["restarts"]
+
+def inspect_db_copy(path):
+    """Integrity-check a database file nobody else has open; returns its schema version and invoice count."""
+    conn = sqlite3.connect(path)
+    try:
+        problems = [r[0] for r in conn.execute("PRAGMA integrity_check")]
+        if problems != ["ok"]:
+            raise RuntimeError(f"{Path(path).name} failed the integrity check: {'; '.join(problems[:5])}")
+        version = schema_version(conn)
+        invoices = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] if version else None
+    finally:
+        conn.close()
+    if version > len(MIGRATIONS):
+        raise ValueError(f"{Path(path).name} has schema version {version}, newer than this app ({len(MIGRATIONS)})")
+    return {"schema_version": version, "invoices": invoices}
+
+def _write_backup(raw, path, codec, progress=None):
+    """Compress the file `raw` into `path`, then read it back and compare before it takes the name."""
+    size = raw.stat().st_size
+    part = path.with_name(path.name + ".part")
+    try:
+        with open(raw, "rb") as src, _backup_open(part, "wb", codec) as out:
+            written = _pump(src, out, progress and (lambda n: progress(n, 2 * size)))
+        with _backup_open(part, "rb", codec) as src:
+            if _pump(src, None, progress and (lambda n: progress(size + n, 2 * size))) != written:
+                raise RuntimeError(f"{path.name} reads back differently from what was written")
+        if path.exists():    # a snapshot is never replaced
+            raise FileExistsError(f"{path.name} exists already")
+        os.replace(part, path)
+    finally:
+        part.unlink(missing_ok=True)
+    return path.stat().st_size
+
+def _reserve_backup_path(folder, codec):
+    """A new snapshot name, stamped to the millisecond; its .part file is
+    created right away so no other backup can pick the same name."""
+    now = datetime.now()
+    while True:
+        path = folder / f"{DB_PATH.stem}_{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}{BACKUP_CODECS[codec]}"
+        if not path.exists():
+            try:
+                path.with_name(path.name + ".part").open("xb").close()
+                return path
+            except FileExistsError:
+                pass
+        now += timedelta(milliseconds=1)
+
+def _expand_backup(path, target, progress=None):
+    """Decompress the snapshot `path` into the file `target`."""
+    codec = _backup_codec(path)
+    if codec is None:
+        raise ValueError(f"Not a backup file: {path.name}")
+    size = path.stat().st_size
+    try:
+        with open(path, "rb") as raw, _backup_open(raw, "rb", codec) as src, open(target, "wb") as dst:
+            _pump(src, dst, progress and (lambda n: progress(min(raw.tell(), size), size)))
+    except ValueError:
+        target.unlink(missing_ok=True)
+        raise
+    except Exception as e:      # truncated or damaged: gzip, zlib and zstd each raise their own
+        target.unlink(missing_ok=True)
+        raise RuntimeError(f"{path.name} cannot be decompressed: {e}") from e
+    return target
+
+def backup_db(codec=None, prune=True, progress=None):
+    """Write a checked, compressed snapshot of the live database to the backup folder.
+
+    Returns its file name and size, the schema version and invoice count it
+    holds, the archive files stored alongside for the first time and the
+    snapshots the retention policy removed.
+    """
+    conf = backup_settings()
+    codec = codec or conf["compression"]
+    if codec not in BACKUP_CODECS:
+        raise ValueError(f"Unknown backup compression: {codec}")
+    folder = Path(conf["dir"])
+    folder.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    path = _reserve_backup_path(folder, codec)
+    raw = DB_PATH.with_name(f".{path.name}.tmp")
+    try:
+        restarts = _copy_live_db(raw, _stage(progress, 0, 40))
+        info = inspect_db_copy(raw)
+        db_bytes = raw.stat().st_size
+        size = _write_backup(raw, path, codec, _stage(progress, 40, 100))
+    finally:
+        raw.unlink(missing_ok=True)
+        path.with_name(path.name + ".part").unlink(missing_ok=True)
+    archives = _backup_archives(folder, codec)
+    removed = prune_backups(conf["keep"], conf["keep_months"], folder) if prune else []
+    return dict(info, success=True, file=path.name, path=str(path), codec=codec, bytes=size,
+                db_bytes=db_bytes, restarts=restarts, archives=archives, removed=removed,
+                seconds=round(time.perf_counter() - started, 3))
+
+def _backup_archives(folder, codec):
+    """Store every archived year not yet in folder/archives; returns the file names stored now."""
+    stored = []
+    with get_db() as conn:
+        names = [r[0] for r in conn.execute("SELECT file FROM archived_years ORDER BY year")]
+    for name in names:
+        source = DB_PATH.with_name(name)
+        copies = [folder / "archives" / (Path(name).stem + suffix) for suffix in BACKUP_CODECS.values()]
+        if not source.exists() or any(c.exists() for c in copies):
+            continue
+        copies[0].parent.mkdir(exist_ok=True)
+        _write_backup(source, folder / "archives" / (Path(name).stem + BACKUP_CODECS[codec]), codec)
+        stored.append(name)
+    return stored
+
+def _restore_archives(folder):
+    """Put back archive files the (restored) database lists but that are missing next to it."""
+    restored = []
+    with get_db() as conn:
+        names = [r[0] for r in conn.execute("SELECT file FROM archived_years ORDER BY year")]
+    for name in names:
+        target = DB_PATH.with_name(name)
+        copy = next((c for c in (folder / "archives" / (Path(name).stem + s) for s in BACKUP_CODECS.values())
+                     if c.exists()), None)
+        if target.exists() or copy is None:
+            continue
+        tmp = _expand_backup(copy, target.with_name(target.name + ".tmp"))
+        try:
+            inspect_db_copy(tmp)
+            os.replace(tmp, target)
+        finally:
+            tmp.unlink(missing_ok=True)
+        restored.append(name)
+    return restored
+
+def list_backups(folder=None):
+    """Snapshots in the backup folder, newest first."""
+    folder = Path(folder or backup_settings()["dir"])
+    prefix = DB_PATH.stem + "_"
+    rows = []
+    for path in folder.glob(prefix + "*"):
+        codec = _backup_codec(path)
+        if codec is None:
+            continue
+        try:
+            created = datetime.strptime(path.name[len(prefix):-len(BACKUP_CODECS[codec])], BACKUP_STAMP)
+        except ValueError:
+            continue
+        rows.append({"file": path.name, "codec": codec, "bytes": path.stat().st_size,
+                     "created": created.isoformat()})
+    rows.sort(key=lambda r: r["created"], reverse=True)
+    return rows
+
+def backup_file(name):
+    """Path of the snapshot called `name` in the backup folder."""
+    path = Path(backup_settings()["dir"]) / Path(name).name
+    if _backup_codec(path) is None or not path.is_file():
+        raise ValueError(f"Backup not found: {name}")
+    return path
+
+def prune_backups(keep=BACKUP_KEEP, keep_months=BACKUP_KEEP_MONTHS, folder=None):
+    """Delete the snapshots outside the retention policy: all but the newest
+    `keep`, and the newest of each of the last `keep_months` months."""
+    folder = Path(folder or backup_settings()["dir"])
+    today = date.today()
+    this_month = today.year * 12 + today.month - 1
+    months, removed = set(), []
+    for i, b in enumerate(list_backups(folder)):
+        created = datetime.fromisoformat(b["created"])
+        month = created.year * 12 + created.month - 1
+        if i < max(1, keep) or (month not in months and this_month - month < keep_months):
+            months.add(month)
+            continue
+        (folder / b["file"]).unlink(missing_ok=True)
+        removed.append(b["file"])
+    return removed
+
+def verify_backup(path, progress=None):
+    """Decompress a snapshot to a scratch file and integrity-check it."""
+    path = Path(path)
+    scratch = _expand_backup(path, DB_PATH.with_name(f".{path.name}.verify"), _stage(progress, 0, 50))
+    try:
+        return dict(inspect_db_copy(scratch), success=True, file=path.name, bytes=path.stat().st_size)
+    finally:
+        scratch.unlink(missing_ok=True)
+
+def restore_backup(path, progress=None):
+    """Replace the contents of the live database with the snapshot at `path`.
+
+    The snapshot is decompressed and integrity-checked first, and a snapshot
+    of the current state is taken so the restore can itself be undone. The
+    pages are copied in with the backup API under the write lock: readers on
+    other connections keep their view until the copy commits. Afterwards the
+    live database is migrated if the snapshot is older, and must pass the
+    integrity check with as many invoices as the snapshot, or this raises.
+    """
+    path = Path(path)
+    scratch = _expand_backup(path, DB_PATH.with_name(f".{path.name}.restore"), _stage(progress, 0, 20))
+    try:
+        expected = inspect_db_copy(scratch)
+        undo = backup_db(prune=False, progress=_stage(progress, 20, 60))
+        copied = _stage(progress, 60, 100)
+        src = sqlite3.connect(scratch)
+        try:
+            with _pool._write_lock, get_db() as conn:
+                src.backup(conn, pages=BACKUP_STEP_PAGES,
+                           progress=copied and (lambda status, remaining, total: copied(total - remaining, total)))
+        finally:
+            src.close()
+    finally:
+        scratch.unlink(missing_ok=True)
+    with get_db() as conn:
+        migrate(conn)
+        problems = [r[0] for r in conn.execute("PRAGMA quick_check")]
+        invoices = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+    archives = _restore_archives(Path(undo["path"]).parent)
+    _assets.invalidate()
+    _render_cache.invalidate()
+    _analytics.invalidate()
+    if problems != ["ok"] or invoices != (expected["invoices"] or 0):
+        raise RuntimeError(f"Restored database does not match {path.name} "
+                           f"({invoices} invoices, check: {'; '.join(problems[:5])}); "
+                           f"the previous state is in {undo['file']}")
+    return {"success": True, "file": path.name, "schema_version": expected["schema_version"],
+            "invoices": invoices, "archives": archives, "undo": undo["file"]}
+
+
+class BackupScheduler:
+    """Starts the "backup" job whenever the newest snapshot is older than the
+    backup_interval_hours setting. Runs on a daemon thread from App.run and
+    `serve`; a run that fails is tried again at the next check."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def due(self):
+        conf = backup_settings()
+        if conf["interval_hours"] <= 0:
+            return False
+        backups = list_backups(conf["dir"])
+        return not backups or datetime.now() - datetime.fromisoformat(backups[0]["created"]) \
+            >= timedelta(hours=conf["interval_hours"])
+
+    def _run(self):
+        delay = BACKUP_FIRST_CHECK
+        while not self._stop.wait(delay):
+            delay = BACKUP_CHECK_INTERVAL
+            try:
+                if self.due():
+                    _jobs.submit("backup", JOB_KINDS["backup"])
+            except Exception:
+                pass   # e.g. the backup folder is on a drive that is not connected
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="backup-schedule", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+
+_backup_schedule = BackupScheduler()
+
+LIST_PAGE_SIZE = 100
+SEARCH_LIMIT = 200
+SEARCH_MARK = ("\x02", "\x03")   # around matches in search results; see highlightHtml() in index.html
+
+def fts_query(text):
+    """Turn free user input into an FTS5 query: every word must match as a prefix."""
+    words = re.findall(r"\w+", text or "")
+    return " ".join(f'"{w}"*' for w in words)
 
 def fmt_euro(val):
     """Format float as Dutch euro string: 1234.56 -> 1.234,56"""
     return f"{val:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
+class Logo:
+    """The uploaded logo, read once: raw bytes, data URI and a parsed reportlab image."""
+
+    def __init__(self, raw, ext):
+        self.raw = raw
+        self.ext = ext
+        self.digest = hashlib.sha256(raw).hexdigest()
+        self._data_uri = None
+        self._reader = None
+
+    @property
+    def data_uri(self):
+        if self._data_uri is None:
+            import base64
+            self._data_uri = f"data:image/{self.ext};base64,{base64.b64encode(self.raw).decode()}"
+        return self._data_uri
+
+    def reader(self):
+        if self._reader is None:
+            import io
+            from reportlab.lib.utils import ImageReader
+            self._reader = ImageReader(io.BytesIO(self.raw))
+        return self._reader
+
+    def __getstate__(self):
+        # Sent to PDF worker processes; the ImageReader is rebuilt there.
+        return {"raw": self.raw, "ext": self.ext, "digest": self.digest,
+                "_data_uri": None, "_reader": None}
+
+
+def logo_data_uri(logo):
+    """Templates accept a Logo or a data-URI string (older callers)."""
+    return logo.data_uri if isinstance(logo, Logo) else logo
+
+
+# Uploaded logos are checked and scaled down once, when they are uploaded:
+# the print copy covers the largest box a template draws the logo in
+# (160 x 52 pt in the HTML invoice, 44 x 18 mm in the PDF) at 300 dpi, the
+# preview copy the settings page and the preview modal at 2x screen size.
+# The original is kept next to them.
+LOGO_MAX_BYTES = 20 * 1024 * 1024
+LOGO_MAX_PIXELS = 50_000_000
+LOGO_UPLOAD_CHUNK = 512 * 1024
+LOGO_FORMATS = ("PNG", "JPEG", "GIF", "WEBP", "BMP")
+LOGO_SIZES = {"print": (670, 220), "preview": (380, 150)}
+LOGO_SETTINGS = {"print": "logo_path", "preview": "logo_preview_path", "original": "logo_original_path"}
+
+def store_logo(source):
+    """Validate the image at `source` and write the original and its print and
+    preview copies to UPLOADS_DIR; returns the logo_* settings to save.
+
+    Raises ValueError for files that are too large or not a supported image.
+    """
+    from PIL import Image, ImageOps
+    source = Path(source)
+    if source.stat().st_size > LOGO_MAX_BYTES:
+        raise ValueError(f"Logo is larger than {LOGO_MAX_BYTES // (1024 * 1024)} MB")
+    try:
+        with Image.open(source) as im:
+            if im.format not in LOGO_FORMATS:
+                raise ValueError(f"Unsupported logo format: {im.format}")
+            if im.width * im.height > LOGO_MAX_PIXELS:
+                raise ValueError(f"Logo is too large: {im.width} x {im.height} pixels")
+            im.verify()
+        with Image.open(source) as im:
+            im.load()
+            fmt = im.format
+            im = ImageOps.exif_transpose(im)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Not a readable image: {e}")
+
+    # JPEG photos stay JPEG; everything else (transparency, palettes) becomes PNG
+    if fmt == "JPEG":
+        ext, im, save = "jpg", im.convert("RGB"), {"format": "JPEG", "quality": 90, "optimize": True}
+    else:
+        alpha = im.mode in ("RGBA", "LA", "PA") or "transparency" in im.info
+        ext, im, save = "png", im.convert("RGBA" if alpha else "RGB"), {"format": "PNG", "optimize": True}
+
+    paths = {"original": UPLOADS_DIR / f"logo_original.{'jpg' if fmt == 'JPEG' else fmt.lower()}"}
+    tmp = UPLOADS_DIR / f".logo-{uuid.uuid4().hex}"
+    shutil.copyfile(source, tmp)
+    os.replace(tmp, paths["original"])
+    for kind, box in LOGO_SIZES.items():
+        copy = im.copy()
+        copy.thumbnail(box, Image.LANCZOS)     # only ever shrinks
+        paths[kind] = UPLOADS_DIR / f"logo_{kind}.{ext}"
+        copy.save(tmp, **save)
+        os.replace(tmp, paths[kind])
+    # drop copies of an earlier logo with another extension
+    for old in UPLOADS_DIR.glob("logo*.*"):
+        if old not in paths.values():
+            old.unlink(missing_ok=True)
+    return {LOGO_SETTINGS[kind]: str(path) for kind, path in paths.items()}
+
+def use_logo(logo_settings):
+    """Save the settings from store_logo() and drop what was rendered with the old logo."""
+    with db_transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)",
+                         list(logo_settings.items()))
+    _assets.invalidate()
+    _render_cache.invalidate()
+
+
+class LogoUploads:
+    """Logo uploads arriving in chunks over the bridge (or the HTTP API).
+
+    Each upload is written to a .part file in UPLOADS_DIR; chunks must arrive
+    in order, and a chunk may be sent again after a failed call.
+    """
+
+    STALE_SECONDS = 3600
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uploads = {}
+
+    def begin(self, size):
+        if size > LOGO_MAX_BYTES:
+            raise ValueError(f"Logo is larger than {LOGO_MAX_BYTES // (1024 * 1024)} MB")
+        for old in UPLOADS_DIR.glob(".upload-*.part"):
+            try:
+                if time.time() - old.stat().st_mtime > self.STALE_SECONDS:
+                    old.unlink()
+            except OSError:
+                pass
+        upload_id = uuid.uuid4().hex
+        path = UPLOADS_DIR / f".upload-{upload_id}.part"
+        path.write_bytes(b"")
+        with self._lock:
+            self._uploads[upload_id] = {"path": path, "size": size, "received": 0}
+        return upload_id
+
+    def _get(self, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise ValueError("Unknown upload")
+        return upload
+
+    def write(self, upload_id, offset, data):
+        upload = self._get(upload_id)
+        if offset > upload["received"]:
+            raise ValueError(f"Chunk at {offset} arrived before {upload['received']}")
+        if offset + len(data) > upload["size"]:
+            raise ValueError("More data than announced")
+        with open(upload["path"], "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+        upload["received"] = offset + len(data)
+        return upload["received"]
+
+    def finish(self, upload_id):
+        """Store the completed upload as the logo; returns the logo_* settings."""
+        upload = self._get(upload_id)
+        try:
+            if upload["received"] != upload["size"]:
+                raise ValueError(f"Upload incomplete: {upload['received']} of {upload['size']} bytes")
+            return store_logo(upload["path"])
+        finally:
+            self.abort(upload_id)
+
+    def abort(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload:
+            upload["path"].unlink(missing_ok=True)
+
+
+_logo_uploads = LogoUploads()
+
+
+class AssetCache:
+    """Settings and logo kept in memory between renders.
+
+    Settings are reloaded after invalidate() (save_settings/upload_logo); the
+    logo is additionally re-read whenever its file's mtime or size changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._settings = None
+        self._logos = {}     # kind -> (stamp, Logo)
+        self.version = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._settings = None
+            self._logos = {}
+            self.version += 1
+
+    def settings(self):
+        with self._lock:
+            if self._settings is None:
+                with get_db() as conn:
+                    self._settings = {r["key"]: r["value"]
+                                      for r in conn.execute("SELECT key, value FROM settings")}
+            return dict(self._settings)
+
+    def logo(self, kind="print"):
+        """The print copy of the logo (PDFs, invoice HTML), or kind="preview" for the UI."""
+        settings = self.settings()
+        path = settings.get(LOGO_SETTINGS[kind]) or settings.get("logo_path")
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            st = None
+        if st is None:
+            return None
+        stamp = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._logos.get(kind)
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, Logo(Path(path).read_bytes(), Path(path).suffix.lstrip(".")))
+                self._logos[kind] = cached
+            return cached[1]
+
+
+_assets = AssetCache()
+
+
+# Settings keys that end up in rendered invoices (see build_invoice_html /
+# generate_pdf_reportlab). Cache keys also hold a digest of the code and
+# templates in RENDER_CODE, so a changed renderer never serves an old file;
+# bump RENDER_VERSION for what that digest can't see (e.g. a reportlab upgrade).
+TEMPLATE_SETTING_KEYS = ("company_name", "address", "postal", "city", "phone", "email",
+                         "website", "kvk", "btw_number", "support_email")
+RENDER_VERSION = 1
+RENDER_CODE = ("fmt_euro", "logo_data_uri", "Logo", "InvoicePdfRenderer", "pdf_renderer",
+               "generate_pdf_reportlab", "HtmlTemplate", "INVOICE_TEMPLATE", "INVOICE_ITEM_ROW",
+               "INVOICE_BESTELNR_ROW", "INVOICE_NOTES", "invoice_template", "build_invoice_html")
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_render_code = {"digest": None}
+
+def render_code_digest():
+    """sha256 over the bytecode and constants of RENDER_CODE, computed once.
+
+    Line numbers are left out, so edits elsewhere in this file keep the cache.
+    """
+    if _render_code["digest"] is None:
+        import types
+        h = hashlib.sha256()
+
+        def add(obj):
+            if isinstance(obj, types.CodeType):
+                h.update(obj.co_code)
+                h.update(repr(obj.co_names).encode())
+                for const in obj.co_consts:
+                    add(const)
+            elif isinstance(obj, types.FunctionType):
+                add(obj.__code__)
+            elif isinstance(obj, (staticmethod, classmethod)):
+                add(obj.__func__)
+            elif isinstance(obj, property):
+                add(obj.fget); add(obj.fset)
+            elif isinstance(obj, type):
+                for name, value in sorted(vars(obj).items()):
+                    h.update(name.encode())
+                    add(value)
+            elif isinstance(obj, HtmlTemplate):
+                add(obj._first); add(obj._slots)
+            elif isinstance(obj, (tuple, list)):
+                for item in obj:
+                    add(item)
+            elif isinstance(obj, frozenset):
+                h.update(repr(sorted(obj, key=repr)).encode())
+            elif isinstance(obj, (str, bytes, int, float, complex, type(None), type(...))):
+                h.update(repr(obj).encode())
+
+        for name in RENDER_CODE:
+            h.update(name.encode())
+            add(globals()[name])
+        _render_code["digest"] = h.hexdigest()
+    return _render_code["digest"]
+
+def template_settings_key(settings, logo=None):
+    """Cache key for what is built once per settings: the template settings
+    and the logo (by digest)."""
+    return (tuple(settings.get(k) for k in TEMPLATE_SETTING_KEYS),
+            logo.digest if isinstance(logo, Logo) else logo)
+
+
+class RenderCache:
+    """Content-addressed cache of rendered invoice files in DATA_DIR/cache.
+
+    The key hashes the invoice row, the template settings and the logo, so an
+    unchanged invoice is served from disk without re-rendering. Files are
+    named <invoice>_<key> so all renders of one invoice can be dropped at
+    once; the least recently used files are evicted beyond max_bytes.
+    """
+
+    def __init__(self, root, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(inv, settings, logo):
+        if isinstance(logo, Logo):
+            logo_hash = logo.digest
+        else:
+            logo_hash = hashlib.sha256(logo.encode() if isinstance(logo, str) else (logo or b"")).hexdigest()
+        payload = {"v": RENDER_VERSION, "code": render_code_digest(), "inv": inv, "logo": logo_hash,
+                   "settings": {k: settings.get(k) for k in TEMPLATE_SETTING_KEYS}}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:40]
+
+    @staticmethod
+    def _prefix(inv_id):
+        return hashlib.sha1(str(inv_id).encode()).hexdigest()[:16]
+
+    def _path(self, inv_id, key, ext):
+        return self.root / f"{self._prefix(inv_id)}_{key}.{ext}"
+
+    def get(self, inv_id, key, ext):
+        path = self._path(inv_id, key, ext)
+        try:
+            os.utime(path)           # mtime doubles as the LRU clock
+        except OSError:
+            return None
+        return path
+
+    def put(self, inv_id, key, ext, data):
+        """Store bytes/str (or copy the file at a Path) and return the cache path."""
+        self.root.mkdir(exist_ok=True)
+        path = self._path(inv_id, key, ext)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        if isinstance(data, Path):
+            shutil.copyfile(data, tmp)
+        else:
+            tmp.write_bytes(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp, path)
+        self.evict()
+        return path
+
+    def invalidate(self, inv_id=None):
+        """Drop the renders of one invoice, or everything (settings/logo changed)."""
+        pattern = f"{self._prefix(inv_id)}_*" if inv_id is not None else "*_*.*"
+        for path in self.root.glob(pattern):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def evict(self):
+        with self._lock:
+            try:
+                entries = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                           for e in os.scandir(self.root) if e.is_file()]
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+_render_cache = RenderCache(DATA_DIR / "cache")
+
+
+# ── analytics snapshot ───────────────────────────────────────────
+# The invoice header columns as NumPy arrays, for ad-hoc group-by and top-N
+# questions (top customers, revenue per city, BTW rate mix) without scanning
+# `invoices` for each one. Amounts are integer cents, dates day ordinals
+# (date.toordinal(), 0 = no usable date) plus year * 12 + month - 1 for the
+# period groupings, and text columns dictionary codes.
+# refresh() follows the invoice_changes log, so after the first load only
+# changed invoices are read again.
+ANALYTICS_DIMENSIONS = ("purpose", "customer", "city", "country", "btw_pct",
+                        "year", "quarter", "month", "weekday")
+ANALYTICS_METRICS = ("revenue", "count", "btw", "subtotaal", "average")
+ANALYTICS_CHUNK = 50000
+_ANALYTICS_CODED = ("purpose", "customer", "city", "country", "btw_pct")
+_ANALYTICS_COLUMNS = (("rowid", "int64"), ("day", "int32"), ("month", "int32"), ("timed", "bool"),
+                      ("purpose", "int32"), ("customer", "int32"), ("city", "int32"),
+                      ("country", "int32"), ("btw_pct", "int32"),
+                      ("revenue", "int64"), ("btw", "int64"), ("subtotaal", "int64"))
+# A customer is identified by company, or by name for private customers.
+CUSTOMER_KEY_SQL = "COALESCE(NULLIF(customer_company, ''), customer_name, '')"
+_ANALYTICS_SELECT = f"""SELECT rowid, substr(COALESCE(date, ''), 1, 10),
+    COALESCE(length(date), 0) > 10, COALESCE(purpose, ''), {CUSTOMER_KEY_SQL},
+    COALESCE(customer_city, ''), COALESCE(customer_country, ''), COALESCE(btw_pct, 0),
+    {_cents('totaal')}, {_cents('btw_amount')}, {_cents('subtotaal')} FROM invoices"""
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+class AnalyticsSnapshot:
+    """Columnar copy of the invoice headers, answering query() with NumPy.
+
+    A snapshot is (columns, codes): `columns` maps names to equal-length
+    arrays and is replaced, never modified, on refresh; `codes` maps each
+    coded column to {value: code} and only ever grows, so a query can keep
+    looking codes up in the snapshot it started with while another thread
+    refreshes. Anything that iterates `codes` gets a copy from refresh().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path = None
+        self._seq = 0
+        self._snapshot = None
+
+    def invalidate(self):
+        """Forget the snapshot, e.g. after the database was restored from a backup."""
+        with self._lock:
+            self._snapshot = None
+
+    def _read(self, conn, codes, where="", params=()):
+        import numpy as np
+        parts = []
+        cur = conn.execute(_ANALYTICS_SELECT + where, params)
+        while True:
+            rows = cur.fetchmany(ANALYTICS_CHUNK)
+            if not rows:
+                break
+            rowid, day, timed, *coded, revenue, btw, subtotaal = zip(*rows)
+            part = {"rowid": np.array(rowid, dtype=np.int64), "timed": np.array(timed, dtype=bool),
+                    "revenue": np.array(revenue, dtype=np.int64), "btw": np.array(btw, dtype=np.int64),
+                    "subtotaal": np.array(subtotaal, dtype=np.int64)}
+            for name, values in zip(_ANALYTICS_CODED, coded):
+                lookup = codes[name]
+                part[name] = np.array([lookup.setdefault(v, len(lookup)) for v in values], dtype=np.int32)
+            # a few thousand distinct days: convert each once, then index
+            distinct = {}
+            index = np.array([distinct.setdefault(v, len(distinct)) for v in day], dtype=np.int32)
+            calendar = np.array([self._calendar(v) for v in distinct], dtype=np.int32).reshape(-1, 2)
+            part["day"], part["month"] = calendar[index, 0], calendar[index, 1]
+            parts.append(part)
+        return self._concat(parts)
+
+    @staticmethod
+    def _calendar(day):
+        try:
+            d = date.fromisoformat(day)
+        except ValueError:
+            return 0, 0
+        return d.toordinal(), d.year * 12 + d.month - 1
+
+    @staticmethod
+    def _concat(parts):
+        import numpy as np
+        return {name: np.concatenate([p[name] for p in parts] or [np.empty(0, dtype)])
+                for name, dtype in _ANALYTICS_COLUMNS}
+
+    def refresh(self, labels=()):
+        """The current (columns, codes, {name: labels in code order}), re-reading
+        only invoices changed since the last call. The labels of the coded
+        columns named in `labels` are copied while no other refresh can add codes."""
+        with self._lock:
+            columns, codes = self._refresh()
+            return columns, codes, {name: list(codes[name]) for name in labels}
+
+    def _refresh(self):
+        import numpy as np
+        with db_transaction(write=False) as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='invoice_changes'").fetchone()
+            latest = row[0] if row else 0
+            if self._snapshot is not None and self._path == str(DB_PATH):
+                if latest == self._seq:
+                    return self._snapshot
+                oldest = conn.execute("SELECT MIN(seq) FROM invoice_changes").fetchone()[0]
+                if oldest is not None and oldest <= self._seq + 1:
+                    changed = {r[0] for r in conn.execute(
+                        "SELECT invoice_rowid FROM invoice_changes WHERE seq > ?", (self._seq,))}
+                    if None not in changed:
+                        columns, codes = self._snapshot
+                        changed = np.fromiter(changed, np.int64, len(changed))
+                        keep = ~np.isin(columns["rowid"], changed)
+                        parts = [columns if keep.all() else {name: col[keep] for name, col in columns.items()}]
+                        for i in range(0, len(changed), 500):
+                            chunk = changed[i:i + 500].tolist()
+                            parts.append(self._read(conn, codes, f" WHERE rowid IN ({','.join('?' * len(chunk))})",
+                                                    chunk))
+                        self._snapshot = (self._concat(parts), codes)
+                        self._seq = latest
+                        return self._snapshot
+            codes = {name: {} for name in _ANALYTICS_CODED}
+            self._snapshot = (self._read(conn, codes), codes)
+            self._path, self._seq = str(DB_PATH), latest
+            return self._snapshot
+
+    def query(self, group_by=None, filters=None, metric="revenue", top=None):
+        """Totals over the filtered invoices, optionally per group.
+
+        `filters` are the usual purpose/date_from/date_to (YYYY, YYYY-MM or
+        YYYY-MM-DD, with the same bounds as get_invoices()). Groups come back largest
+        first by `metric`, or in calendar order for the date dimensions;
+        `top` keeps the first N by `metric` and sums the rest into "other".
+        """
+        import numpy as np
+        if group_by is not None and group_by not in ANALYTICS_DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {group_by}")
+        if metric not in ANALYTICS_METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        columns, codes, labels = self.refresh([group_by] if group_by in _ANALYTICS_CODED else ())
+        mask = self._mask(columns, codes, filters or {})
+        if mask.all():
+            mask = slice(None)          # no filter: views instead of copies
+        money = {m: columns[m][mask] for m in ("revenue", "btw", "subtotaal")}
+        total = self._stats(len(money["revenue"]), *(int(v.sum()) for v in money.values()))
+        result = {"success": True, "group_by": group_by, "metric": metric, "total": total}
+        if group_by is None:
+            return result
+
+        if group_by in codes:
+            keys, labels = columns[group_by][mask], labels[group_by]
+            size = len(labels)
+        else:
+            keys, label = self._periods(columns["day"][mask], columns["month"][mask], group_by)
+            size = int(keys.max()) + 1 if len(keys) else 0
+        count = np.bincount(keys, minlength=size)
+        sums = [np.bincount(keys, weights=v, minlength=size) for v in money.values()]
+        present = np.flatnonzero(count)
+        score = {"count": count, "revenue": sums[0], "btw": sums[1], "subtotaal": sums[2]}.get(metric)
+        if score is None:
+            score = sums[0] / np.maximum(count, 1)
+        if top is not None and int(top) < len(present):
+            picked = np.argpartition(-score[present], int(top))[:int(top)]
+            present = present[picked]
+        if group_by in codes:
+            present = present[np.argsort(-score[present], kind="stable")]
+        else:
+            present.sort()
+        result["groups"] = [
+            {"key": labels[k] if group_by in codes else label(k),
+             **self._stats(int(count[k]), *(int(s[k]) for s in sums), total["revenue"])}
+            for k in present.tolist()]
+        if len(present) < np.count_nonzero(count):
+            rest = [int(count.sum() - count[present].sum())] + [int(s.sum() - s[present].sum()) for s in sums]
+            result["other"] = self._stats(*rest, total["revenue"])
+        return result
+
+    @staticmethod
+    def _mask(columns, codes, filters):
+        import numpy as np
+        mask = np.ones(len(columns["rowid"]), dtype=bool)
+        purpose = filters.get("purpose")
+        if purpose not in (None, "", "all"):
+            mask &= columns["purpose"] == codes["purpose"].get(purpose, -1)
+        # the bounds compare like invoice_filter_sql()'s strings, partial ones included
+        if filters.get("date_from"):
+            mask &= columns["day"] >= AnalyticsSnapshot._first_day(filters["date_from"])
+        if filters.get("date_to"):
+            bound = filters["date_to"]
+            last = AnalyticsSnapshot._first_day(bound)
+            if len(bound) < 10:
+                # every date in "2024-03" sorts after "2024-03": the period itself is left out
+                mask &= columns["day"] < last
+            else:
+                # "2024-03-07 14:30" > "2024-03-07" as strings, so get_invoices()
+                # leaves invoices with a time on the last day out; so do we
+                mask &= (columns["day"] < last) | ((columns["day"] == last) & ~columns["timed"])
+        return mask
+
+    @staticmethod
+    def _first_day(bound):
+        """Ordinal of the first day of a YYYY, YYYY-MM or YYYY-MM-DD filter bound."""
+        return date.fromisoformat(bound + {4: "-01-01", 7: "-01"}.get(len(bound), "")).toordinal()
+
+    @staticmethod
+    def _periods(day, month, bucket):
+        """(group index per invoice, index -> label); index 0 collects invoices without a date."""
+        import numpy as np
+        dated = day > 0
+        if bucket == "weekday":
+            return np.where(dated, (day + 6) % 7 + 1, 0), lambda k: _WEEKDAYS[k - 1] if k else ""
+        key = month // {"year": 12, "quarter": 3, "month": 1}[bucket]
+        lo = int(key[dated].min()) if dated.any() else 0
+
+        def label(k):
+            if not k:
+                return ""
+            n = lo + k - 1
+            if bucket == "year":
+                return str(n)
+            if bucket == "quarter":
+                return f"{n // 4}-Q{n % 4 + 1}"
+            return f"{n // 12}-{n % 12 + 1:02d}"
+        return np.where(dated, key - lo + 1, 0), label
+
+    @staticmethod
+    def _stats(count, revenue_c, btw_c, subtotaal_c, total_revenue=None):
+        stats = {"count": count, "revenue": round(revenue_c / 100, 2), "btw": round(btw_c / 100, 2),
+                 "subtotaal": round(subtotaal_c / 100, 2),
+                 "average": round(revenue_c / 100 / count, 2) if count else 0.0}
+        if total_revenue is not None:
+            stats["share"] = round(stats["revenue"] / total_revenue, 4) if total_revenue else 0.0
+        return stats
+
+
+_analytics = AnalyticsSnapshot()
+
+
+@instrument_api
 class API:
     def get_settings(self):
-        conn = get_db()
-        rows = conn.execute("SELECT key, value FROM settings").fetchall()
-        conn.close()
-        return {r["key"]: r["value"] for r in rows}
+        return _assets.settings()
 
     def save_settings(self, data):
-        conn = get_db()
-        for k, v in data.items():
-            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", (k, str(v)))
-        conn.commit()
-        conn.close()
+        paths = sorted(set(data) & set(LOGO_SETTINGS.values()))
+        if paths:   # only ever written by use_logo(), from a checked upload
+            return {"success": False, "error": f"Not a setting: {', '.join(paths)}"}
+        with db_transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)",
+                             [(k, str(v)) for k, v in data.items()])
+        _assets.invalidate()
+        _render_cache.invalidate()
         return {"success": True}
 
-    def upload_logo(self, base64data, filename):
+    def upload_logo(self, base64data, filename=None):
+        """The whole file as one data URL; the UI sends large logos in chunks instead."""
         import base64 as b64
-        ext = filename.rsplit(".", 1)[-1].lower()
-        logo_path = UPLOADS_DIR / f"logo.{ext}"
-        data = base64data.split(",", 1)[-1]
-        with open(logo_path, "wb") as f:
-            f.write(b64.b64decode(data))
-        conn = get_db()
-        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?,?)", ("logo_path", str(logo_path)))
-        conn.commit()
-        conn.close()
-        return {"success": True}
+        try:
+            raw = b64.b64decode(base64data.split(",", 1)[-1])
+            upload_id = _logo_uploads.begin(len(raw))
+            _logo_uploads.write(upload_id, 0, raw)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return self.finish_logo_upload(upload_id)
 
-    def get_logo_base64(self):
+    def begin_logo_upload(self, size):
+        try:
+            return {"success": True, "upload_id": _logo_uploads.begin(int(size)),
+                    "chunk_size": LOGO_UPLOAD_CHUNK}
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+
+    def upload_logo_chunk(self, upload_id, offset, base64data):
         import base64 as b64
-        conn = get_db()
-        row = conn.execute("SELECT value FROM settings WHERE key='logo_path'").fetchone()
-        conn.close()
-        if not row:
-            return {"data": None}
-        path = Path(row["value"])
-        if not path.exists():
-            return {"data": None}
-        ext = path.suffix.lstrip(".")
-        with open(path, "rb") as f:
-            data = b64.b64encode(f.read()).decode()
-        return {"data": f"data:image/{ext};base64,{data}"}
+        try:
+            received = _logo_uploads.write(upload_id, int(offset), b64.b64decode(base64data.split(",", 1)[-1]))
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "received": received}
+
+    def finish_logo_upload(self, upload_id):
+        try:
+            use_logo(_logo_uploads.finish(upload_id))
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, **self.get_logo_base64()}
+
+    def upload_logo_file(self, path):
+        """Use an image file on this computer as the logo, read straight from disk."""
+        try:
+            use_logo(store_logo(path))
+        except (OSError, ValueError) as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, **self.get_logo_base64()}
+
+    def get_logo_base64(self):
+        logo = _assets.logo("preview")
+        return {"data": logo.data_uri if logo else None}
+
+    def bootstrap(self, purpose=""):
+        """Everything the UI needs for first paint, in one bridge call."""
+        startup_mark("bootstrap")
+        return {"settings": self.get_settings(), "factuurnummer": generate_factuurnummer(purpose),
+                "startup_probe": bool(STARTUP_PROBE)}
+
+    def startup_done(self):
+        """Called by the UI after bootstrap() when benchmark.py measures startup."""
+        startup_mark("interactive")
+        if STARTUP_PROBE:
+            Path(STARTUP_PROBE).write_text(json.dumps(_startup_marks), encoding="utf-8")
+            import webview
+            for window in list(webview.windows):
+                window.destroy()
 
     def new_invoice_number(self, purpose=""):
         return {"factuurnummer": generate_factuurnummer(purpose)}
 
+    def reserve_invoice_numbers(self, purpose="", count=1):
+        """Take a block of `count` numbers up front, e.g. for bulk creation."""
+        with db_transaction() as conn:
+            return {"numbers": reserve_invoice_numbers(conn, purpose, int(count))}
+
     def save_invoice(self, data):
-        conn = get_db()
         inv_id = data.get("id") or str(uuid.uuid4())
         now = datetime.now().isoformat()
         items = data.get("items", [])
-        items_json = json.dumps(items)
         btw_pct = float(data.get("btw_pct", 21))
-        # Price is INCL. BTW → total = sum(prijs * aantal), extract subtotaal
-        totaal = round(sum(float(i.get("prijs",0)) * float(i.get("aantal",0)) for i in items), 2)
-        subtotaal = round(totaal / (1 + btw_pct / 100), 2)
-        btw_amount = round(totaal - subtotaal, 2)
-        existing = conn.execute("SELECT id FROM invoices WHERE id=?", (inv_id,)).fetchone()
-        vals = (data.get("factuurnummer",""), data.get("date",""), data.get("due_date",""),
-                data.get("purpose",""), data.get("bestelnummer",""),
-                data.get("customer_company",""), data.get("customer_dept",""),
-                data.get("customer_address",""), data.get("customer_postal",""),
-                data.get("customer_city",""), data.get("customer_country","Netherlands"),
-                data.get("customer_phone",""), data.get("customer_email",""),
-                data.get("customer_kvk",""), data.get("customer_name",""),
-                items_json, subtotaal, btw_pct, btw_amount, totaal, data.get("notes",""))
-        if existing:
-            conn.execute('''UPDATE invoices SET factuurnummer=?,date=?,due_date=?,purpose=?,bestelnummer=?,
-                customer_company=?,customer_dept=?,customer_address=?,customer_postal=?,customer_city=?,
-                customer_country=?,customer_phone=?,customer_email=?,customer_kvk=?,customer_name=?,
-                items=?,subtotaal=?,btw_pct=?,btw_amount=?,totaal=?,notes=? WHERE id=?''',
-                vals + (inv_id,))
-        else:
-            conn.execute('''INSERT INTO invoices VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)''',
-                (inv_id,) + vals + (now,))
-        conn.commit()
-        conn.close()
-        return {"success": True, "id": inv_id, "totaal": totaal,
+        subtotaal, btw_amount, totaal = totals = invoice_totals(items, btw_pct)
+        vals = invoice_values(data, btw_pct, totals)
+        factuurnummer = data.get("factuurnummer", "")
+        with db_transaction() as conn:
+            closed = archived_year_of(conn, data.get("date"))
+            if closed:
+                return {"success": False, "error": f"{closed} is archived; invoices dated in it can no longer be saved"}
+            existing = conn.execute("SELECT factuurnummer FROM invoices WHERE id=?", (inv_id,)).fetchone()
+            # auto_number: the form shows a preview; take the real number now,
+            # unless this invoice already has one with the right prefix.
+            if (data.get("auto_number") or not factuurnummer) and not (
+                    existing and existing[0].startswith(invoice_prefix(data.get("purpose", "")) + "-")):
+                factuurnummer = reserve_invoice_numbers(conn, data.get("purpose", ""))[0]
+            else:
+                taken = conn.execute("SELECT 1 FROM invoices WHERE factuurnummer=? AND id<>?",
+                                     (factuurnummer, inv_id)).fetchone()
+                if taken:
+                    return {"success": False, "error": f"Invoice number {factuurnummer} is already used"}
+                # a number typed in the sequence format must never be handed out again
+                advance_invoice_sequences(conn, [factuurnummer])
+            vals = (factuurnummer,) + vals
+            if existing:
+                conn.execute('''UPDATE invoices SET factuurnummer=?,date=?,due_date=?,purpose=?,bestelnummer=?,
+                    customer_company=?,customer_dept=?,customer_address=?,customer_postal=?,customer_city=?,
+                    customer_country=?,customer_phone=?,customer_email=?,customer_kvk=?,customer_name=?,
+                    subtotaal=?,btw_pct=?,btw_amount=?,totaal=?,notes=? WHERE id=?''',
+                    vals + (inv_id,))
+                conn.execute("DELETE FROM invoice_items WHERE invoice_id=?", (inv_id,))
+            else:
+                conn.execute(f"INSERT INTO invoices ({INVOICE_SELECT}) VALUES ({','.join('?' * len(INVOICE_COLUMNS))})",
+                    (inv_id,) + vals + (now,))
+            conn.executemany("INSERT INTO invoice_items VALUES (?,?,?,?,?)", _item_rows(inv_id, items))
+        _render_cache.invalidate(inv_id)
+        return {"success": True, "id": inv_id, "factuurnummer": factuurnummer, "totaal": totaal,
                 "subtotaal": subtotaal, "btw_amount": btw_amount}
 
     def get_invoices(self, filters=None):
-        conn = get_db()
-        q = "SELECT * FROM invoices WHERE 1=1"
-        params = []
-        if filters:
-            if filters.get("purpose") and filters["purpose"] != "all":
-                q += " AND purpose=?"; params.append(filters["purpose"])
-            if filters.get("date_from"):
-                q += " AND date>=?"; params.append(filters["date_from"])
-            if filters.get("date_to"):
-                q += " AND date<=?"; params.append(filters["date_to"])
-        q += " ORDER BY created_at DESC"
-        rows = conn.execute(q, params).fetchall()
-        conn.close()
+        """Invoice headers only; line items are loaded by get_invoice()."""
+        where, params = invoice_filter_sql(filters)
+        q = f"SELECT {INVOICE_SELECT} FROM {{}}.invoices WHERE 1=1{where} ORDER BY created_at DESC"
+        with get_db() as conn:
+            rows = conn.execute(q.format("main"), params).fetchall()
+            parts = [conn.execute(q.format(schema), params).fetchall() for schema in archive_schemas(conn, filters)]
+        if parts:
+            import heapq
+            rows = heapq.merge(rows, *parts, key=lambda r: r["created_at"] or "", reverse=True)
+        return [dict(r) for r in rows]
+
+    def list_invoices(self, filters=None, cursor=None, limit=LIST_PAGE_SIZE):
+        """One page of the invoice list, newest first.
+
+        Returns only the columns the list table shows. `cursor` is the
+        `next_cursor` of the previous page (a [created_at, id] pair); `total`
+        is counted on the first page only.
+        """
+        where, params = invoice_filter_sql(filters)
+        page_where, page_params = where, list(params)
+        if cursor:
+            page_where += " AND (created_at, id) < (?, ?)"
+            page_params += [cursor[0], cursor[1]]
+        limit = max(1, min(int(limit or LIST_PAGE_SIZE), 1000))
+        q = f'''SELECT id, factuurnummer,
+                   COALESCE(NULLIF(customer_company,''), customer_name, '') AS customer,
+                   date, purpose, totaal, created_at
+                   FROM {{}}.invoices WHERE 1=1{page_where}
+                   ORDER BY created_at DESC, id DESC LIMIT ?'''
+        with db_transaction(write=False) as conn:
+            rows = [dict(r) for r in conn.execute(q.format("main"), page_params + [limit + 1]).fetchall()]
+            total = None
+            if not cursor:
+                total = conn.execute(f"SELECT COUNT(*) FROM invoices WHERE 1=1{where}", params).fetchone()[0]
+        with get_db() as conn:
+            archived = False
+            for schema in archive_schemas(conn, filters):
+                archived = True
+                rows += [dict(r) for r in conn.execute(q.format(schema), page_params + [limit + 1]).fetchall()]
+                if not cursor:
+                    total += archive_count(conn, schema, filters)
+        if archived:
+            rows.sort(key=lambda r: (r["created_at"] or "", r["id"]), reverse=True)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [rows[-1]["created_at"], rows[-1]["id"]]
+        for r in rows:
+            del r["created_at"]
+        return {"rows": rows, "next_cursor": next_cursor, "total": total}
+
+    def search_invoices(self, query, filters=None, limit=SEARCH_LIMIT):
+        """Ranked full-text search. Matches are wrapped in SEARCH_MARK; the text
+        itself is stored input, so the UI escapes it before turning the
+        markers into <mark> tags."""
+        match = fts_query(query)
+        if not match:
+            return {"rows": [], "total": 0}
+        where, params = invoice_filter_sql(filters, "i")
+        limit = max(1, min(int(limit or SEARCH_LIMIT), 1000))
+        q = f'''SELECT i.id, i.date, i.purpose, i.totaal, i.customer_company,
+                   highlight(invoices_fts, 0, ?, ?) AS factuurnummer,
+                   highlight(invoices_fts, 1, ?, ?) AS hl_company,
+                   highlight(invoices_fts, 2, ?, ?) AS hl_name,
+                   snippet(invoices_fts, -1, ?, ?, '…', 12) AS snippet
+                   FROM invoices_fts JOIN invoices i ON i.rowid = invoices_fts.rowid
+                   WHERE invoices_fts MATCH ?{where}
+                   ORDER BY bm25(invoices_fts, 10.0, 5.0, 5.0, 2.0, 1.0, 4.0, 1.0, 1.0)
+                   LIMIT ?'''
+        with get_db() as conn:
+            rows = conn.execute(q, list(SEARCH_MARK) * 4 + [match] + params + [limit]).fetchall()
+            total = len(rows) if len(rows) < limit else conn.execute(
+                f"""SELECT COUNT(*) FROM invoices_fts JOIN invoices i ON i.rowid = invoices_fts.rowid
+                    WHERE invoices_fts MATCH ?{where}""", [match] + params).fetchone()[0]
+            warning = archive_warning(conn, filters)   # archives have no search index
         result = []
         for r in rows:
             d = dict(r)
-            d["items"] = json.loads(d["items"]) if d["items"] else []
+            hl_company, hl_name = d.pop("hl_company"), d.pop("hl_name")
+            d["customer"] = hl_company if d.pop("customer_company") else hl_name
+            if d["snippet"] in (d["factuurnummer"], d["customer"]):
+                d["snippet"] = ""
             result.append(d)
-        return result
+        return {"rows": result, "total": total, **warning}
 
     def get_invoice(self, inv_id):
-        conn = get_db()
-        row = conn.execute("SELECT * FROM invoices WHERE id=?", (inv_id,)).fetchone()
-        conn.close()
-        if not row: return None
-        d = dict(row)
-        d["items"] = json.loads(d["items"]) if d["items"] else []
-        return d
+        """One invoice with its items; not found in the main database, the archives are tried."""
+        with db_transaction(write=False) as conn:
+            row = conn.execute(f"SELECT {INVOICE_SELECT} FROM invoices WHERE id=?", (inv_id,)).fetchone()
+            if row:
+                return dict(row, items=load_items(conn, inv_id))
+        with get_db() as conn:
+            for schema in archive_schemas(conn):
+                row = conn.execute(f"SELECT {INVOICE_SELECT} FROM {schema}.invoices WHERE id=?",
+                                   (inv_id,)).fetchone()
+                if row:
+                    return dict(row, items=load_items(conn, inv_id, schema), archived=True)
+        return None
 
     def delete_invoice(self, inv_id):
-        conn = get_db()
-        conn.execute("DELETE FROM invoices WHERE id=?", (inv_id,))
-        conn.commit()
-        conn.close()
+        with db_transaction() as conn:
+            deleted = conn.execute("DELETE FROM invoices WHERE id=?", (inv_id,)).rowcount
+        if not deleted:
+            inv = self.get_invoice(inv_id)
+            if inv and inv.get("archived"):
+                return {"success": False, "error": f"{inv['date'][:4]} is archived; its invoices can no longer be deleted"}
+        _render_cache.invalidate(inv_id)
         return {"success": True}
 
     def get_report(self, filters=None):
-        invoices = self.get_invoices(filters)
-        total_revenue = sum(i["totaal"] for i in invoices)
-        total_btw = sum(i["btw_amount"] for i in invoices)
-        subtotaal = sum(i["subtotaal"] for i in invoices)
+        with get_db() as conn:
+            rows = report_totals(conn, filters)
+        count = revenue = btw = subtotaal = 0
         by_purpose = {}
-        for inv in invoices:
-            p = inv["purpose"] or "Other"
-            if p not in by_purpose:
-                by_purpose[p] = {"count": 0, "revenue": 0, "btw": 0, "subtotaal": 0}
-            by_purpose[p]["count"] += 1
-            by_purpose[p]["revenue"] += inv["totaal"]
-            by_purpose[p]["btw"] += inv["btw_amount"]
-            by_purpose[p]["subtotaal"] += inv["subtotaal"]
-        return {"count": len(invoices), "subtotaal": round(subtotaal,2),
-                "total_btw": round(total_btw,2), "total_revenue": round(total_revenue,2),
+        for day, purpose, n, rev_c, btw_c, sub_c in rows:
+            p = by_purpose.setdefault(purpose or "Other", [0, 0, 0, 0])
+            p[0] += n; p[1] += rev_c; p[2] += btw_c; p[3] += sub_c
+            count += n; revenue += rev_c; btw += btw_c; subtotaal += sub_c
+        by_purpose = {p: {"count": n, "revenue": rev_c / 100, "btw": btw_c / 100,
+                          "subtotaal": sub_c / 100}
+                      for p, (n, rev_c, btw_c, sub_c) in sorted(by_purpose.items())}
+        return {"count": count, "subtotaal": round(subtotaal / 100, 2),
+                "total_btw": round(btw / 100, 2), "total_revenue": round(revenue / 100, 2),
                 "by_purpose": by_purpose}
 
-    def export_csv(self):
-        import csv, io
-        invoices = self.get_invoices()
-        out = io.StringIO()
-        w = csv.writer(out)
-        w.writerow(["Factuurnummer","Datum","Klant","Doel","Subtotaal","BTW","Totaal"])
-        for inv in invoices:
-            w.writerow([inv["factuurnummer"], inv["date"],
-                        inv["customer_company"] or inv["customer_name"],
-                        inv["purpose"], inv["subtotaal"], inv["btw_amount"], inv["totaal"]])
-        return {"csv": out.getvalue()}
+    def get_report_series(self, filters=None, bucket="month"):
+        """Revenue, BTW, subtotaal and count per period (and per purpose) over the filters."""
+        if bucket not in REPORT_BUCKETS:
+            return {"success": False, "error": f"Unknown bucket: {bucket}"}
+        with get_db() as conn:
+            rows = report_totals(conn, filters)
+        periods = {}
+        for day, purpose, n, rev_c, btw_c, sub_c in rows:
+            key = report_period(day, bucket)
+            tot = periods.setdefault(key, {"total": [0, 0, 0, 0], "by_purpose": {}})
+            per = tot["by_purpose"].setdefault(purpose or "Other", [0, 0, 0, 0])
+            for acc in (tot["total"], per):
+                acc[0] += n; acc[1] += rev_c; acc[2] += btw_c; acc[3] += sub_c
+        def money(acc):
+            return {"count": acc[0], "revenue": acc[1] / 100, "btw": acc[2] / 100,
+                    "subtotaal": acc[3] / 100}
+        series = []
+        for key in sorted(periods):
+            entry = {"period": key, **money(periods[key]["total"])}
+            entry["by_purpose"] = {p: money(acc) for p, acc in sorted(periods[key]["by_purpose"].items())}
+            series.append(entry)
+        return {"success": True, "bucket": bucket, "periods": series}
+
+    def export_report_html(self, filters=None, label="", bucket=None):
+        """Write the report (optionally with a period series) to an HTML file."""
+        report = self.get_report(filters)
+        series = self.get_report_series(filters, bucket) if bucket else None
+        html = build_report_html(report, label or "Alle perioden", series)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return self.save_report_html(html, f"Omzetrapport_{stamp}.html")
+
+    def get_product_sales(self, filters=None):
+        """Units sold and revenue per product, aggregated in SQL."""
+        where, params = invoice_filter_sql(filters, "i")
+        q = f'''SELECT it.productnaam AS productnaam, SUM(it.aantal) AS aantal,
+                   ROUND(SUM(it.aantal * it.prijs), 2) AS revenue,
+                   COUNT(DISTINCT it.invoice_id) AS invoices
+                   FROM {{0}}.invoice_items it JOIN {{0}}.invoices i ON i.id = it.invoice_id
+                   WHERE 1=1{where} GROUP BY it.productnaam ORDER BY revenue DESC'''
+        with get_db() as conn:
+            rows = [dict(r) for r in conn.execute(q.format("main"), params).fetchall()]
+            parts = [conn.execute(q.format(schema), params).fetchall() for schema in archive_schemas(conn, filters)]
+        if not parts:
+            return rows
+        products = {r["productnaam"]: r for r in rows}
+        for part in parts:   # an invoice lives in one database only, so counts add up
+            for r in part:
+                p = products.setdefault(r["productnaam"], {"productnaam": r["productnaam"], "aantal": 0,
+                                                           "revenue": 0, "invoices": 0})
+                p["aantal"] += r["aantal"]; p["revenue"] = round(p["revenue"] + r["revenue"], 2)
+                p["invoices"] += r["invoices"]
+        return sorted(products.values(), key=lambda p: p["revenue"], reverse=True)
+
+    def get_analytics(self, group_by=None, filters=None, metric="revenue", top=None):
+        """Count, revenue, BTW and average invoice value, in total and per
+        `group_by` (see ANALYTICS_DIMENSIONS), from the in-memory snapshot of
+        the main database; archived years are named in a warning."""
+        try:
+            result = _analytics.query(group_by, filters, metric, top)
+        except ImportError:
+            return {"success": False, "error": "Analytics needs NumPy: pip install numpy"}
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        with get_db() as conn:
+            return {**result, **archive_warning(conn, filters)}
+
+    def get_archives(self):
+        """Archived years with their invoice count, revenue and file size."""
+        return {"archives": list_archives(), "keep_years": ARCHIVE_KEEP_YEARS}
+
+    def archive_year(self, year, compact=True):
+        """Move a closed year into its own file (start_job("archive_year") from the UI)."""
+        try:
+            return archive_year(year, compact)
+        except (ValueError, RuntimeError, OSError, sqlite3.Error) as e:
+            return {"success": False, "error": str(e)}
+
+    def get_backups(self):
+        """Snapshots in the backup folder, newest first, with the backup settings."""
+        conf = backup_settings()
+        return {"backups": list_backups(conf["dir"]), "settings": conf, "codecs": backup_codecs()}
+
+    def backup_now(self, compression=None):
+        """Take a snapshot right away (start_job("backup") from the UI)."""
+        try:
+            return backup_db(compression)
+        except (ValueError, RuntimeError, OSError, sqlite3.Error) as e:
+            return {"success": False, "error": str(e)}
+
+    def verify_backup(self, file):
+        try:
+            return verify_backup(backup_file(file))
+        except (ValueError, RuntimeError, OSError, sqlite3.Error) as e:
+            return {"success": False, "error": str(e)}
+
+    def restore_backup(self, file):
+        """Replace the database with a snapshot (start_job("restore_backup") from the UI)."""
+        try:
+            return restore_backup(backup_file(file))
+        except (ValueError, RuntimeError, OSError, sqlite3.Error) as e:
+            return {"success": False, "error": str(e)}
+
+    def export_csv(self, filters=None, include_items=False):
+        """Stream the (filtered) invoices to a CSV file in DATA_DIR."""
+        return export_invoices(filters, "csv", include_items)
+
+    def export_xlsx(self, filters=None, include_items=False):
+        """Stream the (filtered) invoices to an XLSX file in DATA_DIR."""
+        return export_invoices(filters, "xlsx", include_items)
+
+    def get_invoice_html(self, inv_id):
+        with get_db():
+            inv = self.get_invoice(inv_id)
+            if not inv: return {"success": False}
+            settings = self.get_settings()
+            logo = _assets.logo()
+        key = _render_cache.key(inv, settings, logo)
+        cached = _render_cache.get(inv_id, key, "html")
+        if cached:
+            try:
+                return {"success": True, "html": cached.read_text(encoding="utf-8"), "cached": True}
+            except OSError:
+                pass
+        html = build_invoice_html(inv, settings, logo)
+        _render_cache.put(inv_id, key, "html", html)
+        return {"success": True, "html": html}
+
+    def save_invoice_file(self, inv_id):
+        """Save invoice as PDF using reportlab (A4, proper layout)"""
+        with get_db():
+            inv = self.get_invoice(inv_id)
+            if not inv: return {"success": False, "error": "Invoice not found"}
+            settings = self.get_settings()
+            logo = _assets.logo()
+        stem = invoice_file_stem(inv)
+        pdf_path = DATA_DIR / f"{stem}.pdf"
+        key = _render_cache.key(inv, settings, logo)
+        cached = _render_cache.get(inv_id, key, "pdf")
+        if cached:
+            try:
+                shutil.copyfile(cached, pdf_path)
+            except OSError:
+                return {"success": True, "path": str(cached), "cached": True}   # target open in a viewer
+            return {"success": True, "path": str(pdf_path), "cached": True}
+        try:
+            generate_pdf_reportlab(inv, settings, logo, str(pdf_path))
+            _render_cache.put(inv_id, key, "pdf", pdf_path)
+            return {"success": True, "path": str(pdf_path)}
+        except Exception as e:
+            # Fallback to HTML if PDF fails
+            html = build_invoice_html(inv, settings, logo)
+            html_path = DATA_DIR / f"{stem}.html"
+            with open(html_path, "w", encoding="utf-8") as f:
+                f.write(html)
+            return {"success": True, "path": str(html_path), "fallback": True}
+
+    def save_customer_statement(self, customer, filters=None):
+        """One PDF with all of a customer's invoices behind an overview page."""
+        return render_customer_statement(customer, filters)
+
+    def import_invoices(self, path, on_error="abort"):
+        """Bulk import a CSV, JSON or JSON Lines file (see import_invoices())."""
+        return import_invoices(path, on_error)
+
+    def start_job(self, kind, params=None):
+        """Run a long operation (see JOB_KINDS) in the background; returns its job id at once."""
+        if kind not in JOB_KINDS:
+            return {"success": False, "error": f"Unknown job: {kind}"}
+        try:
+            job, dedup = _jobs.submit(kind, JOB_KINDS[kind], params)
+        except RuntimeError as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "job_id": job["id"], "deduplicated": dedup, "job": job}
+
+    def get_job(self, job_id):
+        job = _jobs.get(job_id)
+        return {"success": True, "job": job} if job else {"success": False, "error": "Job not found"}
+
+    def list_jobs(self):
+        return {"jobs": _jobs.list()}
+
+    def cancel_job(self, job_id):
+        return {"success": _jobs.cancel(job_id)}
+
+    def get_diagnostics(self):
+        """Call/SQL/render statistics plus environment info for the diagnostics page."""
+        import platform
+        with get_db() as conn:
+            env = {"python": sys.version.split()[0], "platform": platform.platform(),
+                   "sqlite": sqlite3.sqlite_version, "schema_version": schema_version(conn),
+                   "invoices": conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0],
+                   "db_bytes": sum(p.stat().st_size for p in DB_PATH.parent.glob(DB_PATH.name + "*")),
+                   "frozen": bool(getattr(sys, "frozen", False)), "pid": os.getpid()}
+        return dict(_diag.snapshot(), environment=env)
+
+    def set_diagnostics(self, enabled, slow_sql_ms=None):
+        _diag.enabled = bool(enabled)
+        if slow_sql_ms is not None:
+            _diag.slow_sql_ms = float(slow_sql_ms)
+        return {"success": True, "enabled": _diag.enabled, "slow_sql_ms": _diag.slow_sql_ms}
+
+    def reset_diagnostics(self):
+        _diag.reset()
+        return {"success": True}
+
+    def dump_diagnostics(self):
+        """Write get_diagnostics() to a JSON file in DATA_DIR to attach to a bug report."""
+        path = DATA_DIR / f"diagnostics_{datetime.now():%Y%m%d_%H%M%S}.json"
+        path.write_text(json.dumps(self.get_diagnostics(), indent=2, default=str), encoding="utf-8")
+        return {"success": True, "path": str(path)}
+
+    def diagnostics_ping(self, payload=None):
+        """Echo for measuring the pywebview bridge round trip from the UI."""
+        return {"payload": payload}
+
+    def bulk_pdf(self, ids=None, filters=None, output="zip", workers=None):
+        """Render many invoices to PDF in parallel into one zip (or a folder)."""
+        return render_pdf_batch(ids, filters, output, workers)
+
+    def save_report_html(self, html_content, filename):
+        """Save report HTML to file"""
+        path = DATA_DIR / Path(filename).name
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html_content)
+        return {"success": True, "path": str(path)}
+
+    def open_file(self, path):
+        try:
+            if sys.platform.startswith("win"):
+                os.startfile(path)
+            elif sys.platform == "darwin":
+                import subprocess; subprocess.run(["open", path])
+            else:
+                import subprocess; subprocess.run(["xdg-open", path])
+            return {"success": True}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def get_data_dir(self):
+        return str(DATA_DIR)
+
+
+def unique_path(path):
+    """`path`, or path_2, path_3, ... if it exists (two jobs in the same second)."""
+    n = 1
+    candidate = path
+    while candidate.exists():
+        n += 1
+        candidate = path.with_name(f"{path.stem}_{n}{path.suffix}")
+    return candidate
+
+EXPORT_CHUNK = 1000
+EXPORT_HEADER = ["Factuurnummer", "Datum", "Klant", "Doel", "Subtotaal", "BTW", "Totaal"]
+EXPORT_ITEM_HEADER = EXPORT_HEADER + ["Omschrijving", "Aantal", "Prijs", "Regeltotaal"]
+
+def iter_export_rows(filters=None, include_items=False, chunk=EXPORT_CHUNK):
+    """Yield export rows in chunks straight from the cursor, newest invoice
+    first: the main database, then each archived year the filters reach into."""
+    where, params = invoice_filter_sql(filters, "i")
+    cols = ("i.factuurnummer, i.date, COALESCE(NULLIF(i.customer_company,''), i.customer_name), "
+            "i.purpose, i.subtotaal, i.btw_amount, i.totaal")
+    if include_items:
+        q = f'''SELECT {cols}, it.productnaam, it.aantal, it.prijs, ROUND(it.aantal * it.prijs, 2)
+                FROM {{0}}.invoices i LEFT JOIN {{0}}.invoice_items it ON it.invoice_id = i.id
+                WHERE 1=1{where} ORDER BY i.created_at DESC, i.id DESC, it.position'''
+    else:
+        q = f"SELECT {cols} FROM {{0}}.invoices i WHERE 1=1{where} ORDER BY i.created_at DESC, i.id DESC"
+
+    def chunks(cur):
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            yield [tuple(r) for r in rows]
+    with db_transaction(write=False) as conn:
+        yield from chunks(conn.execute(q.format("main"), params))
+    with get_db() as conn:
+        for schema in archive_schemas(conn, filters):
+            yield from chunks(conn.execute(q.format(schema), params))
+
+class XlsxStreamWriter:
+    """Minimal single-sheet XLSX writer that streams rows into the zip.
+
+    Only inline strings and numbers, no styles: enough for spreadsheet import
+    without keeping the sheet in memory or adding a dependency.
+    """
+    _ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+    _NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    _REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+    def __init__(self, path, sheet_name="Facturen"):
+        import zipfile
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self._zip.writestr("[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>')
+        self._zip.writestr("_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{self._REL}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        self._zip.writestr("xl/workbook.xml",
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><workbook xmlns="{self._NS}" xmlns:r="{self._REL}">'
+            f'<sheets><sheet name="{self._esc(sheet_name)}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        self._zip.writestr("xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{self._REL}/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>')
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><worksheet xmlns="{self._NS}"><sheetData>'.encode())
+        self._row = 0
+
+    @classmethod
+    def _esc(cls, v):
+        v = cls._ILLEGAL.sub("", str(v))
+        return v.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+
+    def _cell(self, v):
+        if v is None or v == "":
+            return "<c/>"
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return f"<c><v>{v}</v></c>"
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{self._esc(v)}</t></is></c>'
+
+    def writerows(self, rows):
+        out = []
+        for row in rows:
+            self._row += 1
+            out.append(f'<row r="{self._row}">{"".join(self._cell(v) for v in row)}</row>')
+        self._sheet.write("".join(out).encode("utf-8"))
+
+    def writerow(self, row):
+        self.writerows([row])
+
+    def close(self):
+        self._sheet.write(b"</sheetData></worksheet>")
+        self._sheet.close()
+        self._zip.close()
+
+def export_invoices(filters=None, fmt="csv", include_items=False, path=None, progress=None):
+    """Write the filtered invoices to `path` (default: DATA_DIR) chunk by chunk.
+
+    Only the file path and row count are returned, never the file contents.
+    `progress(rows_written)` is called after every chunk.
+    """
+    if fmt not in ("csv", "xlsx"):
+        return {"success": False, "error": f"Unknown export format: {fmt}"}
+    if path is None:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = unique_path(DATA_DIR / f"facturen_{stamp}{'_regels' if include_items else ''}.{fmt}")
+    header = EXPORT_ITEM_HEADER if include_items else EXPORT_HEADER
+    count = 0
+    try:
+        if fmt == "csv":
+            import csv
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                for rows in iter_export_rows(filters, include_items):
+                    w.writerows(rows)
+                    count += len(rows)
+                    if progress: progress(count)
+        else:
+            w = XlsxStreamWriter(path)
+            try:
+                w.writerow(header)
+                for rows in iter_export_rows(filters, include_items):
+                    w.writerows(rows)
+                    count += len(rows)
+                    if progress: progress(count)
+            finally:
+                w.close()
+    except BaseException:
+        Path(path).unlink(missing_ok=True)   # no half-written exports (e.g. a cancelled job)
+        raise
+    return {"success": True, "path": str(path), "rows": count}
+
+def count_export_rows(filters=None, include_items=False):
+    """Number of rows export_invoices() will write, for progress reporting."""
+    where, params = invoice_filter_sql(filters, "i")
+    join = "LEFT JOIN {0}.invoice_items it ON it.invoice_id = i.id" if include_items else ""
+    q = f"SELECT COUNT(*) FROM {{0}}.invoices i {join} WHERE 1=1{where}"
+    with get_db() as conn:
+        count = conn.execute(q.format("main"), params).fetchone()[0]
+        for schema in archive_schemas(conn, filters):
+            count += conn.execute(q.format(schema), params).fetchone()[0]
+        return count
+
+
+# ── bulk import ──────────────────────────────────────────────────
+# CSV has one row per line item; consecutive rows with the same
+# factuurnummer (or bestelnummer) form one invoice. Headers may be the
+# save_invoice() field names or the labels export_csv() writes.
+IMPORT_BATCH = 2000
+IMPORT_ALIASES = {"datum": "date", "doel": "purpose", "klant": "customer_name",
+                  "omschrijving": "productnaam", "product": "productnaam",
+                  "btw %": "btw_pct", "btw_percentage": "btw_pct"}
+IMPORT_IGNORED = {"subtotaal", "btw", "totaal", "regeltotaal", "btw_amount", "created_at"}
+IMPORT_ITEM_FIELDS = ("productnaam", "aantal", "prijs")
+
+def _import_number(value):
+    """Accept 12.5, "12.50", "12,50", "€ 1.234,50"."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    v = str(value or "").replace("€", "").replace(" ", "").strip()
+    if "," in v:
+        v = v.replace(".", "").replace(",", ".")
+    return float(v or 0)
+
+def _iter_import_csv(path):
+    import csv
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f, delimiter=";" if ";" in f.readline() else ",")
+        f.seek(0)
+        header = [IMPORT_ALIASES.get(h.strip().lower(), h.strip().lower()) for h in next(reader)]
+        inv, key, start = None, None, 0
+        for line, row in enumerate(reader, 2):
+            rec = {h: v.strip() for h, v in zip(header, row) if h not in IMPORT_IGNORED}
+            if not any(rec.values()):
+                continue
+            item = {k: rec.pop(k) for k in IMPORT_ITEM_FIELDS if k in rec}
+            row_key = rec.get("factuurnummer") or rec.get("bestelnummer") or None
+            if inv is None or row_key is None or row_key != key:
+                if inv is not None:
+                    yield start, inv
+                inv, key, start = dict(rec, items=[]), row_key, line
+            if item.get("productnaam") or item.get("prijs"):
+                inv["items"].append(item)
+        if inv is not None:
+            yield start, inv
+
+def _iter_import_json(path):
+    with open(path, encoding="utf-8-sig") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            for line, text in enumerate(f, 1):
+                if text.strip():
+                    yield line, json.loads(text)
+            return
+        data = json.load(f)
+    for n, inv in enumerate(data["invoices"] if isinstance(data, dict) else data, 1):
+        yield n, inv
+
+def iter_import_records(path):
+    """Yield (line or record number, invoice dict) from a CSV, JSON or JSON Lines file."""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return _iter_import_csv(path)
+    if path.suffix.lower() in (".json", ".jsonl", ".ndjson"):
+        return _iter_import_json(path)
+    raise ValueError(f"Unknown import format: {path.suffix}")
+
+def prepare_import_invoice(data, closed_years=()):
+    """Validate one record and compute totals exactly like save_invoice(); raises ValueError."""
+    items = data.get("items") or []
+    if not items:
+        raise ValueError("no line items")
+    try:
+        items = [{"productnaam": str(i.get("productnaam", "")),
+                  "aantal": _import_number(i.get("aantal", 1)),
+                  "prijs": _import_number(i.get("prijs", 0))} for i in items]
+        btw_pct = _import_number(data.get("btw_pct", 21))
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("aantal, prijs and btw_pct must be numbers")
+    if not 0 <= btw_pct <= 100:
+        raise ValueError(f"btw_pct out of range: {btw_pct}")
+    day = str(data.get("date", "")).replace("T", " ")
+    if day:
+        try:
+            datetime.strptime(day[:10], "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"date is not YYYY-MM-DD: {day}")
+        if int(day[:4]) in closed_years:
+            raise ValueError(f"{day[:4]} is archived")
+    data = dict(data, date=day)
+    totals = invoice_totals(items, btw_pct)
+    return data, items, invoice_values(data, btw_pct, totals)
+
+@contextmanager
+def deferred_index_triggers(conn):
+    """Suspend the search, rollup and change-log triggers for an insert-only bulk load.
+
+    Only new invoices (rowid above the current maximum) are indexed, rolled
+    up and logged afterwards, in one statement each. Must run inside a write
+    transaction that is rolled back on error, which also restores the
+    dropped triggers.
+    """
+    last = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM invoices").fetchone()[0]
+    triggers = conn.execute("""SELECT name, sql FROM sqlite_master
+        WHERE type='trigger' AND tbl_name IN ('invoices', 'invoice_items')""").fetchall()
+    for name, _ in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    yield
+    cols = ", ".join(FTS_COLUMNS)
+    conn.execute(f"INSERT INTO invoices_fts (rowid, {cols}, items) "
+                 f"SELECT rowid, {cols}, {_FTS_ITEMS.format('invoices')} FROM invoices WHERE rowid > ?", (last,))
+    conn.execute(f"""INSERT INTO invoice_daily_totals {_ROLLUP_FROM_INVOICES} WHERE rowid > ? GROUP BY 1, 2
+        ON CONFLICT (day, purpose) DO UPDATE SET count = count + excluded.count,
+        revenue_c = revenue_c + excluded.revenue_c, btw_c = btw_c + excluded.btw_c,
+        subtotaal_c = subtotaal_c + excluded.subtotaal_c""", (last,))
+    note_invoice_changes(conn, last)
+    for _, sql in triggers:
+        conn.execute(sql)
+
+def import_invoices(path, on_error="abort", batch=IMPORT_BATCH, progress=None):
+    """Import a CSV, JSON or JSON Lines file; see import_records()."""
+    try:
+        records = iter_import_records(path)
+    except ValueError as e:
+        return {"success": False, "error": str(e), "imported": 0}
+    return import_records(records, on_error, batch, progress)
+
+def import_records(records, on_error="abort", batch=IMPORT_BATCH, progress=None):
+    """Import (line, invoice dict) records in one write transaction.
+
+    Rows go in with executemany per `batch` invoices, with the search index
+    and rollups updated once at the end. Invoices whose number or id
+    already exists (in the database or earlier in the input) are skipped, so
+    an import can be re-run. Missing numbers are taken from the invoice
+    sequence at the end, once it has been moved past every imported number
+    in its own format, so they can never collide with a later record.
+    on_error="abort" rolls the whole import back at the first invalid
+    record, "skip" leaves it out and reports it. `progress(records_done)` is
+    called after every batch.
+    """
+    if on_error not in ("abort", "skip"):
+        return {"success": False, "error": f"Unknown on_error: {on_error}"}
+    now = datetime.now().isoformat()
+    seen, seen_ids, errors = set(), set(), []
+    unnumbered = {}    # purpose -> ids of imported invoices still without a number
+    done = imported = skipped = 0
+
+    def existing(conn, column, values):
+        found = set()
+        for i in range(0, len(values), 500):
+            part = values[i:i + 500]
+            found.update(r[0] for r in conn.execute(
+                f"SELECT {column} FROM invoices WHERE {column} IN ({','.join('?' * len(part))})", part))
+        return found
+
+    def flush(conn, pending):
+        taken = existing(conn, "factuurnummer", [p[1]["factuurnummer"] for p in pending if p[1].get("factuurnummer")])
+        taken_ids = existing(conn, "id", [str(p[1]["id"]) for p in pending if p[1].get("id")])
+        todo = [p for p in pending if p[1].get("factuurnummer") not in taken
+                and (not p[1].get("id") or str(p[1]["id"]) not in taken_ids)]
+        advance_invoice_sequences(conn, (p[1].get("factuurnummer") for p in todo))
+        inv_rows, item_rows = [], []
+        for _, inv, items, vals in todo:
+            inv_id = str(inv.get("id") or uuid.uuid4())
+            if not inv.get("factuurnummer"):
+                unnumbered.setdefault(inv.get("purpose", ""), []).append(inv_id)
+            inv_rows.append((inv_id, inv.get("factuurnummer") or None) + vals + (inv.get("created_at") or now,))
+            item_rows.extend(_item_rows(inv_id, items))
+        conn.executemany(f"INSERT INTO invoices ({INVOICE_SELECT}) VALUES ({','.join('?' * len(INVOICE_COLUMNS))})",
+                         inv_rows)
+        conn.executemany("INSERT INTO invoice_items VALUES (?,?,?,?,?)", item_rows)
+        return len(todo), len(pending) - len(todo)
+
+    try:
+        with db_transaction() as conn, deferred_index_triggers(conn):
+            pending, closed_years = [], set(archived_years(conn))
+            for line, raw in records:
+                done += 1
+                try:
+                    inv, items, vals = prepare_import_invoice(raw, closed_years)
+                except ValueError as e:
+                    if on_error == "abort":
+                        raise ValueError(f"record at line {line}: {e}")
+                    errors.append({"line": line, "error": str(e)})
+                    continue
+                number, inv_id = inv.get("factuurnummer"), inv.get("id")
+                if (number and number in seen) or (inv_id and str(inv_id) in seen_ids):
+                    skipped += 1
+                    continue
+                if number:
+                    seen.add(number)
+                if inv_id:
+                    seen_ids.add(str(inv_id))
+                pending.append((line, inv, items, vals))
+                if len(pending) >= batch:
+                    n, dup = flush(conn, pending)
+                    imported, skipped, pending = imported + n, skipped + dup, []
+                    if progress: progress(done)
+            if pending:
+                n, dup = flush(conn, pending)
+                imported, skipped = imported + n, skipped + dup
+            for purpose, ids in unnumbered.items():
+                conn.executemany("UPDATE invoices SET factuurnummer=? WHERE id=?",
+                                 zip(reserve_invoice_numbers(conn, purpose, len(ids)), ids))
+            if progress: progress(done)
+    except (ValueError, OSError, sqlite3.Error) as e:
+        return {"success": False, "error": str(e), "imported": 0}
+    _render_cache.invalidate()
+    return {"success": True, "records": done, "imported": imported,
+            "skipped": skipped, "errors": errors}
+
+# ── bulk PDF rendering ───────────────────────────────────────────
+# Worker processes get settings and logo once through the pool initializer;
+# each task then only carries one invoice. _pdf_worker_ctx is only ever set
+# in those processes: renders in this one get the context passed in, since
+# two jobs may be rendering with different settings at the same time.
+PDF_BATCH_CHUNK = 200
+_pdf_worker_ctx = {}
+
+def _init_pdf_worker(settings, logo_b64):
+    _pdf_worker_ctx["settings"] = settings
+    _pdf_worker_ctx["logo"] = logo_b64
+
+def _render_pdf(inv, settings, logo_b64):
+    import io
+    buf = io.BytesIO()
+    try:
+        generate_pdf_reportlab(inv, settings, logo_b64, buf)
+    except Exception as e:
+        return inv, None, f"{type(e).__name__}: {e}"
+    return inv, buf.getvalue(), None
+
+def _render_pdf_worker(inv):
+    return _render_pdf(inv, _pdf_worker_ctx["settings"], _pdf_worker_ctx["logo"])
+
+def iter_pdf_renders(invoices, settings, logo_b64, workers=None):
+    """Render `invoices` (an iterable of full invoice dicts) to PDF bytes.
+
+    Yields (inv, pdf_bytes, error) in completion order. workers=1 renders in
+    this process; otherwise a ProcessPoolExecutor sized to the CPU count is
+    used, with at most a few tasks per worker in flight so memory stays flat.
+    """
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    if workers == 1:
+        for inv in invoices:
+            yield _render_pdf(inv, settings, logo_b64)
+        return
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_pdf_worker,
+                             initargs=(settings, logo_b64)) as pool:
+        pending = set()
+        for inv in invoices:
+            pending.add(pool.submit(_render_pdf_worker, inv))
+            if len(pending) >= workers * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield f.result()
+        for f in pending:
+            yield f.result()
+
+def render_pdf_batch(ids=None, filters=None, output="zip", workers=None, progress=None):
+    """Render the selected invoices (ids, or else filters) into one zip or folder in DATA_DIR.
+
+    Returns the output path plus a per-invoice success/error list;
+    `progress(done, total)` is called after every invoice.
+    """
+    if output not in ("zip", "folder"):
+        return {"success": False, "error": f"Unknown output: {output}"}
+    api = API()
+    with db_transaction(write=False):
+        settings = api.get_settings()
+        logo = _assets.logo()
+    if ids is None:
+        where, params = invoice_filter_sql(filters)
+        q = f"SELECT id FROM {{}}.invoices WHERE 1=1{where} ORDER BY created_at DESC"
+        with get_db() as conn:
+            ids = [r[0] for r in conn.execute(q.format("main"), params)]
+            for schema in archive_schemas(conn, filters):
+                ids += [r[0] for r in conn.execute(q.format(schema), params)]
+    ids = list(ids)
+    total = len(ids)
+
+    def invoices():
+        for start in range(0, total, PDF_BATCH_CHUNK):
+            yield from find_invoices(ids[start:start + PDF_BATCH_CHUNK])
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if output == "zip":
+        import zipfile
+        out_path = unique_path(DATA_DIR / f"Facturen_{stamp}.zip")
+        archive = zipfile.ZipFile(out_path, "w", zipfile.ZIP_STORED)   # PDFs are already compressed
+        def write(name, data): archive.writestr(name, data)
+    else:
+        out_path = unique_path(DATA_DIR / f"Facturen_{stamp}")
+        out_path.mkdir(exist_ok=True)
+        archive = None
+        def write(name, data): (out_path / name).write_bytes(data)
+
+    results = []
+    try:
+        for inv, pdf, error in iter_pdf_renders(invoices(), settings, logo, workers):
+            if pdf is not None:
+                try:
+                    write(f"{invoice_file_stem(inv)}.pdf", pdf)
+                except OSError as e:
+                    error = str(e)
+            results.append({"id": inv["id"], "factuurnummer": inv["factuurnummer"],
+                            "success": error is None, **({"error": error} if error else {})})
+            if progress: progress(len(results), total)
+    except BaseException:
+        if archive is not None:
+            archive.close()
+            archive = None
+            out_path.unlink(missing_ok=True)
+        else:
+            shutil.rmtree(out_path, ignore_errors=True)
+        raise
+    finally:
+        if archive is not None:
+            archive.close()
+    seen = {r["id"] for r in results}
+    results += [{"id": i, "factuurnummer": None, "success": False, "error": "Invoice not found"}
+                for i in ids if i not in seen]
+    ok = sum(r["success"] for r in results)
+    return {"success": True, "path": str(out_path), "total": total,
+            "rendered": ok, "failed": total - ok, "results": results}
+
+def render_customer_statement(customer, filters=None, progress=None):
+    """One PDF in DATA_DIR with an overview page followed by every invoice of
+    `customer` (see CUSTOMER_KEY_SQL) within the filters, oldest first."""
+    where, params = invoice_filter_sql(filters)
+    q = f"SELECT id FROM {{0}}.invoices WHERE {CUSTOMER_KEY_SQL}=?{where}"
+    with db_transaction(write=False) as conn:
+        invoices = load_invoices(conn, [r[0] for r in conn.execute(q.format("main"), [customer] + params)])
+        settings = _assets.settings()
+        logo = _assets.logo()
+    with get_db() as conn:
+        for schema in archive_schemas(conn, filters):
+            invoices += load_invoices(conn, [r[0] for r in conn.execute(q.format(schema), [customer] + params)],
+                                      schema)
+    if not invoices:
+        return {"success": False, "error": f"No invoices for {customer!r}"}
+    invoices.sort(key=lambda inv: (inv["date"] or "", inv["factuurnummer"] or ""))
+    if progress: progress(0, len(invoices))
+    safe_name = re.sub(r"[^\w.-]+", "_", customer).strip("_") or "klant"
+    path = unique_path(DATA_DIR / f"Overzicht_{safe_name}_{date.today():%Y%m%d}.pdf")
+    try:
+        pdf_renderer(settings, logo).render_statement(invoices, str(path), customer)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    if progress: progress(len(invoices), len(invoices))
+    return {"success": True, "path": str(path), "invoices": len(invoices),
+            "totaal": round(sum(inv.get("totaal") or 0 for inv in invoices), 2)}
+
+# ── background jobs ──────────────────────────────────────────────
+# Long operations run on a small thread pool; the UI gets a job id at once
+# and follows progress by polling get_job() or through window.onJobUpdate()
+# pushed with evaluate_js. Identical submissions while one is still queued or
+# running return the existing job.
+JOB_WORKERS = 2
+JOB_MAX_ACTIVE = 16
+JOB_KEEP = 50
+JOB_PUSH_INTERVAL = 0.2
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.notify = None          # set by App.run: callable(js) -> window.evaluate_js
+        self._pool = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, params=None):
+        """Queue fn(params, progress) and return (job dict, deduplicated)."""
+        key = f"{kind}:{json.dumps(params, sort_keys=True, default=str)}"
+        with self._lock:
+            active = [j for j in self._jobs.values() if j["status"] in ("queued", "running")]
+            for job in active:
+                if job["key"] == key:
+                    return self._public(job), True
+            if len(active) >= JOB_MAX_ACTIVE:
+                raise RuntimeError("Too many jobs running")
+            job = {"id": uuid.uuid4().hex[:12], "kind": kind, "key": key, "status": "queued",
+                   "done": 0, "total": None, "result": None, "error": None,
+                   "created": datetime.now().isoformat(timespec="seconds"),
+                   "cancel": threading.Event(), "pushed": 0.0}
+            self._jobs[job["id"]] = job
+            self._prune()
+            if self._pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+        self._pool.submit(self._run, job, fn, params)
+        return self._public(job), False
+
+    def _run(self, job, fn, params):
+        if job["cancel"].is_set():
+            return self._finish(job, "cancelled")
+        job["status"] = "running"
+        self._push(job, force=True)
+
+        def progress(done, total=None):
+            if job["cancel"].is_set():
+                raise JobCancelled()
+            job["done"] = done
+            if total is not None:
+                job["total"] = total
+            self._push(job)
+
+        try:
+            result = fn(params or {}, progress)
+        except JobCancelled:
+            return self._finish(job, "cancelled")
+        except Exception as e:
+            job["error"] = f"{type(e).__name__}: {e}"
+            return self._finish(job, "failed")
+        job["result"] = result
+        self._finish(job, "done")
+
+    def _finish(self, job, status):
+        job["status"] = status
+        job["finished"] = datetime.now().isoformat(timespec="seconds")
+        self._push(job, force=True)
+
+    def _push(self, job, force=False):
+        now = time.monotonic()
+        if self.notify is None or (not force and now - job["pushed"] < JOB_PUSH_INTERVAL):
+            return
+        job["pushed"] = now
+        try:
+            self.notify(f"window.onJobUpdate && window.onJobUpdate({json.dumps(self._public(job), default=str)})")
+        except Exception:
+            pass   # window closing; get_job() still works
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j["status"] not in ("queued", "running")]
+        for job in finished[:max(0, len(finished) - JOB_KEEP)]:
+            del self._jobs[job["id"]]
+
+    @staticmethod
+    def _public(job):
+        return {k: v for k, v in job.items() if k not in ("key", "cancel", "pushed")}
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return self._public(job) if job else None
+
+    def list(self):
+        return [self._public(j) for j in list(self._jobs.values())]
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if not job or job["status"] not in ("queued", "running"):
+            return False
+        job["cancel"].set()
+        return True
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job["cancel"].set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _job_export(fmt):
+    def run(p, progress):
+        filters, items = p.get("filters"), bool(p.get("include_items"))
+        total = count_export_rows(filters, items)
+        return export_invoices(filters, fmt, items, progress=lambda n: progress(n, total))
+    return run
+
+# kind -> fn(params, progress); params are the keyword arguments of the matching API method
+JOB_KINDS = {
+    "export_csv": _job_export("csv"),
+    "export_xlsx": _job_export("xlsx"),
+    "bulk_pdf": lambda p, progress: render_pdf_batch(p.get("ids"), p.get("filters"), p.get("output", "zip"),
+                                                     p.get("workers"), progress),
+    "import_invoices": lambda p, progress: import_invoices(p["path"], p.get("on_error", "abort"),
+                                                           progress=progress),
+    "save_invoice_file": lambda p, progress: API().save_invoice_file(p["inv_id"]),
+    "customer_statement": lambda p, progress: render_customer_statement(p["customer"], p.get("filters"),
+                                                                        progress),
+    "archive_year": lambda p, progress: archive_year(p["year"], p.get("compact", True), progress),
+    "backup": lambda p, progress: backup_db(p.get("compression"), progress=progress),
+    "restore_backup": lambda p, progress: restore_backup(backup_file(p["file"]), progress),
+    "get_report": lambda p, progress: dict(API().get_report(p.get("filters")),
+                                           series=API().get_report_series(p.get("filters"), p["bucket"])
+                                           if p.get("bucket") else None),
+}
+
+_jobs = JobRunner()
+
+
+class InvoicePdfRenderer:
+    """A4 invoice PDFs matching the sample invoice exactly. Footer pinned to page bottom.
+
+    Built once per settings/logo (see pdf_renderer()): the reportlab imports,
+    paragraph and table styles, footer callback, decoded logo and company
+    block are set up here, so render() only lays out the invoice itself.
+    render_statement() puts several invoices behind an overview page in one
+    document.
+    """
+
+    def __init__(self, settings, logo_b64=None):
+        import io, base64
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import mm
+        from reportlab.lib import colors
+        from reportlab.platypus import (SimpleDocTemplate, Table, TableStyle, Paragraph,
+                                        Spacer, HRFlowable, Image, PageBreak, Flowable)
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+        self.mm, self.A4 = mm, A4
+        self.SimpleDocTemplate, self.Table, self.Paragraph = SimpleDocTemplate, Table, Paragraph
+        self.Spacer, self.HRFlowable, self.PageBreak = Spacer, HRFlowable, PageBreak
+        self.ParagraphStyle, self.TA_LEFT, self.TA_RIGHT = ParagraphStyle, TA_LEFT, TA_RIGHT
+        self._styles = {}
+
+        class TextCell(Flowable):
+            """One line of plain text (amounts, counts, column labels), placed
+            exactly where a single-line Paragraph puts it but without markup
+            parsing and line breaking."""
+            def __init__(self, text, style):
+                Flowable.__init__(self)
+                self.text, self.style = text, style
+
+            def wrap(self, availWidth, availHeight):
+                self.width = availWidth
+                return availWidth, self.style.leading
+
+            def draw(self):
+                st, canv = self.style, self.canv
+                canv.setFont(st.fontName, st.fontSize)
+                canv.setFillColor(st.textColor)
+                x = 0
+                if st.alignment == TA_RIGHT:
+                    x = self.width - stringWidth(self.text, st.fontName, st.fontSize)
+                canv.drawString(x, st.leading - st.fontSize, self.text)
+        self.TextCell = TextCell
+
+        s = self.settings = settings
+        W, H = A4
+        self.W, self.LM, self.RM, self.TM = W, 18*mm, 18*mm, 16*mm
+        self.BM = 20*mm    # leave room for footer
+        CW = self.CW = W - self.LM - self.RM
+
+        # colours
+        self.BLACK = colors.HexColor("#111111")
+        self.MGRAY = colors.HexColor("#444444")
+        self.LGRAY = colors.HexColor("#777777")
+        self.TBORD = colors.HexColor("#CCCCCC")
+        self.TLINE = colors.HexColor("#EEEEEE")
+        self.WHITE = colors.white
+        self.DARK  = colors.HexColor("#111111")
+
+        # ── footer drawn on every page ──────────────────────────────
+        self.support = s.get("support_email") or s.get("email","")
 
-    def get_invoice_html(self, inv_id):
-        inv = self.get_invoice(inv_id)
-        if not inv: return {"success": False}
-        settings = self.get_settings()
-        logo = self.get_logo_base64()
-        html = build_invoice_html(inv, settings, logo.get("data"))
-        return {"success": True, "html": html}
+        # ── logo ────────────────────────────────────────────────────
+        # Decoded once; every render gets its own flowable around the same reader.
+        self._logo = None
+        if logo_b64:
+            try:
+                reader = logo_b64.reader() if isinstance(logo_b64, Logo) else None
+                if reader is None:
+                    from reportlab.lib.utils import ImageReader
+                    reader = ImageReader(io.BytesIO(base64.b64decode(logo_b64.split(",",1)[-1])))
 
-    def save_invoice_file(self, inv_id):
-        """Save invoice as PDF using reportlab (A4, proper layout)"""
-        inv = self.get_invoice(inv_id)
-        if not inv: return {"success": False, "error": "Invoice not found"}
-        settings = self.get_settings()
-        logo_data = self.get_logo_base64()
-        safe_name = inv["factuurnummer"].replace("/","_").replace("\\","_").replace(":","_")
-        pdf_path = DATA_DIR / f"Factuur_{safe_name}.pdf"
-        try:
-            generate_pdf_reportlab(inv, settings, logo_data.get("data"), str(pdf_path))
-            return {"success": True, "path": str(pdf_path)}
-        except Exception as e:
-            # Fallback to HTML if PDF fails
-            html = build_invoice_html(inv, settings, logo_data.get("data"))
-            html_path = DATA_DIR / f"Factuur_{safe_name}.html"
-            with open(html_path, "w", encoding="utf-8") as f:
-                f.write(html)
-            return {"success": True, "path": str(html_path), "fallback": True}
+                class LogoImage(Image):
+                    def __init__(self, **kw):
+                        self._img = reader      # already parsed; Image() would decode it again
+                        super().__init__(io.BytesIO(), **kw)
+                LogoImage(width=44*mm, height=18*mm, kind="proportional")   # a bad logo fails here, not mid-render
+                self._logo = LogoImage
+            except Exception:
+                self._logo = None
 
-    def save_report_html(self, html_content, filename):
-        """Save report HTML to file"""
-        path = DATA_DIR / filename
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(html_content)
-        return {"success": True, "path": str(path)}
+        # ── company info ─────────────────────────────────────────────
+        co = []
+        if s.get("address"):    co.append(s["address"])
+        pc = (s.get("postal","")+" "+s.get("city","")).strip()
+        if pc:                  co.append(pc)
+        if s.get("phone"):      co.append("Tel: "+s["phone"])
+        if s.get("email"):      co.append("E-mail: "+s["email"])
+        if s.get("website"):    co.append("Website: "+s["website"])
+        if s.get("kvk"):        co.append("KVK: "+s["kvk"])
+        if s.get("btw_number"): co.append("BTW: "+s["btw_number"])
+        self.company_lines = "<br/>".join(co)
 
-    def open_file(self, path):
-        try:
-            if sys.platform.startswith("win"):
-                os.startfile(path)
-            elif sys.platform == "darwin":
-                import subprocess; subprocess.run(["open", path])
-            else:
-                import subprocess; subprocess.run(["xdg-open", path])
-            return {"success": True}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        # ── table styles ─────────────────────────────────────────────
+        flush = [("LEFTPADDING",   (0,0), (-1,-1), 0), ("RIGHTPADDING",  (0,0), (-1,-1), 0)]
+        self.meta_style = TableStyle([
+            ("VALIGN",        (0,0), (-1,-1), "TOP"),
+            ("TOPPADDING",    (0,0), (-1,-1), 1.5),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 1.5),
+            *flush,
+        ])
+        self.hdr_style = TableStyle([
+            ("VALIGN",        (0,0), (-1,-1), "TOP"),
+            *flush,
+            ("TOPPADDING",    (0,0), (-1,-1), 0),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 0),
+        ])
+        self.items_style = TableStyle([
+            # header
+            ("LINEABOVE",     (0,0), (-1,0), 0.8, self.TBORD),
+            ("LINEBELOW",     (0,0), (-1,0), 0.8, self.TBORD),
+            ("TOPPADDING",    (0,0), (-1,0), 7),
+            ("BOTTOMPADDING", (0,0), (-1,0), 7),
+            # data
+            ("TOPPADDING",    (0,1), (-1,-1), 7),
+            ("BOTTOMPADDING", (0,1), (-1,-1), 7),
+            ("LINEBELOW",     (0,1), (-1,-2), 0.3, self.TLINE),
+            # col separators
+            ("LINEAFTER",     (0,0), (2,-1), 0.5, self.TBORD),
+            ("VALIGN",        (0,0), (-1,-1), "MIDDLE"),
+            ("LEFTPADDING",   (0,0), (-1,-1), 7),
+            ("RIGHTPADDING",  (0,0), (-1,-1), 7),
+        ])
+        self.items_widths = [CW*0.52, CW*0.12, CW*0.18, CW*0.18]
+        self.tot_style = TableStyle([
+            ("TOPPADDING",    (0,0), (-1,-1), 5),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 5),
+            ("LEFTPADDING",   (0,0), (-1,-1), 8),
+            ("RIGHTPADDING",  (0,0), (-1,-1), 8),
+            ("LINEBELOW",     (0,0), (-1,-2), 0.3, self.TLINE),
+            ("BACKGROUND",    (0,-1), (-1,-1), self.DARK),
+            ("VALIGN",        (0,0), (-1,-1), "MIDDLE"),
+        ])
+        self.outer_style = TableStyle([
+            ("LEFTPADDING",  (0,0),(-1,-1), 0), ("RIGHTPADDING", (0,0),(-1,-1), 0),
+            ("TOPPADDING",   (0,0),(-1,-1), 0), ("BOTTOMPADDING",(0,0),(-1,-1), 0),
+            ("VALIGN",       (0,0),(-1,-1), "TOP"),
+        ])
+        self.head_row = [
+            self.T("Omschrijving", 9, True, self.BLACK),
+            self.T("Aantal",       9, True, self.BLACK, TA_RIGHT),
+            self.T("Prijs (\u20ac)", 9, True, self.BLACK, TA_RIGHT),
+            self.T("Totaal (\u20ac)", 9, True, self.BLACK, TA_RIGHT),
+        ]
 
-    def get_data_dir(self):
-        return str(DATA_DIR)
+    def style(self, size=9, bold=False, clr=None, align=None, lead=None):
+        key = (size, bold, clr, align, lead)
+        st = self._styles.get(key)
+        if st is None:
+            st = self._styles[key] = self.ParagraphStyle(
+                "s", fontSize=size, fontName="Helvetica-Bold" if bold else "Helvetica",
+                textColor=clr or self.MGRAY, alignment=self.TA_LEFT if align is None else align,
+                leading=lead or size*1.45, spaceAfter=0, spaceBefore=0)
+        return st
 
+    def P(self, txt, size=9, bold=False, clr=None, align=None, lead=None):
+        return self.Paragraph(str(txt), self.style(size, bold, clr, align, lead))
 
-def generate_pdf_reportlab(inv, settings, logo_b64, output_path):
-    """A4 PDF matching the sample invoice exactly. Footer pinned to page bottom."""
-    import io, base64
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
-    from reportlab.lib import colors
-    from reportlab.platypus import (SimpleDocTemplate, Table, TableStyle,
-                                     Paragraph, Spacer, HRFlowable, Image)
-    from reportlab.lib.styles import ParagraphStyle
-    from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER
-    from reportlab.pdfgen import canvas as rl_canvas
-
-    s    = settings
-    W, H = A4
-    LM   = 18*mm
-    RM   = 18*mm
-    TM   = 16*mm
-    BM   = 20*mm       # leave room for footer
-    CW   = W - LM - RM
-
-    # colours
-    BLACK = colors.HexColor("#111111")
-    MGRAY = colors.HexColor("#444444")
-    LGRAY = colors.HexColor("#777777")
-    THEAD = colors.white
-    TBORD = colors.HexColor("#CCCCCC")
-    TLINE = colors.HexColor("#EEEEEE")
-    WHITE = colors.white
-    DARK  = colors.HexColor("#111111")
-
-    def P(txt, size=9, bold=False, clr=MGRAY, align=TA_LEFT, lead=None):
-        fn = "Helvetica-Bold" if bold else "Helvetica"
-        return Paragraph(str(txt), ParagraphStyle(
-            "s", fontSize=size, fontName=fn, textColor=clr,
-            alignment=align, leading=lead or size*1.45,
-            spaceAfter=0, spaceBefore=0))
+    def T(self, txt, size=9, bold=False, clr=None, align=None):
+        """P() for a single line without markup, e.g. an amount; see TextCell."""
+        return self.TextCell(str(txt), self.style(size, bold, clr, align))
 
+    @staticmethod
     def eu(v):
         s2 = f"{float(v):,.2f}".replace(",","X").replace(".",",").replace("X",".")
         return f"\u20ac {s2}"
 
-    # ── footer drawn on every page ──────────────────────────────
-    support = s.get("support_email") or s.get("email","")
-    def draw_footer(canv, doc):
+    def draw_footer(self, canv, doc):
         canv.saveState()
-        canv.setStrokeColor(TBORD)
+        canv.setStrokeColor(self.TBORD)
         canv.setLineWidth(0.5)
-        footer_y = BM - 10*mm
-        canv.line(LM, footer_y + 5*mm, W - RM, footer_y + 5*mm)
+        footer_y = self.BM - 10*self.mm
+        canv.line(self.LM, footer_y + 5*self.mm, self.W - self.RM, footer_y + 5*self.mm)
         canv.setFont("Helvetica", 7.5)
-        canv.setFillColor(LGRAY)
-        canv.drawCentredString(W/2, footer_y, f"Vragen over deze factuur? Mail ons via {support}")
+        canv.setFillColor(self.LGRAY)
+        canv.drawCentredString(self.W/2, footer_y, f"Vragen over deze factuur? Mail ons via {self.support}")
         canv.restoreState()
 
-    # ── logo ────────────────────────────────────────────────────
-    if logo_b64:
-        try:
-            raw = base64.b64decode(logo_b64.split(",",1)[-1])
-            logo_cell = Image(io.BytesIO(raw), width=44*mm, height=18*mm, kind="proportional")
-        except:
-            logo_cell = P(s.get("company_name",""), 16, True, BLACK)
-    else:
-        logo_cell = P(s.get("company_name",""), 16, True, BLACK)
+    def _doc(self, output_path, title):
+        return self.SimpleDocTemplate(
+            output_path, pagesize=self.A4,
+            leftMargin=self.LM, rightMargin=self.RM,
+            topMargin=self.TM,  bottomMargin=self.BM,
+            title=title,
+        )
 
-    # ── company info ─────────────────────────────────────────────
-    co = []
-    if s.get("address"):    co.append(s["address"])
-    pc = (s.get("postal","")+" "+s.get("city","")).strip()
-    if pc:                  co.append(pc)
-    if s.get("phone"):      co.append("Tel: "+s["phone"])
-    if s.get("email"):      co.append("E-mail: "+s["email"])
-    if s.get("website"):    co.append("Website: "+s["website"])
-    if s.get("kvk"):        co.append("KVK: "+s["kvk"])
-    if s.get("btw_number"): co.append("BTW: "+s["btw_number"])
-    co_para = P("<br/>".join(co), 8.5, clr=BLACK)
-
-    # ── invoice meta ─────────────────────────────────────────────
-    meta_rows = [
-        [P("Factuurnummer:", 8.5, clr=MGRAY, align=TA_RIGHT),
-         P(inv.get("factuurnummer",""), 8.5, clr=BLACK, align=TA_RIGHT)],
-        [P("Datum:",         8.5, clr=MGRAY, align=TA_RIGHT),
-         P(inv.get("date",""),          8.5, clr=BLACK, align=TA_RIGHT)],
-        [P("Vervaldatum:",   8.5, clr=MGRAY, align=TA_RIGHT),
-         P(inv.get("due_date",""),      8.5, clr=BLACK, align=TA_RIGHT)],
-    ]
-    if inv.get("bestelnummer"):
-        meta_rows.append([
-            P("Bestelnummer:", 8.5, clr=MGRAY, align=TA_RIGHT),
-            P(inv["bestelnummer"],      8.5, clr=BLACK, align=TA_RIGHT)])
-
-    # ── customer block under meta ────────────────────────────────
-    meta_rows.append([P(""), P("")])   # spacer row
-    meta_rows.append([P("Klantgegevens:", 8.5, True, BLACK, TA_RIGHT),
-                      P("", 8.5)])
+    def _build(self, doc, story):
+        doc.build(story, onFirstPage=self.draw_footer, onLaterPages=self.draw_footer)
 
-    company = inv.get("customer_company","").strip()
-    dept    = inv.get("customer_dept","").strip()
-    cname   = inv.get("customer_name","").strip()
-    addr    = inv.get("customer_address","").strip()
-    postal  = inv.get("customer_postal","").strip()
-    city    = inv.get("customer_city","").strip()
-    country = inv.get("customer_country","NL").strip()
-    cust = []
-    if company: cust.append(company + (" t.a.v. "+dept if dept else ""))
-    if cname:   cust.append(cname)
-    if addr:    cust.append(addr)
-    pc2 = (postal+" "+city).strip()
-    if pc2:     cust.append(pc2)
-    if country: cust.append(country)
-    for line in cust:
-        meta_rows.append([P(""), P(line, 8.5, clr=BLACK, align=TA_RIGHT)])
-
-    meta_tbl = Table(meta_rows, colWidths=[CW*0.24, CW*0.26])
-    meta_tbl.setStyle(TableStyle([
-        ("VALIGN",        (0,0), (-1,-1), "TOP"),
-        ("TOPPADDING",    (0,0), (-1,-1), 1.5),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 1.5),
-        ("LEFTPADDING",   (0,0), (-1,-1), 0),
-        ("RIGHTPADDING",  (0,0), (-1,-1), 0),
-    ]))
-
-    # ── header: logo+co LEFT | FACTUUR+meta RIGHT ────────────────
-    hdr_tbl = Table(
-        [[[logo_cell, Spacer(1,3*mm), co_para],
-          [P("FACTUUR", 26, True, BLACK, TA_RIGHT), Spacer(1,3*mm), meta_tbl]]],
-        colWidths=[CW*0.50, CW*0.50])
-    hdr_tbl.setStyle(TableStyle([
-        ("VALIGN",        (0,0), (-1,-1), "TOP"),
-        ("LEFTPADDING",   (0,0), (-1,-1), 0),
-        ("RIGHTPADDING",  (0,0), (-1,-1), 0),
-        ("TOPPADDING",    (0,0), (-1,-1), 0),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 0),
-    ]))
-
-    # ── BTW calc ─────────────────────────────────────────────────
-    btw_pct = float(inv.get("btw_pct", 21))
-    totaal  = float(inv.get("totaal", 0))
-    sub     = round(totaal / (1 + btw_pct/100), 2)
-    btw     = round(totaal - sub, 2)
-
-    # ── items table ──────────────────────────────────────────────
-    rows = [[
-        P("Omschrijving", 9, True, BLACK),
-        P("Aantal",       9, True, BLACK, TA_RIGHT),
-        P("Prijs (\u20ac)", 9, True, BLACK, TA_RIGHT),
-        P("Totaal (\u20ac)", 9, True, BLACK, TA_RIGHT),
-    ]]
-    for item in inv.get("items", []):
-        pr = float(item.get("prijs",  0))
-        an = float(item.get("aantal", 0))
-        ns = str(int(an)) if an == int(an) else str(an)
-        rows.append([
-            P(item.get("productnaam",""), 9, clr=BLACK),
-            P(ns,       9, clr=MGRAY, align=TA_RIGHT),
-            P(eu(pr),   9, clr=MGRAY, align=TA_RIGHT),
-            P(eu(pr*an),9, clr=MGRAY, align=TA_RIGHT),
+    def _header(self, title, meta_rows):
+        """Logo + company LEFT | title + meta table RIGHT."""
+        mm, CW, BLACK, TA_RIGHT = self.mm, self.CW, self.BLACK, self.TA_RIGHT
+        if self._logo is not None:
+            logo_cell = self._logo(width=44*mm, height=18*mm, kind="proportional")
+        else:
+            logo_cell = self.P(self.settings.get("company_name",""), 16, True, BLACK)
+        meta_tbl = self.Table(meta_rows, colWidths=[CW*0.24, CW*0.26])
+        meta_tbl.setStyle(self.meta_style)
+        hdr_tbl = self.Table(
+            [[[logo_cell, self.Spacer(1,3*mm), self.P(self.company_lines, 8.5, clr=BLACK)],
+              [self.P(title, 26, True, BLACK, TA_RIGHT), self.Spacer(1,3*mm), meta_tbl]]],
+            colWidths=[CW*0.50, CW*0.50])
+        hdr_tbl.setStyle(self.hdr_style)
+        return hdr_tbl
+
+    def _meta_row(self, label, value, bold=False):
+        return [self.P(label, 8.5, bold, self.BLACK if bold else self.MGRAY, self.TA_RIGHT),
+                self.P(value, 8.5, clr=self.BLACK, align=self.TA_RIGHT)]
+
+    def _customer_rows(self, inv):
+        company = inv.get("customer_company","").strip()
+        dept    = inv.get("customer_dept","").strip()
+        cname   = inv.get("customer_name","").strip()
+        addr    = inv.get("customer_address","").strip()
+        postal  = inv.get("customer_postal","").strip()
+        city    = inv.get("customer_city","").strip()
+        country = inv.get("customer_country","NL").strip()
+        cust = []
+        if company: cust.append(company + (" t.a.v. "+dept if dept else ""))
+        if cname:   cust.append(cname)
+        if addr:    cust.append(addr)
+        pc2 = (postal+" "+city).strip()
+        if pc2:     cust.append(pc2)
+        if country: cust.append(country)
+        rows = [[self.P(""), self.P("")],   # spacer row
+                self._meta_row("Klantgegevens:", "", bold=True)]
+        return rows + [self._meta_row("", line) for line in cust]
+
+    def _totals(self, rows):
+        """Right-aligned totals block; the last row is the dark TOTAAL bar."""
+        TW = self.CW * 0.42
+        SW = self.CW - TW
+        tot_tbl = self.Table(rows, colWidths=[TW*0.58, TW*0.42])
+        tot_tbl.setStyle(self.tot_style)
+        outer_tot = self.Table([[self.Spacer(SW,1), tot_tbl]], colWidths=[SW, TW])
+        outer_tot.setStyle(self.outer_style)
+        return outer_tot
+
+    def story(self, inv):
+        """The flowables for one invoice."""
+        P, T, eu, mm = self.P, self.T, self.eu, self.mm
+        BLACK, MGRAY, WHITE, TA_RIGHT = self.BLACK, self.MGRAY, self.WHITE, self.TA_RIGHT
+
+        # ── invoice meta + customer block ────────────────────────────
+        meta_rows = [
+            self._meta_row("Factuurnummer:", inv.get("factuurnummer","")),
+            self._meta_row("Datum:",         inv.get("date","")),
+            self._meta_row("Vervaldatum:",   inv.get("due_date","")),
+        ]
+        if inv.get("bestelnummer"):
+            meta_rows.append(self._meta_row("Bestelnummer:", inv["bestelnummer"]))
+        hdr_tbl = self._header("FACTUUR", meta_rows + self._customer_rows(inv))
+
+        # ── BTW calc ─────────────────────────────────────────────────
+        btw_pct = float(inv.get("btw_pct", 21))
+        totaal  = float(inv.get("totaal", 0))
+        sub     = round(totaal / (1 + btw_pct/100), 2)
+        btw     = round(totaal - sub, 2)
+
+        # ── items table ──────────────────────────────────────────────
+        rows = [self.head_row]
+        for item in inv.get("items", []):
+            pr = float(item.get("prijs",  0))
+            an = float(item.get("aantal", 0))
+            ns = str(int(an)) if an == int(an) else str(an)
+            rows.append([
+                P(item.get("productnaam",""), 9, clr=BLACK),
+                T(ns,       9, clr=MGRAY, align=TA_RIGHT),
+                T(eu(pr),   9, clr=MGRAY, align=TA_RIGHT),
+                T(eu(pr*an),9, clr=MGRAY, align=TA_RIGHT),
+            ])
+        items_tbl = self.Table(rows, colWidths=self.items_widths, repeatRows=1)
+        items_tbl.setStyle(self.items_style)
+
+        # ── totals ───────────────────────────────────────────────────
+        outer_tot = self._totals([
+            [T("Subtotaal (excl. BTW):", 9, clr=MGRAY), T(eu(sub),    9, clr=BLACK, align=TA_RIGHT)],
+            [T(f"BTW ({btw_pct:.0f}%):", 9, clr=MGRAY), T(eu(btw),    9, clr=BLACK, align=TA_RIGHT)],
+            [T("TOTAAL (incl. BTW):",    9, True, WHITE),T(eu(totaal), 9, True, WHITE, TA_RIGHT)],
         ])
 
-    items_tbl = Table(rows, colWidths=[CW*0.52, CW*0.12, CW*0.18, CW*0.18], repeatRows=1)
-    items_tbl.setStyle(TableStyle([
-        # header
-        ("LINEABOVE",     (0,0), (-1,0), 0.8, TBORD),
-        ("LINEBELOW",     (0,0), (-1,0), 0.8, TBORD),
-        ("TOPPADDING",    (0,0), (-1,0), 7),
-        ("BOTTOMPADDING", (0,0), (-1,0), 7),
-        # data
-        ("TOPPADDING",    (0,1), (-1,-1), 7),
-        ("BOTTOMPADDING", (0,1), (-1,-1), 7),
-        ("LINEBELOW",     (0,1), (-1,-2), 0.3, TLINE),
-        # col separators
-        ("LINEAFTER",     (0,0), (2,-1), 0.5, TBORD),
-        ("VALIGN",        (0,0), (-1,-1), "MIDDLE"),
-        ("LEFTPADDING",   (0,0), (-1,-1), 7),
-        ("RIGHTPADDING",  (0,0), (-1,-1), 7),
-    ]))
-
-    # ── totals ───────────────────────────────────────────────────
-    TW = CW * 0.42
-    SW = CW - TW
-    tot_data = [
-        [P("Subtotaal (excl. BTW):", 9, clr=MGRAY), P(eu(sub),    9, clr=BLACK, align=TA_RIGHT)],
-        [P(f"BTW ({btw_pct:.0f}%):", 9, clr=MGRAY), P(eu(btw),    9, clr=BLACK, align=TA_RIGHT)],
-        [P("TOTAAL (incl. BTW):",    9, True, WHITE),P(eu(totaal), 9, True, WHITE, TA_RIGHT)],
-    ]
-    tot_tbl = Table(tot_data, colWidths=[TW*0.58, TW*0.42])
-    tot_tbl.setStyle(TableStyle([
-        ("TOPPADDING",    (0,0), (-1,-1), 5),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 5),
-        ("LEFTPADDING",   (0,0), (-1,-1), 8),
-        ("RIGHTPADDING",  (0,0), (-1,-1), 8),
-        ("LINEBELOW",     (0,0), (-1,1), 0.3, TLINE),
-        ("BACKGROUND",    (0,2), (-1,2), DARK),
-        ("VALIGN",        (0,0), (-1,-1), "MIDDLE"),
-    ]))
-    outer_tot = Table([[Spacer(SW,1), tot_tbl]], colWidths=[SW, TW])
-    outer_tot.setStyle(TableStyle([
-        ("LEFTPADDING",  (0,0),(-1,-1), 0), ("RIGHTPADDING", (0,0),(-1,-1), 0),
-        ("TOPPADDING",   (0,0),(-1,-1), 0), ("BOTTOMPADDING",(0,0),(-1,-1), 0),
-        ("VALIGN",       (0,0),(-1,-1), "TOP"),
-    ]))
-
-    # ── notes ────────────────────────────────────────────────────
-    extra = []
-    if inv.get("notes","").strip():
-        extra += [Spacer(1,4*mm), P(inv["notes"], 8.5, clr=LGRAY)]
-
-    # ── build doc ────────────────────────────────────────────────
-    doc = SimpleDocTemplate(
-        output_path, pagesize=A4,
-        leftMargin=LM, rightMargin=RM,
-        topMargin=TM,  bottomMargin=BM,
-        title=f"Factuur {inv.get('factuurnummer','')}",
-    )
-
-    story = [
-        hdr_tbl,
-        Spacer(1, 6*mm),
-        HRFlowable(width=CW, thickness=0.8, color=TBORD, spaceAfter=4*mm),
-        items_tbl,
-        Spacer(1, 5*mm),
-        outer_tot,
-        *extra,
-    ]
-
-    doc.build(story, onFirstPage=draw_footer, onLaterPages=draw_footer)
+        # ── notes ────────────────────────────────────────────────────
+        extra = []
+        if inv.get("notes","").strip():
+            extra += [self.Spacer(1,4*mm), P(inv["notes"], 8.5, clr=self.LGRAY)]
 
+        return [
+            hdr_tbl,
+            self.Spacer(1, 6*mm),
+            self.HRFlowable(width=self.CW, thickness=0.8, color=self.TBORD, spaceAfter=4*mm),
+            items_tbl,
+            self.Spacer(1, 5*mm),
+            outer_tot,
+            *extra,
+        ]
 
-def build_invoice_html(inv, settings, logo_b64=None):
-    """
-    Generates invoice HTML that matches the sample exactly:
-    - White page, no coloured bar
-    - Logo top-left | FACTUUR title top-right
-    - Company info left | meta + Klantgegevens right (all right-aligned)
-    - Horizontal rule
-    - Items table with borders
-    - Totals right-aligned (dark grand total row)
-    - Footer pinned to bottom of A4 page
+    def render(self, inv, output_path):
+        lap = _diag.stopwatch("pdf")
+        doc = self._doc(output_path, f"Factuur {inv.get('factuurnummer','')}")
+        story = self.story(inv)
+        lap("layout")
+        self._build(doc, story)
+        lap("build")
+
+    def render_statement(self, invoices, output_path, customer=""):
+        """One PDF: an overview of `invoices` (one customer's) followed by every invoice, in one build."""
+        P, T, eu, mm = self.P, self.T, self.eu, self.mm
+        BLACK, MGRAY, WHITE, TA_RIGHT = self.BLACK, self.MGRAY, self.WHITE, self.TA_RIGHT
+        invoices = list(invoices)
+        meta_rows = [self._meta_row("Datum:", date.today().isoformat()),
+                     self._meta_row("Aantal facturen:", str(len(invoices)))]
+        if invoices:
+            meta_rows += self._customer_rows(invoices[-1])    # most recent address
+        rows = [[T("Factuurnummer", 9, True, BLACK), T("Datum", 9, True, BLACK),
+                 T("Vervaldatum", 9, True, BLACK), T("Totaal (\u20ac)", 9, True, BLACK, TA_RIGHT)]]
+        for inv in invoices:
+            rows.append([P(inv.get("factuurnummer",""), 9, clr=BLACK),
+                         P(inv.get("date","")[:10], 9, clr=MGRAY),
+                         P(inv.get("due_date",""), 9, clr=MGRAY),
+                         T(eu(inv.get("totaal") or 0), 9, clr=MGRAY, align=TA_RIGHT)])
+        overview = self.Table(rows, colWidths=[self.CW*0.34, self.CW*0.22, self.CW*0.22, self.CW*0.22],
+                              repeatRows=1)
+        overview.setStyle(self.items_style)
+        btw = sum(float(inv.get("btw_amount") or 0) for inv in invoices)
+        totaal = sum(float(inv.get("totaal") or 0) for inv in invoices)
+        story = [
+            self._header("OVERZICHT", meta_rows),
+            self.Spacer(1, 6*mm),
+            self.HRFlowable(width=self.CW, thickness=0.8, color=self.TBORD, spaceAfter=4*mm),
+            overview,
+            self.Spacer(1, 5*mm),
+            self._totals([
+                [T("Waarvan BTW:",          9, clr=MGRAY), T(eu(btw),    9, clr=BLACK, align=TA_RIGHT)],
+                [T("TOTAAL (incl. BTW):",   9, True, WHITE),T(eu(totaal), 9, True, WHITE, TA_RIGHT)],
+            ]),
+        ]
+        for inv in invoices:
+            story += [self.PageBreak(), *self.story(inv)]
+        self._build(self._doc(output_path, f"Overzicht {customer}".strip()), story)
+
+
+# One renderer per settings/logo; replaced when either changes.
+_pdf_renderer = {"key": None, "renderer": None}
+_pdf_renderer_lock = threading.Lock()
+
+def pdf_renderer(settings, logo_b64=None):
+    key = template_settings_key(settings, logo_b64)
+    with _pdf_renderer_lock:
+        if _pdf_renderer["key"] != key:
+            lap = _diag.stopwatch("pdf")
+            _pdf_renderer["renderer"] = InvoicePdfRenderer(settings, logo_b64)
+            _pdf_renderer["key"] = key
+            lap("setup")
+        return _pdf_renderer["renderer"]
+
+def generate_pdf_reportlab(inv, settings, logo_b64, output_path):
+    """A4 PDF matching the sample invoice exactly; see InvoicePdfRenderer."""
+    pdf_renderer(settings, logo_b64).render(inv, output_path)
+
+
+# ── HTML templates ───────────────────────────────────────────────
+# Invoice and report HTML come from templates compiled once at import; the
+# CSS and other fixed text sit in the static chunks, and the company block
+# and logo are folded in once per settings (see invoice_template()). Nothing
+# is loaded from the network, so the pages look the same offline.
+
+class HtmlTemplate:
+    """Text with {name} slots, split once into static text and slot names.
+
+    render(**values) fills every slot, inserting values as given (no escaping),
+    and joins the pieces. Slots passed to the constructor or bind() are folded
+    into the static text instead, e.g. the CSS or the settings-dependent header.
     """
-    s = settings
 
-    # Logo
-    if logo_b64:
-        logo_html = f'<img src="{logo_b64}" style="max-height:52pt;max-width:160pt;object-fit:contain;display:block;" alt="Logo">'
-    else:
-        logo_html = f'<div style="font-size:20pt;font-weight:800;color:#111;">{s.get("company_name","")}</div>'
+    _SLOT = re.compile(r"\{(\w+)\}")
 
-    # Company info
-    co = []
-    if s.get("address"):    co.append(s["address"])
-    pc = (s.get("postal","")+" "+s.get("city","")).strip()
-    if pc:                  co.append(pc)
-    if s.get("phone"):      co.append("Tel: "+s["phone"])
-    if s.get("email"):      co.append("E-mail: "+s["email"])
-    if s.get("website"):    co.append("Website: "+s["website"])
-    if s.get("kvk"):        co.append("KVK: "+s["kvk"])
-    if s.get("btw_number"): co.append("BTW: "+s["btw_number"])
-    co_html = "<br>".join(co)
+    def __init__(self, source, **bound):
+        parts = self._SLOT.split(source)
+        self._fold(parts[0], zip(parts[1::2], parts[2::2]), bound)
 
-    # Customer lines (right-aligned, below meta)
-    cust = []
-    company = inv.get("customer_company","").strip()
-    dept    = inv.get("customer_dept","").strip()
-    cname   = inv.get("customer_name","").strip()
-    addr    = inv.get("customer_address","").strip()
-    postal  = inv.get("customer_postal","").strip()
-    city    = inv.get("customer_city","").strip()
-    country = inv.get("customer_country","NL").strip()
-    if company: cust.append(company + (" t.a.v. "+dept if dept else ""))
-    if cname:   cust.append(cname)
-    if addr:    cust.append(addr)
-    pc2 = (postal+" "+city).strip()
-    if pc2:     cust.append(pc2)
-    if country: cust.append(country)
-    cust_html = "<br>".join(cust)
+    def _fold(self, first, slots, bound):
+        self._first, self._slots = first, []     # [(name, text after it), ...]
+        for name, text in slots:
+            if name in bound:
+                if self._slots:
+                    self._slots[-1] = (self._slots[-1][0], self._slots[-1][1] + str(bound[name]) + text)
+                else:
+                    self._first += str(bound[name]) + text
+            else:
+                self._slots.append((name, text))
 
-    # Items
-    btw_pct   = float(inv.get("btw_pct", 21))
-    totaal    = float(inv.get("totaal", 0))
-    subtotaal = round(totaal / (1 + btw_pct / 100), 2)
-    btw_amt   = round(totaal - subtotaal, 2)
+    def render(self, **values):
+        out = [self._first]
+        for name, text in self._slots:
+            out.append(str(values[name]))
+            out.append(text)
+        return "".join(out)
 
-    items_rows = ""
-    for item in inv.get("items", []):
-        p  = float(item.get("prijs", 0))
-        n  = float(item.get("aantal", 0))
-        ns = str(int(n)) if n == int(n) else str(n)
-        items_rows += f"""<tr>
-          <td class="td-name">{item.get("productnaam","")}</td>
-          <td class="td-r">{ns}</td>
-          <td class="td-r">€ {fmt_euro(p)}</td>
-          <td class="td-r td-bold">€ {fmt_euro(p*n)}</td>
-        </tr>"""
-
-    bestelnr = f'<tr><td class="ml">Bestelnummer:</td><td class="mv">{inv.get("bestelnummer","")}</td></tr>' if inv.get("bestelnummer") else ""
-    notes_html = f'<p style="margin-top:10pt;font-size:8.5pt;color:#777;">{inv.get("notes","")}</p>' if inv.get("notes","").strip() else ""
-    support = s.get("support_email") or s.get("email","")
-
-    return f"""<!DOCTYPE html>
-<html lang="nl">
-<head>
-<meta charset="UTF-8">
-<title>Factuur {inv.get("factuurnummer","")}</title>
-<style>
-  *{{margin:0;padding:0;box-sizing:border-box;}}
-  html{{height:100%;}}
-  body{{
+    def bind(self, **values):
+        """A new template with these slots filled in for good."""
+        bound = object.__new__(HtmlTemplate)
+        bound._fold(self._first, self._slots, values)
+        return bound
+
+
+INVOICE_CSS = """  *{margin:0;padding:0;box-sizing:border-box;}
+  html{height:100%;}
+  body{
     font-family:Arial,Helvetica,sans-serif;
     font-size:9pt;
     color:#333;
     background:#e8e8e8;
     min-height:100%;
-  }}
+  }
   /* A4 page wrapper */
-  .page{{
+  .page{
     width:210mm;
     min-height:297mm;
     margin:0 auto;
@@ -570,51 +3615,51 @@ def build_invoice_html(inv, settings, logo_b64=None):
     position:relative;
     display:flex;
     flex-direction:column;
-  }}
+  }
   /* Header row: logo left | FACTUUR right */
-  .hdr{{display:table;width:100%;margin-bottom:10pt;}}
-  .hdr-l{{display:table-cell;vertical-align:top;width:50%;}}
-  .hdr-r{{display:table-cell;vertical-align:top;width:50%;text-align:right;}}
-  .factuur-title{{font-size:26pt;font-weight:700;letter-spacing:1px;color:#111;line-height:1;}}
+  .hdr{display:table;width:100%;margin-bottom:10pt;}
+  .hdr-l{display:table-cell;vertical-align:top;width:50%;}
+  .hdr-r{display:table-cell;vertical-align:top;width:50%;text-align:right;}
+  .factuur-title{font-size:26pt;font-weight:700;letter-spacing:1px;color:#111;line-height:1;}
   /* Info row: company info left | meta+customer right */
-  .info{{display:table;width:100%;margin-top:6pt;}}
-  .info-l{{display:table-cell;vertical-align:top;width:50%;}}
-  .info-r{{display:table-cell;vertical-align:top;width:50%;text-align:right;}}
-  .co-info{{font-size:8.5pt;line-height:1.65;color:#333;}}
+  .info{display:table;width:100%;margin-top:6pt;}
+  .info-l{display:table-cell;vertical-align:top;width:50%;}
+  .info-r{display:table-cell;vertical-align:top;width:50%;text-align:right;}
+  .co-info{font-size:8.5pt;line-height:1.65;color:#333;}
   /* Meta table */
-  .meta{{border-collapse:collapse;margin-left:auto;}}
-  .meta td{{padding:1.5pt 0;font-size:8.5pt;line-height:1.55;}}
-  .ml{{color:#555;padding-right:14pt;white-space:nowrap;text-align:left;}}
-  .mv{{color:#111;font-weight:normal;text-align:right;white-space:nowrap;}}
+  .meta{border-collapse:collapse;margin-left:auto;}
+  .meta td{padding:1.5pt 0;font-size:8.5pt;line-height:1.55;}
+  .ml{color:#555;padding-right:14pt;white-space:nowrap;text-align:left;}
+  .mv{color:#111;font-weight:normal;text-align:right;white-space:nowrap;}
   /* Klantgegevens */
-  .klant-label{{font-size:8.5pt;font-weight:bold;color:#333;margin-top:8pt;text-align:right;}}
-  .klant-body{{font-size:8.5pt;line-height:1.65;color:#333;text-align:right;margin-top:1pt;}}
+  .klant-label{font-size:8.5pt;font-weight:bold;color:#333;margin-top:8pt;text-align:right;}
+  .klant-body{font-size:8.5pt;line-height:1.65;color:#333;text-align:right;margin-top:1pt;}
   /* Divider */
-  .divider{{height:1px;background:#ccc;margin:10pt 0;}}
+  .divider{height:1px;background:#ccc;margin:10pt 0;}
   /* Items table */
-  table.items{{width:100%;border-collapse:collapse;}}
-  table.items th{{
+  table.items{width:100%;border-collapse:collapse;}
+  table.items th{
     padding:7pt 8pt;font-size:9pt;font-weight:bold;
     color:#333;background:transparent;
     border-top:1px solid #ccc;border-bottom:1px solid #ccc;
     text-align:left;
-  }}
-  table.items th.th-r{{text-align:right;}}
-  .td-name{{padding:8pt 8pt;font-size:9pt;color:#333;border-bottom:1px solid #eee;}}
-  .td-r{{padding:8pt 8pt;font-size:9pt;color:#333;text-align:right;border-bottom:1px solid #eee;}}
-  .td-bold{{font-weight:normal;}}
-  table.items tbody tr:last-child td{{border-bottom:none;}}
+  }
+  table.items th.th-r{text-align:right;}
+  .td-name{padding:8pt 8pt;font-size:9pt;color:#333;border-bottom:1px solid #eee;}
+  .td-r{padding:8pt 8pt;font-size:9pt;color:#333;text-align:right;border-bottom:1px solid #eee;}
+  .td-bold{font-weight:normal;}
+  table.items tbody tr:last-child td{border-bottom:none;}
   /* Totals */
-  .totals-wrap{{margin-top:8pt;}}
-  .totals-tbl{{margin-left:auto;border-collapse:collapse;width:230pt;}}
-  .totals-tbl td{{padding:4pt 8pt;font-size:9pt;}}
-  .totals-tbl td.tl{{color:#333;text-align:left;}}
-  .totals-tbl td.tv{{color:#333;text-align:right;white-space:nowrap;}}
-  .tot-grand td{{background:#111;color:white!important;font-weight:bold;padding:6pt 8pt;}}
+  .totals-wrap{margin-top:8pt;}
+  .totals-tbl{margin-left:auto;border-collapse:collapse;width:230pt;}
+  .totals-tbl td{padding:4pt 8pt;font-size:9pt;}
+  .totals-tbl td.tl{color:#333;text-align:left;}
+  .totals-tbl td.tv{color:#333;text-align:right;white-space:nowrap;}
+  .tot-grand td{background:#111;color:white!important;font-weight:bold;padding:6pt 8pt;}
   /* Content area grows to push footer down */
-  .content-area{{flex:1;}}
+  .content-area{flex:1;}
   /* Footer — pinned to bottom of page */
-  .footer{{
+  .footer{
     position:absolute;
     bottom:14mm;
     left:18mm;
@@ -624,13 +3669,21 @@ def build_invoice_html(inv, settings, logo_b64=None):
     color:#777;
     border-top:1px solid #ddd;
     padding-top:6pt;
-  }}
-  @media print{{
-    body{{background:white;}}
-    .page{{margin:0;width:100%;min-height:0;padding:12mm 15mm 20mm 15mm;}}
-    @page{{size:A4;margin:0;}}
-  }}
-</style>
+  }
+  @media print{
+    body{background:white;}
+    .page{margin:0;width:100%;min-height:0;padding:12mm 15mm 20mm 15mm;}
+    @page{size:A4;margin:0;}
+  }
+"""
+
+INVOICE_TEMPLATE = HtmlTemplate("""<!DOCTYPE html>
+<html lang="nl">
+<head>
+<meta charset="UTF-8">
+<title>Factuur {factuurnummer}</title>
+<style>
+{css}</style>
 </head>
 <body>
 <div class="page">
@@ -648,9 +3701,9 @@ def build_invoice_html(inv, settings, logo_b64=None):
     </div>
     <div class="info-r">
       <table class="meta">
-        <tr><td class="ml">Factuurnummer:</td><td class="mv">{inv.get("factuurnummer","")}</td></tr>
-        <tr><td class="ml">Datum:</td><td class="mv">{inv.get("date","")}</td></tr>
-        <tr><td class="ml">Vervaldatum:</td><td class="mv">{inv.get("due_date","")}</td></tr>
+        <tr><td class="ml">Factuurnummer:</td><td class="mv">{factuurnummer}</td></tr>
+        <tr><td class="ml">Datum:</td><td class="mv">{date}</td></tr>
+        <tr><td class="ml">Vervaldatum:</td><td class="mv">{due_date}</td></tr>
         {bestelnr}
       </table>
       <div class="klant-label">Klantgegevens:</div>
@@ -678,9 +3731,9 @@ def build_invoice_html(inv, settings, logo_b64=None):
     <!-- TOTALS -->
     <div class="totals-wrap">
       <table class="totals-tbl">
-        <tr><td class="tl">Subtotaal (excl. BTW):</td><td class="tv">€ {fmt_euro(subtotaal)}</td></tr>
-        <tr><td class="tl">BTW ({btw_pct:.0f}%):</td><td class="tv">€ {fmt_euro(btw_amt)}</td></tr>
-        <tr class="tot-grand"><td class="tl">TOTAAL (incl. BTW):</td><td class="tv">€ {fmt_euro(totaal)}</td></tr>
+        <tr><td class="tl">Subtotaal (excl. BTW):</td><td class="tv">€ {subtotaal}</td></tr>
+        <tr><td class="tl">BTW ({btw_pct}%):</td><td class="tv">€ {btw_amount}</td></tr>
+        <tr class="tot-grand"><td class="tl">TOTAAL (incl. BTW):</td><td class="tv">€ {totaal}</td></tr>
       </table>
     </div>
 
@@ -694,44 +3747,130 @@ def build_invoice_html(inv, settings, logo_b64=None):
 
 </div>
 </body>
-</html>"""
-
-
-
-def build_report_html(report_data, filters_label):
-    by_purpose = report_data.get("by_purpose", {})
-    rows = ""
-    for p, d in by_purpose.items():
-        rows += f"""<tr>
-          <td>{p}</td>
-          <td style="text-align:center">{d['count']}</td>
-          <td style="text-align:right">€ {fmt_euro(d['subtotaal'])}</td>
-          <td style="text-align:right">€ {fmt_euro(d['btw'])}</td>
-          <td style="text-align:right;font-weight:700">€ {fmt_euro(d['revenue'])}</td>
-        </tr>"""
-    now = datetime.now().strftime("%d-%m-%Y %H:%M")
-    return f"""<!DOCTYPE html>
+</html>""", css=INVOICE_CSS)
+
+INVOICE_ITEM_ROW = HtmlTemplate("""<tr>
+          <td class="td-name">{productnaam}</td>
+          <td class="td-r">{aantal}</td>
+          <td class="td-r">€ {prijs}</td>
+          <td class="td-r td-bold">€ {totaal}</td>
+        </tr>""")
+
+INVOICE_BESTELNR_ROW = HtmlTemplate(
+    '<tr><td class="ml">Bestelnummer:</td><td class="mv">{bestelnummer}</td></tr>')
+INVOICE_NOTES = HtmlTemplate('<p style="margin-top:10pt;font-size:8.5pt;color:#777;">{notes}</p>')
+
+# INVOICE_TEMPLATE with the logo, company block and footer of one settings
+# version bound; replaced when either changes.
+_invoice_template = {"key": None, "template": None}
+_invoice_template_lock = threading.Lock()
+
+def invoice_template(settings, logo_b64=None):
+    key = template_settings_key(settings, logo_b64)
+    with _invoice_template_lock:
+        if _invoice_template["key"] == key:
+            return _invoice_template["template"]
+    s = settings
+    # Logo
+    if logo_b64:
+        logo_html = f'<img src="{logo_data_uri(logo_b64)}" style="max-height:52pt;max-width:160pt;object-fit:contain;display:block;" alt="Logo">'
+    else:
+        logo_html = f'<div style="font-size:20pt;font-weight:800;color:#111;">{s.get("company_name","")}</div>'
+
+    # Company info
+    co = []
+    if s.get("address"):    co.append(s["address"])
+    pc = (s.get("postal","")+" "+s.get("city","")).strip()
+    if pc:                  co.append(pc)
+    if s.get("phone"):      co.append("Tel: "+s["phone"])
+    if s.get("email"):      co.append("E-mail: "+s["email"])
+    if s.get("website"):    co.append("Website: "+s["website"])
+    if s.get("kvk"):        co.append("KVK: "+s["kvk"])
+    if s.get("btw_number"): co.append("BTW: "+s["btw_number"])
+
+    template = INVOICE_TEMPLATE.bind(logo_html=logo_html, co_html="<br>".join(co),
+                                     support=s.get("support_email") or s.get("email",""))
+    with _invoice_template_lock:
+        _invoice_template.update(key=key, template=template)
+    return template
+
+
+def build_invoice_html(inv, settings, logo_b64=None):
+    """
+    Generates invoice HTML that matches the sample exactly:
+    - White page, no coloured bar
+    - Logo top-left | FACTUUR title top-right
+    - Company info left | meta + Klantgegevens right (all right-aligned)
+    - Horizontal rule
+    - Items table with borders
+    - Totals right-aligned (dark grand total row)
+    - Footer pinned to bottom of A4 page
+    """
+    # Customer lines (right-aligned, below meta)
+    cust = []
+    company = inv.get("customer_company","").strip()
+    dept    = inv.get("customer_dept","").strip()
+    cname   = inv.get("customer_name","").strip()
+    addr    = inv.get("customer_address","").strip()
+    postal  = inv.get("customer_postal","").strip()
+    city    = inv.get("customer_city","").strip()
+    country = inv.get("customer_country","NL").strip()
+    if company: cust.append(company + (" t.a.v. "+dept if dept else ""))
+    if cname:   cust.append(cname)
+    if addr:    cust.append(addr)
+    pc2 = (postal+" "+city).strip()
+    if pc2:     cust.append(pc2)
+    if country: cust.append(country)
+
+    # Items
+    btw_pct   = float(inv.get("btw_pct", 21))
+    totaal    = float(inv.get("totaal", 0))
+    subtotaal = round(totaal / (1 + btw_pct / 100), 2)
+    btw_amt   = round(totaal - subtotaal, 2)
+
+    rows, row = [], INVOICE_ITEM_ROW.render
+    for item in inv.get("items", []):
+        p  = float(item.get("prijs", 0))
+        n  = float(item.get("aantal", 0))
+        rows.append(row(productnaam=item.get("productnaam",""), aantal=str(int(n)) if n == int(n) else str(n),
+                        prijs=fmt_euro(p), totaal=fmt_euro(p*n)))
+
+    return invoice_template(settings, logo_b64).render(
+        factuurnummer=inv.get("factuurnummer",""), date=inv.get("date",""), due_date=inv.get("due_date",""),
+        bestelnr=INVOICE_BESTELNR_ROW.render(bestelnummer=inv["bestelnummer"]) if inv.get("bestelnummer") else "",
+        cust_html="<br>".join(cust), items_rows="".join(rows),
+        subtotaal=fmt_euro(subtotaal), btw_pct=f"{btw_pct:.0f}", btw_amount=fmt_euro(btw_amt),
+        totaal=fmt_euro(totaal),
+        notes_html=INVOICE_NOTES.render(notes=inv.get("notes","")) if inv.get("notes","").strip() else "")
+
+
+
+BUCKET_LABELS = {"day": "dag", "week": "week", "month": "maand", "quarter": "kwartaal", "year": "jaar"}
+
+REPORT_CSS = """  * { margin:0; padding:0; box-sizing:border-box; }
+  body { font-family:'Inter',Arial,sans-serif; background:#f5f5f5; padding:20px; }
+  .wrapper { max-width:800px; margin:0 auto; background:white; border-radius:12px; overflow:hidden; box-shadow:0 4px 20px rgba(0,0,0,.08); }
+  .top-bar { height:6px; background:linear-gradient(90deg,#1a1a2e,#0f3460); }
+  .content { padding:32px; }
+  h1 { font-size:22pt; font-weight:800; color:#1a1a2e; margin-bottom:4px; }
+  .sub { font-size:10pt; color:#999; margin-bottom:24px; }
+  .stats { display:grid; grid-template-columns:repeat(4,1fr); gap:14px; margin-bottom:28px; }
+  .stat { background:#f8f9fc; border-radius:10px; padding:16px; }
+  .stat-label { font-size:9pt; font-weight:700; color:#aaa; text-transform:uppercase; letter-spacing:.5px; margin-bottom:6px; }
+  .stat-value { font-size:18pt; font-weight:800; color:#1a1a2e; }
+  h2 { font-size:12pt; font-weight:700; color:#1a1a2e; margin-bottom:12px; }
+  table { width:100%; border-collapse:collapse; }
+  th { padding:9px 12px; text-align:left; font-size:9pt; font-weight:700; color:#888; text-transform:uppercase; letter-spacing:.5px; border-bottom:2px solid #e8e8e8; background:#fafafa; }
+  td { padding:10px 12px; border-bottom:1px solid #f0f0f0; font-size:9.5pt; color:#333; }
+  .footer { margin-top:24px; text-align:center; font-size:8pt; color:#ccc; }
+  .muted { font-size:8pt; color:#aaa; margin-top:2px; }
+  @media print { body { background:white; padding:0; } .wrapper { box-shadow:none; border-radius:0; } @page { size:A4; margin:10mm; } }
+"""
+
+REPORT_TEMPLATE = HtmlTemplate("""<!DOCTYPE html>
 <html lang="nl"><head><meta charset="UTF-8">
 <style>
-  @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700;800&display=swap');
-  * {{ margin:0; padding:0; box-sizing:border-box; }}
-  body {{ font-family:'Inter',Arial,sans-serif; background:#f5f5f5; padding:20px; }}
-  .wrapper {{ max-width:800px; margin:0 auto; background:white; border-radius:12px; overflow:hidden; box-shadow:0 4px 20px rgba(0,0,0,.08); }}
-  .top-bar {{ height:6px; background:linear-gradient(90deg,#1a1a2e,#0f3460); }}
-  .content {{ padding:32px; }}
-  h1 {{ font-size:22pt; font-weight:800; color:#1a1a2e; margin-bottom:4px; }}
-  .sub {{ font-size:10pt; color:#999; margin-bottom:24px; }}
-  .stats {{ display:grid; grid-template-columns:repeat(4,1fr); gap:14px; margin-bottom:28px; }}
-  .stat {{ background:#f8f9fc; border-radius:10px; padding:16px; }}
-  .stat-label {{ font-size:9pt; font-weight:700; color:#aaa; text-transform:uppercase; letter-spacing:.5px; margin-bottom:6px; }}
-  .stat-value {{ font-size:18pt; font-weight:800; color:#1a1a2e; }}
-  h2 {{ font-size:12pt; font-weight:700; color:#1a1a2e; margin-bottom:12px; }}
-  table {{ width:100%; border-collapse:collapse; }}
-  th {{ padding:9px 12px; text-align:left; font-size:9pt; font-weight:700; color:#888; text-transform:uppercase; letter-spacing:.5px; border-bottom:2px solid #e8e8e8; background:#fafafa; }}
-  td {{ padding:10px 12px; border-bottom:1px solid #f0f0f0; font-size:9.5pt; color:#333; }}
-  .footer {{ margin-top:24px; text-align:center; font-size:8pt; color:#ccc; }}
-  @media print {{ body {{ background:white; padding:0; }} .wrapper {{ box-shadow:none; border-radius:0; }} @page {{ size:A4; margin:10mm; }} }}
-</style>
+{css}</style>
 </head><body>
 <div class="wrapper">
   <div class="top-bar"></div>
@@ -739,20 +3878,234 @@ def build_report_html(report_data, filters_label):
     <h1>Omzetrapport</h1>
     <div class="sub">Periode: {filters_label} &nbsp;·&nbsp; Gegenereerd op: {now}</div>
     <div class="stats">
-      <div class="stat"><div class="stat-label">Facturen</div><div class="stat-value">{report_data['count']}</div></div>
-      <div class="stat"><div class="stat-label">Subtotaal</div><div class="stat-value">€ {fmt_euro(report_data['subtotaal'])}</div></div>
-      <div class="stat"><div class="stat-label">BTW</div><div class="stat-value">€ {fmt_euro(report_data['total_btw'])}</div></div>
-      <div class="stat"><div class="stat-label">Omzet</div><div class="stat-value">€ {fmt_euro(report_data['total_revenue'])}</div></div>
+      <div class="stat"><div class="stat-label">Facturen</div><div class="stat-value">{count}</div></div>
+      <div class="stat"><div class="stat-label">Subtotaal</div><div class="stat-value">€ {subtotaal}</div></div>
+      <div class="stat"><div class="stat-label">BTW</div><div class="stat-value">€ {btw}</div></div>
+      <div class="stat"><div class="stat-label">Omzet</div><div class="stat-value">€ {revenue}</div></div>
     </div>
     <h2>Per doel</h2>
     <table>
       <thead><tr><th>Doel</th><th style="text-align:center">Facturen</th><th style="text-align:right">Subtotaal</th><th style="text-align:right">BTW</th><th style="text-align:right">Totaal</th></tr></thead>
-      <tbody>{rows if rows else '<tr><td colspan="5" style="text-align:center;color:#ccc;padding:20px;">Geen gegevens</td></tr>'}</tbody>
+      <tbody>{rows}</tbody>
     </table>
+    {series_html}
     <div class="footer">Invoice Manager · {now}</div>
   </div>
 </div>
-</body></html>"""
+</body></html>""", css=REPORT_CSS)
+
+REPORT_ROW = HtmlTemplate("""<tr>
+          <td>{label}</td>
+          <td style="text-align:center">{count}</td>
+          <td style="text-align:right">€ {subtotaal}</td>
+          <td style="text-align:right">€ {btw}</td>
+          <td style="text-align:right;font-weight:700">€ {revenue}</td>
+        </tr>""")
+
+REPORT_EMPTY_ROW = '<tr><td colspan="5" style="text-align:center;color:#ccc;padding:20px;">Geen gegevens</td></tr>'
+
+REPORT_SERIES = HtmlTemplate("""
+    <h2 style="margin-top:28px">Per {bucket}</h2>
+    <table>
+      <thead><tr><th>Periode</th><th style="text-align:center">Facturen</th><th style="text-align:right">Subtotaal</th><th style="text-align:right">BTW</th><th style="text-align:right">Totaal</th></tr></thead>
+      <tbody>{rows}</tbody>
+    </table>""")
+
+def _report_row(label, d):
+    return REPORT_ROW.render(label=label, count=d['count'], subtotaal=fmt_euro(d['subtotaal']),
+                             btw=fmt_euro(d['btw']), revenue=fmt_euro(d['revenue']))
+
+def build_report_html(report_data, filters_label, series=None):
+    rows = [_report_row(p, d) for p, d in report_data.get("by_purpose", {}).items()]
+    series_html = ""
+    if series and series.get("periods"):
+        srows = []
+        for d in series["periods"]:
+            purposes = ", ".join(f"{p} {v['count']}" for p, v in d["by_purpose"].items())
+            srows.append(_report_row(f'{d["period"] or "Onbekend"}<div class="muted">{purposes}</div>', d))
+        series_html = REPORT_SERIES.render(bucket=BUCKET_LABELS.get(series['bucket'], series['bucket']),
+                                           rows="".join(srows))
+    return REPORT_TEMPLATE.render(
+        filters_label=filters_label, now=datetime.now().strftime("%d-%m-%Y %H:%M"),
+        count=report_data['count'], subtotaal=fmt_euro(report_data['subtotaal']),
+        btw=fmt_euro(report_data['total_btw']), revenue=fmt_euro(report_data['total_revenue']),
+        rows="".join(rows) or REPORT_EMPTY_ROW, series_html=series_html)
+
+# ── HTTP server mode ─────────────────────────────────────────────
+# `python main.py serve` shares one database between several browsers:
+# index.html is served with a small shim that gives it the same
+# window.pywebview.api object it gets in the desktop window, backed by
+# POST /api/<method> with the positional arguments as a JSON array.
+# Files the API writes (PDFs, exports) are downloaded from /files?path=...
+# Only SERVER_METHODS are reachable, none of which take a path on the server,
+# and a token is required as soon as the server listens beyond this computer.
+# Other web pages open in the same browser must not reach a loopback server
+# either: API calls have to be JSON (a cross-site form or "simple" fetch can
+# not send that without a preflight, which is never answered), the Host must
+# be a loopback name (DNS rebinding) and an Origin, if sent, must be our own.
+SERVER_PORT = 8765
+SERVER_POOL_IDLE = 16
+SERVER_METHODS = frozenset({
+    "bootstrap", "get_settings", "save_settings", "new_invoice_number", "reserve_invoice_numbers",
+    "save_invoice", "get_invoices", "list_invoices", "search_invoices", "get_invoice", "delete_invoice",
+    "get_report", "get_report_series", "export_report_html", "get_product_sales", "get_analytics",
+    "upload_logo", "begin_logo_upload", "upload_logo_chunk", "finish_logo_upload", "get_logo_base64",
+    "get_invoice_html", "save_invoice_file", "save_customer_statement", "export_csv", "export_xlsx", "bulk_pdf",
+    "get_archives", "archive_year", "get_backups", "backup_now", "verify_backup", "restore_backup",
+    "start_job", "get_job", "list_jobs", "cancel_job",
+    "get_diagnostics", "set_diagnostics", "reset_diagnostics", "dump_diagnostics", "diagnostics_ping",
+})
+SERVER_JOB_KINDS = frozenset(JOB_KINDS) - {"import_invoices"}   # reads a file on the server
+SERVER_PATH_SETTINGS = {"backup_dir"}   # may only be changed from the desktop app or the CLI
+SERVER_LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+# /files only hands out what the API writes into DATA_DIR itself (or into a
+# bulk_pdf folder there): never the database, its -wal, uploads/ or backups/
+SERVER_FILE_SUFFIXES = {".pdf", ".html", ".csv", ".xlsx", ".zip", ".json"}
+SERVER_SHIM_JS = """
+(function () {
+  const token = new URLSearchParams(location.search).get('token') || '';
+  const headers = {'Content-Type': 'application/json'};
+  if (token) headers['Authorization'] = 'Bearer ' + token;
+  const call = (name, args) => fetch('/api/' + name, {method: 'POST', headers, body: JSON.stringify(args)})
+    .then(r => r.json().then(body => r.ok ? body.result : Promise.reject(new Error(body.error))));
+  const local = {
+    // the file lives on the server: hand it to the browser instead
+    open_file: async path => { window.open('/files?path=' + encodeURIComponent(path) +
+                                           (token ? '&token=' + encodeURIComponent(token) : '')); return {success: true}; },
+  };
+  window.pywebview = {api: new Proxy({}, {get: (_, name) => local[name] || ((...args) => call(name, args))})};
+  document.addEventListener('DOMContentLoaded', () => window.dispatchEvent(new Event('pywebviewready')));
+})();
+"""
+
+def make_server(host="127.0.0.1", port=SERVER_PORT, token=None, api=None):
+    """A ThreadingHTTPServer serving index.html and the API; call serve_forever() on it."""
+    import hmac
+    import ipaddress
+    import mimetypes
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    try:
+        loopback = host == "localhost" or ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback and not token:
+        raise ValueError(f"A token is required to serve on {host}: add --token")
+    api = api or API()
+    page = (BASE_DIR / "src" / "index.html").read_text(encoding="utf-8").replace(
+        "<head>", f"<head>\n<script>{SERVER_SHIM_JS}</script>", 1).encode("utf-8")
+    data_root = DATA_DIR.resolve()
+    host_name = host.strip("[]")
+
+    def _servable(path):
+        if not path.is_file() or path.suffix.lower() not in SERVER_FILE_SUFFIXES:
+            return False
+        return path.parent == data_root or (
+            path.parent.parent == data_root and path.parent.name.startswith("Facturen_"))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"    # keep-alive between API calls
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, body, content_type="application/json"):
+            if not isinstance(body, bytes):
+                body = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _foreign(self):
+            """Why a request looks like it comes from another site, or None."""
+            host = self.headers.get("Host", "")
+            if loopback and urlsplit("//" + host).hostname not in SERVER_LOOPBACK_HOSTS | {host_name}:
+                return f"Unexpected Host: {host}"
+            origin = self.headers.get("Origin")
+            if origin is not None and origin not in (f"http://{host}", f"https://{host}"):
+                return f"Cross-origin request from {origin}"
+            return None
+
+        def _authorized(self, query):
+            if not token:
+                return True
+            given = self.headers.get("Authorization", "").removeprefix("Bearer ") or \
+                query.get("token", [""])[0]
+            return hmac.compare_digest(given, token)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            foreign = self._foreign()
+            if foreign:
+                return self._send(403, {"error": foreign})
+            if url.path in ("/", "/index.html"):
+                return self._send(200, page, "text/html; charset=utf-8")
+            if not self._authorized(query):
+                return self._send(401, {"error": "Unauthorized"})
+            if url.path == "/files":
+                path = Path(query.get("path", [""])[0]).resolve()
+                if not _servable(path):
+                    return self._send(404, {"error": "Not found"})
+                self.send_response(200)
+                self.send_header("Content-Type", mimetypes.guess_type(path.name)[0] or "application/octet-stream")
+                self.send_header("Content-Length", str(path.stat().st_size))
+                self.send_header("Content-Disposition", f'inline; filename="{path.name}"')
+                self.end_headers()
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, self.wfile)
+                return
+            self._send(404, {"error": "Not found"})
+
+        @staticmethod
+        def _refused(name, args):
+            """Why a call that is fine from the desktop app is refused over HTTP, or None."""
+            if name == "start_job" and (args[0] if args else None) not in SERVER_JOB_KINDS:
+                return f"Job not available over HTTP: {args[0] if args else None}"
+            if name == "save_settings" and args and isinstance(args[0], dict):
+                current = _assets.settings()
+                changed = [k for k in SERVER_PATH_SETTINGS & set(args[0])
+                           if str(args[0][k]) != current.get(k, "")]
+                if changed:
+                    return f"Only the desktop app can change: {', '.join(changed)}"
+            return None
+
+        def do_POST(self):
+            url = urlsplit(self.path)
+            # read the body first so an early error leaves the keep-alive stream in sync
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            foreign = self._foreign()
+            if foreign:
+                return self._send(403, {"error": foreign})
+            if self.headers.get_content_type() != "application/json":
+                return self._send(415, {"error": "Content-Type must be application/json"})
+            if not self._authorized(parse_qs(url.query)):
+                return self._send(401, {"error": "Unauthorized"})
+            name = url.path.removeprefix("/api/")
+            if not url.path.startswith("/api/") or name not in SERVER_METHODS:
+                return self._send(404, {"error": f"Unknown method: {name}"})
+            try:
+                args = json.loads(body or b"[]")
+            except ValueError:
+                return self._send(400, {"error": "Body must be a JSON array of arguments"})
+            args = args if isinstance(args, list) else [args]
+            refused = self._refused(name, args)
+            if refused:
+                return self._send(403, {"error": refused})
+            try:
+                result = getattr(api, name)(*args)
+            except Exception as e:
+                return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            self._send(200, {"result": result})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    _pool.max_idle = max(_pool.max_idle, SERVER_POOL_IDLE)
+    return server
 
 
 class App:
@@ -760,14 +4113,233 @@ class App:
         self.api = API()
 
     def run(self):
-        init_db()
+        startup_mark("run")
+        import webview   # GUI toolkit only for the window, never for the CLI
+        startup_mark("webview_imported")
+        start_db_init()   # migrations run while the window loads
         html_file = BASE_DIR / "src" / "index.html"
         window = webview.create_window(
             "Invoice Manager", str(html_file),
             js_api=self.api, width=1260, height=840,
             min_size=(960, 640), background_color="#F2F4F8"
         )
-        webview.start(debug=False)
+        if STARTUP_PROBE:
+            window.events.shown += lambda: startup_mark("shown")
+        _jobs.notify = window.evaluate_js
+        _backup_schedule.start()
+        try:
+            webview.start(debug=False)
+        finally:
+            _backup_schedule.stop()
+            _jobs.notify = None
+            _jobs.shutdown()
+            close_db()
+
+def _cli_filters(args):
+    return {"purpose": args.purpose, "date_from": args.date_from, "date_to": args.date_to}
+
+def _cli_progress(label):
+    def progress(done, total=None):
+        print(f"\r{label}: {done}" + (f"/{total}" if total else ""), end="", file=sys.stderr, flush=True)
+    return progress
+
+def _cli_report(api, args):
+    filters = _cli_filters(args)
+    if args.json:
+        report = api.get_report(filters)
+        if args.bucket:
+            report["series"] = api.get_report_series(filters, args.bucket)
+        return report
+    html = build_report_html(api.get_report(filters), args.label or "Alle perioden",
+                             api.get_report_series(filters, args.bucket) if args.bucket else None)
+    path = Path(args.out or DATA_DIR / f"Omzetrapport_{datetime.now():%Y%m%d_%H%M%S}.html")
+    path.write_text(html, encoding="utf-8")
+    return {"success": True, "path": str(path)}
+
+def _cli_export(api, args):
+    return export_invoices(_cli_filters(args), args.format, args.items, args.out, _cli_progress("rows"))
+
+def _cli_pdf(api, args):
+    return render_pdf_batch(args.ids or None, _cli_filters(args), args.output, args.workers,
+                            _cli_progress("invoices"))
+
+def _cli_import(api, args):
+    return import_invoices(args.file, "skip" if args.skip_invalid else "abort", args.batch,
+                           _cli_progress("records"))
+
+def _cli_statement(api, args):
+    return api.save_customer_statement(args.customer, _cli_filters(args))
+
+def _cli_analytics(api, args):
+    return api.get_analytics(args.by, _cli_filters(args), args.metric, args.top)
+
+def _cli_logo(api, args):
+    return api.upload_logo_file(args.file)
+
+def _cli_archive(api, args):
+    if not args.years:
+        return api.get_archives()
+    results = [api.archive_year(year, compact=False) for year in args.years]
+    if not args.no_vacuum and any(r.get("success") for r in results):
+        compact_db()
+    return {"success": all(r.get("success") for r in results), "years": results,
+            "db_bytes": DB_PATH.stat().st_size}
+
+def _cli_serve(api, args):
+    try:
+        server = make_server(args.host, args.port, args.token, api)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+    url = f"http://{'localhost' if args.host in ('127.0.0.1', '0.0.0.0') else args.host}:{server.server_port}/"
+    print(f"Serving on {url}{'?token=' + args.token if args.token else ''} (Ctrl+C to stop)", file=sys.stderr)
+    _backup_schedule.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _backup_schedule.stop()
+        server.server_close()
+        _jobs.shutdown()
+    return {"success": True}
+
+def _cli_backup(api, args):
+    def snapshot(name):
+        return Path(name) if Path(name).is_file() else backup_file(name)
+    try:
+        if args.action == "create":
+            return backup_db(args.compression, progress=_cli_progress("backup %"))
+        if args.action == "list":
+            return api.get_backups()
+        if args.action == "prune":
+            conf = backup_settings()
+            return {"success": True, "removed": prune_backups(conf["keep"], conf["keep_months"], conf["dir"])}
+        if args.action == "verify":
+            results = []
+            for name in [args.file] if args.file else [b["file"] for b in list_backups()]:
+                try:
+                    results.append(verify_backup(snapshot(name)))
+                except (RuntimeError, sqlite3.Error) as e:
+                    results.append({"success": False, "file": name, "error": str(e)})
+            return {"success": all(r["success"] for r in results), "verified": results}
+        if not args.file:
+            return {"success": False, "error": "Name the snapshot to restore (see: backup list)"}
+        return restore_backup(snapshot(args.file), _cli_progress("restore %"))
+    except (ValueError, RuntimeError, OSError, sqlite3.Error) as e:
+        return {"success": False, "error": str(e)}
+
+def _cli_db(api, args):
+    with db_transaction(write=args.action != "check") as conn:
+        if args.action == "check":
+            return {"success": True, "schema_version": schema_version(conn),
+                    "integrity": [r[0] for r in conn.execute("PRAGMA quick_check")],
+                    "rollup_mismatches": check_rollups(conn),
+                    "query_plans": check_query_plans(conn)}
+        if args.action == "rebuild":
+            rebuild_search_index(conn)
+            rebuild_rollups(conn)
+    if args.action == "optimize":
+        with get_db() as conn:
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+    elif args.action == "vacuum":
+        compact_db()
+    with get_db() as conn:
+        return {"success": True, "action": args.action, "schema_version": schema_version(conn)}
+
+def cli(argv=None):
+    """Headless entry point: `python main.py <command>`; see --help."""
+    global DB_PATH
+    import argparse
+    ap = argparse.ArgumentParser(prog="invoice-manager",
+                                 description="Invoice Manager without the window, e.g. for cron jobs.")
+    ap.add_argument("--db", help=f"database file (default: {DB_PATH})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    def filtered(p):
+        p.add_argument("--purpose", default="all")
+        p.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD")
+        p.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD")
+        return p
+
+    p = filtered(sub.add_parser("report", help="revenue report as HTML (or JSON)"))
+    p.add_argument("--bucket", choices=REPORT_BUCKETS, help="add a per-period table")
+    p.add_argument("--label", help="period label shown in the report")
+    p.add_argument("--json", action="store_true", help="print the figures instead of writing HTML")
+    p.add_argument("--out", help="output file (default: DATA_DIR)")
+    p.set_defaults(fn=_cli_report)
+
+    p = filtered(sub.add_parser("export", help="export invoices to CSV or XLSX"))
+    p.add_argument("format", choices=("csv", "xlsx"))
+    p.add_argument("--items", action="store_true", help="one row per line item")
+    p.add_argument("--out", help="output file (default: DATA_DIR)")
+    p.set_defaults(fn=_cli_export)
+
+    p = filtered(sub.add_parser("pdf", help="render invoices to PDF (ids, or else the filters)"))
+    p.add_argument("ids", nargs="*")
+    p.add_argument("--output", choices=("zip", "folder"), default="zip")
+    p.add_argument("--workers", type=int)
+    p.set_defaults(fn=_cli_pdf)
+
+    p = sub.add_parser("import", help="bulk import invoices from CSV, JSON or JSON Lines")
+    p.add_argument("file")
+    p.add_argument("--skip-invalid", action="store_true",
+                   help="leave out invalid records instead of rolling back")
+    p.add_argument("--batch", type=int, default=IMPORT_BATCH)
+    p.set_defaults(fn=_cli_import)
+
+    p = filtered(sub.add_parser("statement", help="one PDF with all invoices of a customer"))
+    p.add_argument("customer", help="company name, or customer name if there is no company")
+    p.set_defaults(fn=_cli_statement)
+
+    p = filtered(sub.add_parser("analytics", help="totals per customer, city, BTW rate, month, ..."))
+    p.add_argument("--by", choices=ANALYTICS_DIMENSIONS, help="group by (default: totals only)")
+    p.add_argument("--metric", choices=ANALYTICS_METRICS, default="revenue", help="sort and top-N by")
+    p.add_argument("--top", type=int)
+    p.set_defaults(fn=_cli_analytics)
+
+    p = sub.add_parser("logo", help="use an image file as the invoice logo")
+    p.add_argument("file")
+    p.set_defaults(fn=_cli_logo)
+
+    p = sub.add_parser("serve", help="serve the app and API over HTTP to browsers on this network")
+    p.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept other computers")
+    p.add_argument("--port", type=int, default=SERVER_PORT)
+    p.add_argument("--token", help="require ?token=... (browser) or a Bearer header")
+    p.set_defaults(fn=_cli_serve)
+
+    p = sub.add_parser("archive", help="move closed years into their own files (no years: list archives)")
+    p.add_argument("years", nargs="*", type=int)
+    p.add_argument("--no-vacuum", action="store_true", help="leave compacting the main database for later")
+    p.set_defaults(fn=_cli_archive)
+
+    p = sub.add_parser("backup", help="online backups of the database (no action: take one now)")
+    p.add_argument("action", nargs="?", default="create", choices=("create", "list", "verify", "restore", "prune"))
+    p.add_argument("file", nargs="?", help="snapshot to verify (default: all) or restore; a name or a path")
+    p.add_argument("--compression", choices=tuple(BACKUP_CODECS), help="default: the backup_compression setting")
+    p.set_defaults(fn=_cli_backup)
+
+    p = sub.add_parser("db", help="database maintenance")
+    p.add_argument("action", choices=("migrate", "check", "optimize", "rebuild", "vacuum"))
+    p.set_defaults(fn=_cli_db)
+
+    args = ap.parse_args(argv)
+    if args.db:
+        DB_PATH = Path(args.db)
+    init_db()
+    try:
+        res = args.fn(API(), args)
+    finally:
+        close_db()
+        if args.cmd in ("export", "pdf", "import", "backup"):
+            print(file=sys.stderr)   # end the progress line
+    print(json.dumps(res, indent=2, default=str))
+    return 0 if res.get("success", True) else 1
 
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        import multiprocessing
+        multiprocessing.freeze_support()   # bulk PDF workers in the frozen build
+    if len(sys.argv) > 1:
+        sys.exit(cli())
     App().run()
@@ -0,0 +1,50 @@
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import main  # noqa: E402
+
+PURPOSES = ["BOL", "Best4Juniors", "Other"]
+PRODUCTS = ["Houten puzzel", "Kleurboek", "Knuffel konijn", "Speelkleed", "Bouwblokken set"]
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """An API on a fresh, migrated database in tmp_path."""
+    main.close_db()
+    monkeypatch.setattr(main, "DB_PATH", tmp_path / "invoices.db")
+    monkeypatch.setattr(main, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(main, "UPLOADS_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(main, "_render_cache", main.RenderCache(tmp_path / "cache"))
+    main.UPLOADS_DIR.mkdir()
+    main._assets.invalidate()
+    main._analytics.invalidate()
+    main.init_db()
+    yield main.API()
+    main.close_db()
+    main._assets.invalidate()
+    main._analytics.invalidate()
+
+
+def make_invoice(rng, n, start=datetime(2024, 1, 1), days=365):
+    """A random invoice in the save_invoice() shape, numbered by the server."""
+    when = start + timedelta(days=rng.randrange(days), minutes=rng.randrange(24 * 60))
+    return {
+        "id": f"test-{n:06d}",
+        "date": when.strftime("%Y-%m-%d %H:%M") if rng.random() < 0.5 else when.strftime("%Y-%m-%d"),
+        "purpose": rng.choice(PURPOSES),
+        "customer_company": rng.choice(["", "Stichting Klaver6", "Speelgoed BV"]),
+        "customer_name": f"Klant {rng.randrange(50)}", "customer_city": rng.choice(["Weert", "Breda"]),
+        "items": [{"productnaam": rng.choice(PRODUCTS), "aantal": rng.randint(1, 5),
+                   "prijs": round(rng.uniform(0.5, 120), 2)} for _ in range(rng.randint(1, 4))],
+        "btw_pct": rng.choice([21, 21, 9, 0]), "notes": f"bestelling {n}",
+    }
+
+
+@pytest.fixture
+def rng():
+    return random.Random(1234)
@@ -0,0 +1,56 @@
+import threading
+
+import pytest
+
+import main
+
+from conftest import make_invoice
+
+np = pytest.importorskip("numpy")
+
+
+def test_group_by_matches_sql_while_refreshes_add_codes(api, rng):
+    for n in range(200):
+        api.save_invoice(make_invoice(rng, n))
+    stop, errors = threading.Event(), []
+
+    def writer():
+        n = 1000
+        while not stop.is_set():
+            inv = make_invoice(rng, n)
+            inv["customer_company"], n = f"Nieuw {n}", n + 1
+            api.save_invoice(inv)
+            try:
+                main._analytics.refresh()
+            except Exception as e:   # pragma: no cover - reported below
+                errors.append(e)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(200):
+            main._analytics.query("customer", metric="count")
+    finally:
+        stop.set()
+        thread.join()
+    assert not errors
+
+    result = api.get_analytics("customer", metric="count")
+    with main.get_db() as conn:
+        expected = dict(conn.execute(f"SELECT {main.CUSTOMER_KEY_SQL}, COUNT(*) FROM invoices GROUP BY 1"))
+    assert {g["key"]: g["count"] for g in result["groups"]} == expected
+
+
+@pytest.mark.parametrize("filters", [
+    {"date_from": "2024-03"}, {"date_to": "2024-03"}, {"date_from": "2024-03", "date_to": "2024-06"},
+    {"date_from": "2024"}, {"date_to": "2025"}, {"date_from": "2024-02-29", "date_to": "2024-03-07"},
+    {"purpose": "BOL", "date_from": "2024-10"},
+])
+def test_partial_date_filters_match_get_invoices(api, rng, filters):
+    for n in range(300):
+        api.save_invoice(make_invoice(rng, n))
+    result = api.get_analytics("month", filters=filters)
+    assert result["success"], result
+    invoices = api.get_invoices(filters)
+    assert result["total"]["count"] == len(invoices)
+    assert result["total"]["revenue"] == api.get_report(filters)["total_revenue"]
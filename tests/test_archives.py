@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import pytest
+
+import main
+
+from conftest import make_invoice
+
+
+@pytest.fixture
+def archived(api, rng):
+    """200 invoices over 2020-2025 with 2020 and 2021 archived; returns them by id."""
+    invoices = {}
+    for n in range(200):
+        inv = make_invoice(rng, n, start=datetime(2020, 1, 1), days=6 * 365)
+        assert api.save_invoice(inv)["success"]
+        invoices[inv["id"]] = inv
+    for year in (2020, 2021):
+        assert main.archive_year(year, compact=False)["success"]
+    return invoices
+
+
+def test_archived_invoice_cannot_be_deleted(api, archived):
+    old = next(i for i in archived.values() if i["date"] < "2021")
+    result = api.delete_invoice(old["id"])
+    assert not result["success"] and "2020 is archived" in result["error"]
+    assert api.get_invoice(old["id"])["archived"]
+
+    recent = next(i for i in archived.values() if i["date"] >= "2022")
+    assert api.delete_invoice(recent["id"])["success"]
+    assert api.get_invoice(recent["id"]) is None
+
+
+def csv_numbers(path):
+    import csv
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row[0] for row in list(csv.reader(f))[1:]]
+
+
+@pytest.mark.parametrize("filters", [None, {"date_from": "2020-01-01", "date_to": "2020-12-31"},
+                                     {"date_from": "2021-06"}, {"purpose": "BOL", "date_to": "2022"}])
+def test_export_reads_archived_years(api, archived, filters):
+    expected = {i["factuurnummer"] for i in api.get_invoices(filters)}
+    assert expected
+    result = main.export_invoices(filters)
+    assert sorted(csv_numbers(result["path"])) == sorted(expected)
+    assert result["rows"] == main.count_export_rows(filters) == len(expected)
+    items = main.export_invoices(filters, include_items=True)
+    assert items["rows"] == main.count_export_rows(filters, include_items=True)
+    assert set(csv_numbers(items["path"])) == expected
+
+
+def test_product_sales_read_archived_years(api, archived):
+    sales = api.get_product_sales()
+    assert sum(p["invoices"] for p in sales) == sum(len({i["productnaam"] for i in inv["items"]})
+                                                    for inv in archived.values())
+    expected = sum(it["aantal"] * it["prijs"] for inv in archived.values() for it in inv["items"])
+    assert sum(p["revenue"] for p in sales) == pytest.approx(expected, abs=0.05)
+
+
+def test_statement_includes_archived_invoices(api, archived):
+    pytest.importorskip("reportlab")
+    customer = "Stichting Klaver6"
+    expected = [i for i in api.get_invoices() if i["customer_company"] == customer]
+    assert any(i["date"] < "2022" for i in expected)
+    result = main.render_customer_statement(customer)
+    assert result["success"] and result["invoices"] == len(expected)
+
+
+def test_main_database_only_reads_warn_about_archived_years(api, archived):
+    result = api.search_invoices("bestelling", {"date_from": "2021-01-01"})
+    assert result["archived_years"] == [2021]
+    assert "2021" in result["warning"]
+    assert "warning" not in api.search_invoices("bestelling", {"date_from": "2022-01-01"})
+
+
+def test_analytics_warn_about_archived_years(api, archived):
+    pytest.importorskip("numpy")
+    result = api.get_analytics(filters={"date_to": "2020-12-31"})
+    assert result["success"] and result["archived_years"] == [2020]
+    assert "archived_years" not in api.get_analytics(filters={"date_from": "2023-01-01"})
+
+
+def test_bulk_pdf_renders_archived_invoices(api, archived):
+    pytest.importorskip("reportlab")
+    old = [i["id"] for i in archived.values() if i["date"] < "2022"][:5]
+    recent = [i["id"] for i in archived.values() if i["date"] >= "2022"][:5]
+    result = main.render_pdf_batch(old + recent + ["missing"], workers=1)
+    assert result["rendered"] == 10 and result["failed"] == 1
+    assert [r["id"] for r in result["results"] if not r["success"]] == ["missing"]
+    by_filter = main.render_pdf_batch(filters={"date_to": "2020-12-31"}, workers=1)
+    assert by_filter["total"] == by_filter["rendered"] == len(api.get_invoices({"date_to": "2020-12-31"}))
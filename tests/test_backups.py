@@ -0,0 +1,60 @@
+import main
+
+from conftest import make_invoice
+
+
+def db_state():
+    """Everything a restore has to bring back: invoices, items, rollups and the search index."""
+    with main.get_db() as conn:
+        return {table: [tuple(r) for r in conn.execute(f"SELECT * FROM {table} ORDER BY {order}")]
+                for table, order in (("invoices", "id"), ("invoice_items", "invoice_id, position"),
+                                     ("invoice_daily_totals", "day, purpose"),
+                                     ("invoices_fts", "rowid"))}
+
+
+def search_ids(api, text):
+    return sorted(r["id"] for r in api.search_invoices(text)["rows"])
+
+
+def test_restore_brings_back_the_snapshot(api, rng):
+    for n in range(40):
+        assert api.save_invoice(make_invoice(rng, n))["success"]
+    expected = db_state()
+    found = search_ids(api, "Klaver6")
+    snapshot = main.backup_db()
+    assert snapshot["invoices"] == 40
+
+    for n in range(40, 50):
+        api.save_invoice(make_invoice(rng, n))
+    for n in range(0, 10):
+        api.delete_invoice(f"test-{n:06d}")
+    changed = api.get_invoice("test-000020")
+    changed["items"] = [{"productnaam": "Klaver6 special", "aantal": 2, "prijs": 9.99}]
+    api.save_invoice(changed)
+    assert db_state() != expected
+
+    result = main.restore_backup(snapshot["path"])
+    assert result["success"] and result["invoices"] == 40
+    assert result["undo"] != snapshot["file"]
+    assert db_state() == expected
+    assert search_ids(api, "Klaver6") == found
+    with main.get_db() as conn:
+        assert main.check_rollups(conn) == []
+    assert main.verify_backup(main.backup_file(result["undo"]))["invoices"] == 40
+
+
+def test_damaged_snapshot_is_refused(api, rng):
+    for n in range(5):
+        api.save_invoice(make_invoice(rng, n))
+    path = main.backup_file(main.backup_db()["file"])
+    damaged = path.with_name(path.name.replace(".db.gz", "1.db.gz"))
+    damaged.write_bytes(path.read_bytes()[:-20])
+    assert not api.verify_backup(damaged.name)["success"]
+    assert not api.restore_backup(damaged.name)["success"]
+    assert api.list_invoices()["total"] == 5
+
+
+def test_backups_in_the_same_second_get_their_own_file(api):
+    names = [main.backup_db(prune=False)["file"] for _ in range(3)]
+    assert len(set(names)) == 3
+    assert [b["file"] for b in main.list_backups()] == names[::-1]
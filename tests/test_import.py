@@ -0,0 +1,32 @@
+import main
+
+
+def record(**fields):
+    return dict({"purpose": "BOL", "customer_name": "Klant", "items": [{"productnaam": "Kleurboek",
+                 "aantal": 1, "prijs": 5}]}, **fields)
+
+
+def numbers(api):
+    with main.get_db() as conn:
+        return sorted(r[0] for r in conn.execute("SELECT factuurnummer FROM invoices"))
+
+
+def test_explicit_numbers_in_later_batches_are_not_taken_by_auto_numbers(api):
+    prefix = main.invoice_prefix("BOL")
+    records = [record(), record(), record(factuurnummer=main.format_factuurnummer(prefix, 1)),
+               record(factuurnummer=main.format_factuurnummer(prefix, 2)), record()]
+    res = main.import_records(enumerate(records, 1), batch=2)
+    assert res["success"] and res["imported"] == 5 and res["skipped"] == 0
+    assert numbers(api) == [main.format_factuurnummer(prefix, n) for n in range(1, 6)]
+    assert api.save_invoice(record())["factuurnummer"] == main.format_factuurnummer(prefix, 6)
+    assert sorted(r["factuurnummer"] for r in api.search_invoices("klant")["rows"]) == numbers(api)
+
+
+def test_existing_ids_are_skipped_not_fatal(api):
+    api.save_invoice(record(id="inv-1", factuurnummer="X-1"))
+    records = [record(id="inv-1"), record(id="inv-2"), record(id="inv-2", factuurnummer="X-9"), record()]
+    res = main.import_records(enumerate(records, 1), batch=2)
+    assert res["success"] and res["imported"] == 2 and res["skipped"] == 2
+    assert api.get_invoice("inv-1")["factuurnummer"] == "X-1"
+    again = main.import_records(enumerate(records[:3], 1))
+    assert again["success"] and again["imported"] == 0 and again["skipped"] == 3
@@ -0,0 +1,59 @@
+import main
+
+from conftest import make_invoice
+
+
+def test_reserved_blocks_are_consecutive_and_never_reused(api):
+    first = api.reserve_invoice_numbers("BOL", 3)["numbers"]
+    second = api.reserve_invoice_numbers("BOL", 2)["numbers"]
+    assert first == ["BOL-NL000001", "BOL-NL000002", "BOL-NL000003"]
+    assert second == ["BOL-NL000004", "BOL-NL000005"]
+    assert api.reserve_invoice_numbers("Other")["numbers"] == ["OTH-NL000001"]
+    assert api.new_invoice_number("BOL")["factuurnummer"] == "BOL-NL000006"
+
+
+def test_rolled_back_reservation_is_handed_out_again(api):
+    try:
+        with main.db_transaction() as conn:
+            assert main.reserve_invoice_numbers(conn, "BOL") == ["BOL-NL000001"]
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    assert api.new_invoice_number("BOL")["factuurnummer"] == "BOL-NL000001"
+
+
+def test_auto_number_takes_the_next_number_and_keeps_it_on_edit(api, rng):
+    inv = make_invoice(rng, 1)
+    inv.update(purpose="BOL", factuurnummer="BOL-NL000001", auto_number=True)
+    saved = api.save_invoice(inv)
+    assert saved["factuurnummer"] == "BOL-NL000001"
+    assert api.save_invoice(inv)["factuurnummer"] == "BOL-NL000001"
+    other = make_invoice(rng, 2)
+    other.update(purpose="BOL", factuurnummer="BOL-NL000001", auto_number=True)
+    assert api.save_invoice(other)["factuurnummer"] == "BOL-NL000002"
+
+
+def test_explicit_number_moves_the_sequence_past_it(api, rng):
+    typed = make_invoice(rng, 1)
+    typed.update(purpose="BOL", factuurnummer="BOL-NL000002")
+    assert api.save_invoice(typed)["success"]
+    assert api.new_invoice_number("BOL")["factuurnummer"] == "BOL-NL000003"
+    numbers = set()
+    for n in range(2, 5):
+        inv = make_invoice(rng, n)
+        inv["purpose"] = "BOL"
+        saved = api.save_invoice(inv)
+        assert saved["success"]
+        numbers.add(saved["factuurnummer"])
+    assert numbers == {"BOL-NL000003", "BOL-NL000004", "BOL-NL000005"}
+
+
+def test_explicit_number_in_use_is_refused(api, rng):
+    first = make_invoice(rng, 1)
+    first["factuurnummer"] = "HAND-001"
+    assert api.save_invoice(first)["success"]
+    second = make_invoice(rng, 2)
+    second["factuurnummer"] = "HAND-001"
+    result = api.save_invoice(second)
+    assert not result["success"] and "already used" in result["error"]
+    assert api.get_invoice(second["id"]) is None
@@ -0,0 +1,13 @@
+import main
+
+
+def test_in_process_renders_keep_their_own_settings(monkeypatch):
+    def fake_pdf(inv, settings, logo, out):
+        out.write(f"{settings['company_name']}|{logo}".encode())
+    monkeypatch.setattr(main, "generate_pdf_reportlab", fake_pdf)
+    invoices = [{"id": str(n)} for n in range(3)]
+    first = main.iter_pdf_renders(invoices, {"company_name": "A"}, "logo-a", workers=1)
+    second = main.iter_pdf_renders(invoices, {"company_name": "B"}, "logo-b", workers=1)
+    # two jobs on the JobRunner threads, interleaved
+    rendered = [(next(first)[1], next(second)[1]) for _ in invoices]
+    assert rendered == [(b"A|logo-a", b"B|logo-b")] * 3
@@ -0,0 +1,84 @@
+import base64
+import io
+
+import pytest
+
+import main
+
+from conftest import make_invoice
+
+
+@pytest.fixture
+def invoice(api, rng):
+    inv = make_invoice(rng, 1)
+    inv["notes"] = "eerste versie"
+    assert api.save_invoice(inv)["success"]
+    return inv
+
+
+def render(api, inv_id):
+    result = api.get_invoice_html(inv_id)
+    assert result["success"]
+    return result["html"], result.get("cached", False)
+
+
+def test_unchanged_invoice_comes_from_the_cache(api, invoice):
+    html, cached = render(api, invoice["id"])
+    assert not cached
+    assert render(api, invoice["id"]) == (html, True)
+
+
+def test_edit_renders_again(api, invoice):
+    render(api, invoice["id"])
+    invoice["customer_name"] = "Nieuwe Klant"
+    api.save_invoice(invoice)
+    html, cached = render(api, invoice["id"])
+    assert not cached and "Nieuwe Klant" in html
+
+
+def test_settings_change_renders_again(api, invoice):
+    render(api, invoice["id"])
+    api.save_settings({"company_name": "Andere Naam BV"})
+    html, cached = render(api, invoice["id"])
+    assert not cached and "Andere Naam BV" in html
+    # the key alone tells them apart, even before the cache is cleared
+    inv, settings = api.get_invoice(invoice["id"]), api.get_settings()
+    assert main.RenderCache.key(inv, settings, None) != \
+        main.RenderCache.key(inv, dict(settings, company_name="Nog een naam"), None)
+
+
+def test_logo_change_renders_again(api, invoice):
+    image = pytest.importorskip("PIL.Image")
+
+    def upload(color):
+        buf = io.BytesIO()
+        image.new("RGB", (40, 20), color).save(buf, "PNG")
+        result = api.upload_logo("data:image/png;base64," + base64.b64encode(buf.getvalue()).decode())
+        assert result["success"], result
+
+    upload("red")
+    first, _ = render(api, invoice["id"])
+    upload("blue")
+    second, cached = render(api, invoice["id"])
+    assert not cached and second != first
+    inv = api.get_invoice(invoice["id"])
+    assert main.RenderCache.key(inv, {}, "logo-a") != main.RenderCache.key(inv, {}, "logo-b")
+
+
+def test_renderer_change_renders_again(api, invoice, monkeypatch):
+    render(api, invoice["id"])
+    monkeypatch.setattr(main, "INVOICE_NOTES", main.HtmlTemplate('<p class="notes">{notes}</p>'))
+    monkeypatch.setitem(main._render_code, "digest", None)
+    html, cached = render(api, invoice["id"])
+    assert not cached and '<p class="notes">eerste versie</p>' in html
+
+
+def test_saved_pdf_is_rendered_again_after_an_edit(api, invoice):
+    pytest.importorskip("reportlab")
+    first = api.save_invoice_file(invoice["id"])
+    assert first["success"] and not first.get("cached")
+    assert api.save_invoice_file(invoice["id"]).get("cached")
+    invoice["items"][0]["prijs"] += 1
+    api.save_invoice(invoice)
+    again = api.save_invoice_file(invoice["id"])
+    assert again["success"] and not again.get("cached")
@@ -0,0 +1,54 @@
+import pytest
+
+import main
+
+from conftest import PURPOSES, make_invoice
+
+FILTERS = [
+    None,
+    {"purpose": "BOL"},
+    {"date_from": "2024-03-01", "date_to": "2024-06-30"},
+    {"date_from": "2024-05-17", "date_to": "2024-05-17"},
+    {"date_from": "2024-02-10", "purpose": "Other"},
+    {"date_to": "2024-09-30", "purpose": "Best4Juniors"},
+    {"date_from": "2024-03", "date_to": "2024-07"},                 # partial dates
+    {"date_from": "2024-04-01 12:00", "date_to": "2024-08-15 09:30"},
+    {"date_from": "2024-11", "purpose": "BOL"},
+    {"date_from": "2025-01-01"},
+]
+
+
+def baseline_report(filters):
+    """The report as it was computed before the rollups: a SUM over the filtered invoices."""
+    where, params = main.invoice_filter_sql(filters)
+    with main.get_db() as conn:
+        rows = conn.execute(f"""SELECT purpose, COUNT(*), SUM(totaal), SUM(btw_amount), SUM(subtotaal)
+                                FROM invoices WHERE 1=1{where} GROUP BY purpose""", params).fetchall()
+    by_purpose = {}
+    for purpose, n, revenue, btw, subtotaal in rows:
+        p = by_purpose.setdefault(purpose or "Other", {"count": 0, "revenue": 0, "btw": 0, "subtotaal": 0})
+        p["count"] += n; p["revenue"] += revenue; p["btw"] += btw; p["subtotaal"] += subtotaal
+    return {"count": sum(p["count"] for p in by_purpose.values()),
+            "total_revenue": round(sum(p["revenue"] for p in by_purpose.values()), 2),
+            "total_btw": round(sum(p["btw"] for p in by_purpose.values()), 2),
+            "subtotaal": round(sum(p["subtotaal"] for p in by_purpose.values()), 2),
+            "by_purpose": {k: {m: pytest.approx(v, abs=0.005) for m, v in p.items()}
+                           for k, p in sorted(by_purpose.items())}}
+
+
+def test_rollup_report_matches_summation(api, rng):
+    for n in range(300):
+        assert api.save_invoice(make_invoice(rng, n))["success"]
+    for n in rng.sample(range(300), 60):     # edits: new items, purpose and date
+        changed = make_invoice(rng, n)
+        changed["factuurnummer"] = api.get_invoice(changed["id"])["factuurnummer"]
+        assert api.save_invoice(changed)["success"]
+    for n in rng.sample(range(300), 40):
+        api.delete_invoice(f"test-{n:06d}")
+    api.save_invoice(dict(make_invoice(rng, 999), purpose=""))
+
+    with main.get_db() as conn:
+        assert main.check_rollups(conn) == []
+    for filters in FILTERS:
+        assert api.get_report(filters) == baseline_report(filters), filters
+    assert set(PURPOSES) <= set(api.get_report()["by_purpose"])
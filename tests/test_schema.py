@@ -0,0 +1,13 @@
+import sqlite3
+
+import main
+
+
+def test_fresh_database_uses_the_list_and_report_indexes(tmp_path):
+    conn = sqlite3.connect(tmp_path / "fresh.db", isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        assert main.migrate(conn) == len(main.MIGRATIONS)
+        assert main.check_query_plans(conn) == {}
+    finally:
+        conn.close()
@@ -0,0 +1,22 @@
+import main
+
+
+def test_search_marks_matches_without_html(api):
+    api.save_invoice({"customer_name": "<img src=x onerror=alert(1)> Piet", "purpose": "BOL",
+                      "items": [{"productnaam": "<b>Kleurboek</b>", "aantal": 1, "prijs": 2}]})
+    start, end = main.SEARCH_MARK
+    row = api.search_invoices("Piet")["rows"][0]
+    assert row["customer"] == f"<img src=x onerror=alert(1)> {start}Piet{end}"
+    row = api.search_invoices("kleurboek")["rows"][0]
+    assert f"{start}Kleurboek{end}" in row["snippet"]
+    assert "<mark>" not in row["snippet"]
+
+
+def test_search_total_counts_beyond_the_limit(api):
+    for n in range(12):
+        api.save_invoice({"customer_name": f"Jansen {n}", "purpose": "BOL" if n % 3 else "Other",
+                          "items": [{"productnaam": "Kleurboek", "aantal": 1, "prijs": 2}]})
+    res = api.search_invoices("jansen", limit=5)
+    assert len(res["rows"]) == 5 and res["total"] == 12
+    assert api.search_invoices("jansen", {"purpose": "Other"}, limit=2)["total"] == 4
+    assert api.search_invoices("jansen", limit=50)["total"] == 12
@@ -0,0 +1,86 @@
+import http.client
+import json
+import threading
+from urllib.parse import quote
+
+import pytest
+
+import main
+
+from conftest import make_invoice
+
+
+@pytest.fixture
+def server(api):
+    server = main.make_server("127.0.0.1", 0, api=api)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def call(server, name, args, **headers):
+    headers.setdefault("Content-Type", "application/json")
+    return request(server, "POST", f"/api/{name}", json.dumps(args), headers)
+
+
+@pytest.fixture
+def invoice_id(api, rng):
+    inv = make_invoice(rng, 1)
+    assert api.save_invoice(inv)["success"]
+    return inv["id"]
+
+
+def test_json_call_from_own_page_is_served(server, invoice_id):
+    port = server.server_port
+    status, body = call(server, "get_invoice", [invoice_id], Origin=f"http://127.0.0.1:{port}")
+    assert status == 200
+    assert json.loads(body)["result"]["id"] == invoice_id
+
+
+def test_simple_cross_site_post_is_refused(server, api, invoice_id):
+    status, _ = call(server, "delete_invoice", [invoice_id], **{"Content-Type": "text/plain"})
+    assert status == 415
+    status, _ = call(server, "delete_invoice", [invoice_id], Origin="https://evil.example")
+    assert status == 403
+    assert api.get_invoice(invoice_id)
+
+
+def test_rebound_host_is_refused(server, api, invoice_id):
+    status, _ = call(server, "delete_invoice", [invoice_id], Host="evil.example:8765")
+    assert status == 403
+    status, _ = request(server, "GET", "/", headers={"Host": "evil.example"})
+    assert status == 403
+    assert api.get_invoice(invoice_id)
+
+
+def test_files_serves_only_outputs(server, api, invoice_id):
+    export = api.export_csv()
+    status, body = request(server, "GET", "/files?path=" + quote(export["path"]))
+    assert status == 200 and body
+
+    data = main.DATA_DIR
+    (main.UPLOADS_DIR / "logo_original.png").write_bytes(b"logo")
+    assert main.backup_db()["success"]
+    refused = [main.DB_PATH, data / "invoices.db-wal", *(data / "backups").iterdir(),
+               main.UPLOADS_DIR / "logo_original.png"]
+    for path in refused:
+        status, body = request(server, "GET", "/files?path=" + quote(str(path)))
+        assert status == 404, path
+        assert not body.startswith(b"SQLite format 3")
+
+
+def test_off_loopback_needs_a_token(api):
+    with pytest.raises(ValueError):
+        main.make_server("0.0.0.0", 0, api=api)